@@ -0,0 +1,392 @@
+"""
+Simula um cluster de N peers (peer.py) num único processo e mede a eleição,
+os heartbeats e a sincronização do registro quando o tracker cai.
+
+Cada peer tem seu próprio daemon Pyro e roda o código real: ElectionManager,
+become_tracker, loop_heartbeat e monitorar_tracker. As chamadas entre peers
+passam por uma rede simulada que injeta atraso, jitter e perda de mensagens,
+e "derrubar" um peer o torna inalcançável e o faz parar de enviar mensagens.
+Por padrão o serviço de nomes é substituído por um dicionário em memória;
+com --ns usa o serviço de nomes real (e apaga os nomes Peer_* e Tracker_* dele).
+
+Métricas por rodada: tempo até um novo tracker, incidentes de split-brain
+(mais de um tracker vivo ao mesmo tempo), custo dos heartbeats em regime,
+fração dos peers vivos já presentes no registro quando o novo tracker assume
+e tempo até o registro do novo tracker refletir os arquivos dos peers vivos.
+--standbys 0 desliga a réplica do registro (hot standby) para comparação.
+--lentos N deixa N peers lentos para responder get_registro_completo (como um os.listdir
+demorado), para medir a reconstrução do registro com hosts lentos.
+
+Uso: python benchmarks/bench_cluster.py [--peers 5] [--rodadas 2] [--perda 0.01] [--json]
+"""
+import argparse
+import collections
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Pyro5.api
+import Pyro5.errors
+import peer as P
+
+# Sem timeout no proxy, uma mensagem perdida travaria o chamador para sempre;
+# na simulação ele desiste depois deste prazo.
+PRAZO_SEM_TIMEOUT = 5.0
+
+
+class Rede:
+    # Estado compartilhado da rede simulada: atraso, perda, peers caídos e contadores.
+    def __init__(self, atraso, jitter, perda):
+        self.atraso = atraso
+        self.jitter = jitter
+        self.perda = perda
+        self.caidos = set()
+        self.lentos = set()
+        self.atraso_lento = 0.0
+        self.chamadas = collections.Counter()
+        self.perdidas = 0
+        self.lock = threading.Lock()
+
+    def entregar(self, origem, destino, metodo, timeout):
+        with self.lock:
+            self.chamadas[metodo] += 1
+            caido = origem in self.caidos or destino in self.caidos
+            perdida = not caido and random.random() < self.perda
+            if perdida:
+                self.perdidas += 1
+        if caido:
+            raise Pyro5.errors.CommunicationError("peer inalcançável (simulado)")
+        if perdida:
+            time.sleep(timeout or PRAZO_SEM_TIMEOUT)
+            raise Pyro5.errors.TimeoutError("mensagem perdida (simulado)")
+        time.sleep(self.atraso + random.uniform(0, self.jitter))
+        if metodo == "get_registro_completo" and destino in self.lentos:
+            # Host lento: o chamador espera até o próprio timeout.
+            prazo = timeout or PRAZO_SEM_TIMEOUT
+            time.sleep(min(self.atraso_lento, prazo))
+            if self.atraso_lento > prazo:
+                raise Pyro5.errors.TimeoutError("peer lento (simulado)")
+
+
+class ProxySimulado:
+    def __init__(self, rede, origem, destino, proxy, timeout):
+        self._rede = rede
+        self._origem = origem
+        self._destino = destino
+        self._proxy = proxy
+        self._timeout = timeout
+
+    def __getattr__(self, metodo):
+        remoto = getattr(self._proxy, metodo)
+
+        def chamar(*args, **kwargs):
+            self._rede.entregar(self._origem, self._destino, metodo, self._timeout)
+            return remoto(*args, **kwargs)
+        return chamar
+
+
+class ConexoesSimuladas:
+    # Substitui o PoolProxies de um peer: mesma interface, mas cada chamada passa pela Rede.
+    def __init__(self, rede, pool):
+        self.rede = rede
+        self.pool = pool
+        self.origem = None
+
+    @contextlib.contextmanager
+    def proxy(self, uri, timeout=None, serializador=None):
+        with self.pool.proxy(uri, timeout, serializador) as remoto:
+            yield ProxySimulado(self.rede, self.origem, str(uri), remoto, timeout)
+
+    def fechar(self):
+        pass
+
+
+class ServicoNomesMemoria:
+    # Substituto em memória do CacheServicoNomes, compartilhado por todos os peers.
+    def __init__(self):
+        self.registros = {}
+        self.lock = threading.Lock()
+
+    def listar(self, prefixo, atualizar=False):
+        with self.lock:
+            return {nome: uri for nome, uri in self.registros.items() if nome.startswith(prefixo)}
+
+    def lookup(self, nome):
+        with self.lock:
+            if nome not in self.registros:
+                raise Pyro5.errors.NamingError(f"unknown name: {nome}")
+            return self.registros[nome]
+
+    def registrar(self, nome, uri):
+        with self.lock:
+            self.registros[nome] = str(uri)
+
+    def remover(self, nome):
+        with self.lock:
+            self.registros.pop(nome, None)
+
+    def invalidar(self, nome=None):
+        pass
+
+
+def limpar_servico_nomes():
+    with Pyro5.api.locate_ns() as ns:
+        for nome in list(ns.list()):
+            if nome.startswith(("Peer_", "Tracker_")):
+                ns.remove(nome)
+
+
+class Cluster:
+    def __init__(self, args, rede, nomes):
+        self.rede = rede
+        self.pool = P.PoolProxies()
+        self.peers = []
+        self.uris = {}
+        self.vivos = set()
+        for peer_id in range(1, args.peers + 1):
+            shared = f"peer_{peer_id}_shared"
+            os.makedirs(shared, exist_ok=True)
+            for k in range(args.arquivos):
+                with open(os.path.join(shared, f"arquivo_{peer_id}_{k}.txt"), "w") as f:
+                    f.write(f"peer {peer_id} arquivo {k}\n")
+            peer = P.Peer(peer_id)
+            peer.heartbeat_timeout = random.uniform(*args.timeout)
+            peer.detector = P.DetectorFalhas(peer.heartbeat_timeout)
+            peer.nomes = nomes
+            peer.proxies = ConexoesSimuladas(rede, self.pool)
+            peer.daemon = Pyro5.api.Daemon()
+            peer.registrar_no_servico_nomes()
+            uri = str(peer.daemon.uriFor(peer))
+            peer.proxies.origem = uri
+            threading.Thread(target=peer.daemon.requestLoop, daemon=True).start()
+            self.uris[peer_id] = uri
+            self.vivos.add(peer_id)
+            self.peers.append(peer)
+
+    def trackers_vivos(self):
+        return [p for p in self.peers if p.peer_id in self.vivos and p.is_tracker]
+
+    def derrubar(self, peer):
+        # Crash: o peer fica inalcançável, para de enviar heartbeats e de monitorar.
+        self.vivos.discard(peer.peer_id)
+        self.rede.caidos.add(self.uris[peer.peer_id])
+        peer.stop_threads = True
+        peer.is_tracker = False
+        peer.detector.parar()
+
+    def tracker_atual(self):
+        trackers = self.trackers_vivos()
+        return max(trackers, key=lambda p: p.epoca) if trackers else None
+
+    def cobertura_registro(self, tracker=None):
+        # Fração dos peers vivos cujo registro no tracker já confere com os arquivos deles.
+        tracker = tracker or self.tracker_atual()
+        if tracker is None:
+            return 0.0
+        registro = tracker.obter_todos_arquivos()
+        vivos = [p for p in self.peers if p.peer_id in self.vivos]
+        return sum(registro.get(p.peer_id) == sorted(p.files) for p in vivos) / len(vivos)
+
+    def registro_convergiu(self, tracker=None):
+        return self.cobertura_registro(tracker) == 1.0
+
+    def encerrar(self):
+        for peer in self.peers:
+            peer.stop_threads = True
+            peer.is_tracker = False
+            peer.detector.parar()
+        for peer in self.peers:
+            peer.daemon.shutdown()
+        self.pool.fechar()
+
+
+class MonitorSplitBrain:
+    # Amostra o cluster em intervalos curtos e conta períodos com mais de um tracker vivo.
+    def __init__(self, cluster, intervalo=0.005):
+        self.cluster = cluster
+        self.intervalo = intervalo
+        self.incidentes = 0
+        self.duracao = 0.0
+        self.parar = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        inicio = None
+        while not self.parar.is_set():
+            agora = time.perf_counter()
+            if len(self.cluster.trackers_vivos()) > 1:
+                if inicio is None:
+                    inicio = agora
+                    self.incidentes += 1
+            elif inicio is not None:
+                self.duracao += agora - inicio
+                inicio = None
+            time.sleep(self.intervalo)
+        if inicio is not None:
+            self.duracao += time.perf_counter() - inicio
+
+    def encerrar(self):
+        self.parar.set()
+        self.thread.join()
+
+
+def esperar(condicao, prazo, intervalo=0.005):
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < prazo:
+        if condicao():
+            return time.perf_counter() - inicio
+        time.sleep(intervalo)
+    return None
+
+
+def arredondar(valor, casas=3):
+    return None if valor is None else round(valor, casas)
+
+
+def medir_regime(cluster, janela):
+    # Custo dos heartbeats com o cluster estável: chamadas por segundo e CPU do processo.
+    chamadas = cluster.rede.chamadas["receber_heartbeat"]
+    cpu = time.process_time()
+    inicio = time.perf_counter()
+    time.sleep(janela)
+    duracao = time.perf_counter() - inicio
+    return {
+        "heartbeats_por_s": round((cluster.rede.chamadas["receber_heartbeat"] - chamadas) / duracao, 1),
+        "cpu_processo_por_s": round((time.process_time() - cpu) / duracao, 4),
+        "threads": threading.active_count(),
+    }
+
+
+def executar(args):
+    rede = Rede(args.atraso_ms / 1000, args.jitter_ms / 1000, args.perda)
+    if args.ns:
+        limpar_servico_nomes()
+        nomes = P.CacheServicoNomes(P.PoolProxies())
+    else:
+        nomes = ServicoNomesMemoria()
+    P.INTERVALO_HEARTBEAT = args.intervalo
+    P.REPLICAS_STANDBY = args.standbys
+    cluster = Cluster(args, rede, nomes)
+    rede.atraso_lento = args.atraso_lento_ms / 1000
+    rede.lentos = {cluster.uris[p.peer_id] for p in random.sample(cluster.peers, min(args.lentos, args.peers))}
+    split_brain = MonitorSplitBrain(cluster)
+    resultado = {
+        "config": {
+            "peers": args.peers,
+            "atraso_ms": args.atraso_ms,
+            "jitter_ms": args.jitter_ms,
+            "perda": args.perda,
+            "intervalo_heartbeat_s": args.intervalo,
+            "timeout_s": list(args.timeout),
+            "standbys": args.standbys,
+            "lentos": args.lentos,
+            "atraso_lento_ms": args.atraso_lento_ms,
+            "servico_nomes": "pyro" if args.ns else "memoria",
+        },
+        "rodadas": [],
+    }
+    try:
+        for peer in cluster.peers:
+            threading.Thread(target=peer.inicializar, daemon=True).start()
+        primeira = esperar(cluster.tracker_atual, args.prazo)
+        resultado["primeira_eleicao_s"] = arredondar(primeira)
+
+        # Com os nomes dos peers caídos ainda registrados, o quórum exige a maioria de todos.
+        maximo = (args.peers - 1) // 2
+        for _ in range(min(args.rodadas, maximo)):
+            esperar(cluster.registro_convergiu, args.prazo)
+            regime = medir_regime(cluster, args.janela)
+            tracker = cluster.tracker_atual()
+            if tracker is None:
+                break
+
+            epoca = tracker.epoca
+            split_antes = (split_brain.incidentes, split_brain.duracao)
+            inicio = time.perf_counter()
+            cluster.derrubar(tracker)
+            novo = esperar(lambda: any(p.epoca > epoca for p in cluster.trackers_vivos()), args.prazo)
+            cobertura = cluster.cobertura_registro() if novo is not None else None
+            convergencia = None
+            if novo is not None and esperar(cluster.registro_convergiu, args.prazo) is not None:
+                convergencia = time.perf_counter() - inicio
+            time.sleep(args.intervalo * 2)
+            resultado["rodadas"].append({
+                "tracker_derrubado": tracker.peer_id,
+                "tempo_novo_tracker_s": arredondar(novo),
+                "cobertura_ao_assumir": arredondar(cobertura),
+                "convergencia_registro_s": arredondar(convergencia),
+                "incidentes_split_brain": split_brain.incidentes - split_antes[0],
+                "tempo_split_brain_s": arredondar(split_brain.duracao - split_antes[1]),
+                "regime": regime,
+            })
+        if args.rodadas > maximo:
+            resultado["aviso"] = f"com {args.peers} peers só {maximo} falhas mantêm o quórum"
+    finally:
+        split_brain.encerrar()
+        cluster.encerrar()
+        if args.ns:
+            limpar_servico_nomes()
+    resultado["split_brain_total"] = {"incidentes": split_brain.incidentes, "tempo_s": arredondar(split_brain.duracao)}
+    resultado["chamadas"] = dict(rede.chamadas)
+    resultado["mensagens_perdidas"] = rede.perdidas
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peers", type=int, default=5)
+    parser.add_argument("--rodadas", type=int, default=2, help="quedas sucessivas do tracker")
+    parser.add_argument("--arquivos", type=int, default=3, help="arquivos compartilhados por peer")
+    parser.add_argument("--atraso-ms", type=float, default=1.0)
+    parser.add_argument("--jitter-ms", type=float, default=1.0)
+    parser.add_argument("--perda", type=float, default=0.0, help="probabilidade de perder cada chamada")
+    parser.add_argument("--intervalo", type=float, default=P.INTERVALO_HEARTBEAT, help="intervalo entre heartbeats (s)")
+    parser.add_argument("--timeout", type=float, nargs=2, default=(3.0, 5.0), metavar=("MIN", "MAX"),
+                        help="faixa do timeout mínimo de heartbeat de cada peer (s)")
+    parser.add_argument("--standbys", type=int, default=P.REPLICAS_STANDBY,
+                        help="peers em espera com réplica do registro (0 = sem réplica)")
+    parser.add_argument("--lentos", type=int, default=0, help="peers lentos para responder o registro")
+    parser.add_argument("--atraso-lento-ms", type=float, default=1500.0)
+    parser.add_argument("--janela", type=float, default=3.0, help="janela de medição em regime (s)")
+    parser.add_argument("--prazo", type=float, default=30.0, help="prazo máximo de cada espera (s)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ns", action="store_true", help="usa o serviço de nomes Pyro real")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    diretorio = tempfile.mkdtemp(prefix="bench_cluster_")
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    try:
+        resultado = executar(args)
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return
+    print(f"{args.peers} peers, primeira eleição em {resultado['primeira_eleicao_s']} s")
+    print(f"{'rodada':>6} {'novo tracker (s)':>17} {'cobertura':>10} {'registro (s)':>13} {'split-brain':>12} "
+          f"{'heartbeats/s':>13} {'cpu/s':>7}")
+    for i, r in enumerate(resultado["rodadas"], 1):
+        print(f"{i:>6} {str(r['tempo_novo_tracker_s']):>17} {str(r['cobertura_ao_assumir']):>10} "
+              f"{str(r['convergencia_registro_s']):>13} "
+              f"{r['incidentes_split_brain']:>12} {r['regime']['heartbeats_por_s']:>13} {r['regime']['cpu_processo_por_s']:>7}")
+    if "aviso" in resultado:
+        print(resultado["aviso"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Mede a compressão adaptativa das transferências (peer.py) num enlace de banda limitada.
+
+Uma fonte e um downloader rodam no mesmo processo; todo o tráfego entre eles (chamadas
+Pyro e canal de dados) passa por um retransmissor TCP local que limita a banda no
+sentido fonte -> downloader (--mbits) e conta os bytes que atravessam o fio.
+
+Tipos de arquivo gerados (--tamanho cada):
+  txt   linhas de log em texto
+  csv   tabela numérica
+  pdf   metade texto, metade binário aleatório (como um PDF com imagens)
+  jpg   binário aleatório com extensão de imagem (descartado pela extensão)
+  bin   binário aleatório com extensão desconhecida (descartado pela amostra)
+
+Modos: "sem" (COMPRESSOES_ACEITAS vazio, como antes) e "zlib" (negociada).
+Transportes: "canal" (CanalDados) e "pyro" (enviar_arquivo com SERIALIZADOR_DADOS).
+--mbits 0 desliga o limite e mostra o custo de CPU num enlace rápido.
+
+Uso: python benchmarks/bench_compressao.py [--mbits 100] [--tamanho 16M] [--tipos txt jpg] [--json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Pyro5.api
+import peer as P
+from bench_transferencia import Ambiente, legivel, tamanho
+
+TIPOS = ("txt", "csv", "pdf", "jpg", "bin")
+MODOS = ("sem", "zlib")
+TRANSPORTES = ("canal", "pyro")
+
+
+class Enlace:
+    # Retransmissor TCP com banda limitada (balde de fichas) no sentido destino -> cliente.
+    def __init__(self, bytes_por_s, rajada=64 * 1024):
+        self.taxa = bytes_por_s
+        self.rajada = rajada
+        self.livre = time.monotonic()
+        self.descendo = 0
+        self.subindo = 0
+        self.lock = threading.Lock()
+        self.servidores = []
+
+    def ponte(self, destino):
+        # Abre uma porta local que encaminha para 'destino'; retorna a porta.
+        servidor = socket.create_server(("127.0.0.1", 0))
+        self.servidores.append(servidor)
+        threading.Thread(target=self._aceitar, args=(servidor, destino), daemon=True).start()
+        return servidor.getsockname()[1]
+
+    def _aceitar(self, servidor, destino):
+        while True:
+            try:
+                cliente, _ = servidor.accept()
+            except OSError:
+                return
+            remoto = socket.create_connection(destino)
+            for s in (cliente, remoto):
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._copiar, args=(cliente, remoto, False), daemon=True).start()
+            threading.Thread(target=self._copiar, args=(remoto, cliente, True), daemon=True).start()
+
+    def _copiar(self, origem, destino, limitado):
+        with contextlib.suppress(OSError):
+            while True:
+                dados = origem.recv(self.rajada)
+                if not dados:
+                    break
+                if limitado:
+                    self._esperar(len(dados))
+                destino.sendall(dados)
+        for s in (origem, destino):
+            with contextlib.suppress(OSError):
+                s.shutdown(socket.SHUT_RDWR)
+
+    def _esperar(self, n):
+        with self.lock:
+            self.descendo += n
+            if not self.taxa:
+                return
+            agora = time.monotonic()
+            self.livre = max(self.livre, agora - self.rajada / self.taxa) + n / self.taxa
+            espera = self.livre - agora
+        if espera > 0:
+            time.sleep(espera)
+
+    def zerar(self):
+        with self.lock:
+            self.descendo = 0
+
+    def fechar(self):
+        for servidor in self.servidores:
+            servidor.close()
+
+
+def gerar_texto(rng, tamanho_total):
+    palavras = ["peer", "tracker", "bloco", "arquivo", "recebido", "enviado", "época", "voto", "heartbeat",
+                "registro", "falha", "sucesso", "conexão", "timeout", "download", "upload"]
+    partes, total = [], 0
+    while total < tamanho_total:
+        linha = (f"2026-10-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+                 f"{rng.randint(0, 59):02d} INFO Peer {rng.randint(1, 50)}: "
+                 f"{' '.join(rng.choices(palavras, k=rng.randint(4, 10)))} ({rng.random() * 100:.2f} ms)\n")
+        partes.append(linha)
+        total += len(linha)
+    return "".join(partes).encode()[:tamanho_total]
+
+
+def gerar_csv(rng, tamanho_total):
+    partes, total = ["id,peer,offset,tamanho,latencia_ms,ok\n"], 0
+    while total < tamanho_total:
+        linha = (f"{rng.randint(0, 10 ** 6)},{rng.randint(1, 50)},{rng.randrange(0, 1 << 30, 4096)},"
+                 f"{rng.choice((1024, 4096, 65536, 1048576))},{rng.gauss(5, 2):.3f},{rng.random() < 0.99}\n")
+        partes.append(linha)
+        total += len(linha)
+    return "".join(partes).encode()[:tamanho_total]
+
+
+def gerar_pdf(rng, tamanho_total):
+    # Trechos de texto intercalados com trechos aleatórios de 64 KiB, como objetos de imagem.
+    texto = gerar_texto(rng, tamanho_total // 2)
+    partes = []
+    for posicao in range(0, len(texto), 64 * 1024):
+        partes.append(texto[posicao:posicao + 64 * 1024])
+        partes.append(os.urandom(64 * 1024))
+    return b"".join(partes)[:tamanho_total]
+
+
+def gerar_arquivos(diretorio, tamanho_total):
+    rng = random.Random(21)
+    geradores = {"txt": lambda: gerar_texto(rng, tamanho_total), "csv": lambda: gerar_csv(rng, tamanho_total),
+                 "pdf": lambda: gerar_pdf(rng, tamanho_total), "jpg": lambda: os.urandom(tamanho_total),
+                 "bin": lambda: os.urandom(tamanho_total)}
+    arquivos = {}
+    for tipo, gerar in geradores.items():
+        caminho = os.path.join(diretorio, f"amostra.{tipo}")
+        with open(caminho, "wb") as f:
+            f.write(gerar())
+        arquivos[os.path.basename(caminho)] = caminho
+    return arquivos
+
+
+def executar(args):
+    gerados = os.path.abspath("dados")
+    os.makedirs(gerados)
+    arquivos = gerar_arquivos(gerados, args.tamanho)
+    ambiente = Ambiente(arquivos, 1)
+    fonte = ambiente.fontes[0]
+    enlace = Enlace(args.mbits * 1e6 / 8)
+
+    # Pyro e canal de dados da fonte passam a ser alcançados pelo enlace.
+    uri = Pyro5.api.URI(ambiente.nomes.lookup(f"Peer_{fonte.peer_id}"))
+    uri.port = enlace.ponte((uri.host, uri.port))
+    ambiente.nomes.registrar(f"Peer_{fonte.peer_id}", uri)
+    canal = P.canal_dados(fonte.daemon)
+    porta_canal = enlace.ponte((canal.host, canal.porta))
+    receber_canal = P.receber_canal
+
+    def receber_pelo_enlace(ticket, tamanho_bloco):
+        return receber_canal({**ticket, "host": "127.0.0.1", "porta": porta_canal}, tamanho_bloco)
+    P.receber_canal = receber_pelo_enlace
+
+    resultados = []
+    aceitas = P.COMPRESSOES_ACEITAS
+    try:
+        for transporte in args.transportes:
+            P.CANAL_DADOS_ATIVO = transporte == "canal"
+            for tipo in args.tipos:
+                nome = f"amostra.{tipo}"
+                for modo in args.modos:
+                    P.COMPRESSOES_ACEITAS = aceitas if modo == "zlib" else ()
+                    downloader = ambiente.novo_downloader()
+                    enlace.zerar()
+                    cpu = time.process_time()
+                    inicio = time.perf_counter()
+                    ok = downloader.baixar_arquivo(nome, fonte.peer_id)
+                    duracao = time.perf_counter() - inicio
+                    cpu = time.process_time() - cpu
+                    ambiente.descartar(downloader)
+                    resultados.append({
+                        "transporte": transporte, "tipo": tipo, "modo": modo, "ok": bool(ok),
+                        "tamanho": args.tamanho, "bytes_no_fio": enlace.descendo,
+                        "razao_fio": round(enlace.descendo / args.tamanho, 3),
+                        "segundos": round(duracao, 3), "mb_por_s": round(args.tamanho / duracao / 1e6, 2),
+                        "cpu_s": round(cpu, 3),
+                    })
+    finally:
+        P.receber_canal = receber_canal
+        P.COMPRESSOES_ACEITAS = aceitas
+        enlace.fechar()
+        P.fechar_canal_dados(fonte.daemon)
+        ambiente.encerrar()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mbits", type=float, default=100.0, help="banda do enlace em Mbit/s (0 = sem limite)")
+    parser.add_argument("--tamanho", type=tamanho, default=tamanho("16M"))
+    parser.add_argument("--tipos", nargs="+", choices=TIPOS, default=list(TIPOS))
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--transportes", nargs="+", choices=TRANSPORTES, default=list(TRANSPORTES))
+    parser.add_argument("--dir", default=None, help="diretório base para os arquivos temporários")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+    P.SERIALIZADOR_DADOS = "marshal"
+
+    diretorio = tempfile.mkdtemp(prefix="bench_compressao_", dir=args.dir)
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultados = executar(args)
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"enlace de {args.mbits:g} Mbit/s" if args.mbits else "enlace sem limite de banda",
+          f"arquivos de {legivel(args.tamanho)}")
+    print(f"{'transporte':<10} {'tipo':<5} {'modo':<5} {'no fio':>9} {'razão':>6} {'segundos':>9} "
+          f"{'MB/s':>8} {'CPU (s)':>8} {'ok':>3}")
+    for r in resultados:
+        print(f"{r['transporte']:<10} {r['tipo']:<5} {r['modo']:<5} {legivel(r['bytes_no_fio']):>9} "
+              f"{r['razao_fio']:>6} {r['segundos']:>9} {r['mb_por_s']:>8} {r['cpu_s']:>8} "
+              f"{'sim' if r['ok'] else 'não':>3}")
+
+
+if __name__ == "__main__":
+    main()
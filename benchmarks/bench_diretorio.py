@@ -0,0 +1,147 @@
+"""
+Mede o acompanhamento do diretório compartilhado (peer.py) com muitos arquivos.
+
+Um peer com --arquivos arquivos pequenos no diretório compartilhado. Compara:
+  leitura     custo de get_lista_arquivos como antes (os.listdir + consulta ao cache de
+              hashes de cada arquivo a cada chamada, como em teste-final.py) e agora
+              (leitura do índice mantido pelo observador)
+  propagacao  tempo entre um arquivo novo ser fechado no diretório e aparecer em files
+              (com o delta no histórico), com inotify e com a varredura periódica
+              (os.scandir a cada --intervalo s); e o custo de uma varredura completa,
+              que o modo sem inotify paga a cada intervalo mesmo sem alterações
+
+Uso: python benchmarks/bench_diretorio.py [--arquivos 20000] [--amostras 20] [--intervalo 2] [--json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import peer as P
+from bench_proxies import percentil
+
+MODOS = ("inotify", "varredura")
+
+
+def criar_arquivos(diretorio, quantidade):
+    os.makedirs(diretorio, exist_ok=True)
+    for i in range(quantidade):
+        with open(os.path.join(diretorio, f"arquivo_{i:06d}.txt"), "w") as f:
+            f.write(f"conteúdo {i}\n")
+
+
+def listar_como_antes(peer):
+    # O get_lista_arquivos antigo de teste-final.py: relista e consulta o cache a cada chamada.
+    antigos = set(peer.files)
+    files = [f for f in os.listdir(peer.shared_dir) if not P.arquivo_temporario(f)]
+    novos = set(files)
+    peer.historico.registrar(novos - antigos, antigos - novos)
+    digests = {}
+    for filename in files:
+        with contextlib.suppress(OSError):
+            digests[filename] = peer.hash_cache.digest(os.path.join(peer.shared_dir, filename))
+    peer.hash_cache.podar(os.path.join(peer.shared_dir, f) for f in digests)
+    peer.hash_cache.salvar()
+    return files
+
+
+def cronometrar(funcao, vezes):
+    tempos = []
+    for _ in range(vezes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+
+def cenario_leitura(peer, args):
+    antes = cronometrar(lambda: listar_como_antes(peer), args.amostras)
+    depois = cronometrar(peer.get_lista_arquivos, args.amostras)
+    return {
+        "get_lista_antes_p50_ms": round(percentil(antes, 0.50) * 1e3, 2),
+        "get_lista_depois_p50_us": round(percentil(depois, 0.50) * 1e6, 2),
+    }
+
+
+def cenario_propagacao(peer, modo, args):
+    P.OBSERVADOR_INOTIFY_ATIVO = modo == "inotify"
+    peer.diretorio.intervalo = args.intervalo
+    peer.stop_threads = False
+    threading.Thread(target=P.observar_diretorio, args=(peer,), daemon=True).start()
+    # Espera a varredura que fecha a janela entre a carga inicial e o início do watch.
+    time.sleep(max(1.0, args.intervalo * 1.5) if modo == "varredura" else 0.5)
+
+    atrasos = []
+    for i in range(args.amostras):
+        nome = f"novo_{modo}_{i:04d}.txt"
+        with open(os.path.join(peer.shared_dir, nome), "w") as f:
+            f.write(f"arquivo novo {i}\n")
+        inicio = time.perf_counter()
+        while nome not in peer.files and time.perf_counter() - inicio < args.intervalo * 3:
+            time.sleep(0.001)
+        atrasos.append(time.perf_counter() - inicio)
+        # Espaça as amostras para não cair sempre no mesmo ponto da varredura.
+        time.sleep(0.05 + (i % 7) * args.intervalo / 7)
+    P.observador_arquivos.cancelar(peer.diretorio)
+    peer.stop_threads = True
+    time.sleep(0.05)
+
+    varreduras = cronometrar(peer.diretorio.varrer, 5)
+    return {
+        "propagacao_p50_ms": round(percentil(atrasos, 0.50) * 1e3, 1),
+        "propagacao_max_ms": round(max(atrasos) * 1e3, 1),
+        "varredura_completa_ms": round(percentil(varreduras, 0.50) * 1e3, 2),
+        "varreduras_por_minuto": 0 if modo == "inotify" else round(60 / args.intervalo, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arquivos", type=int, default=20000)
+    parser.add_argument("--amostras", type=int, default=20)
+    parser.add_argument("--intervalo", type=float, default=P.INTERVALO_VARREDURA, help="intervalo da varredura (s)")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--dir", default=None, help="diretório base para os arquivos temporários")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix="bench_diretorio_", dir=args.dir)
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    resultados = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            criar_arquivos("peer_1_shared", args.arquivos)
+            inicio = time.perf_counter()
+            peer = P.Peer(1)
+            carga = time.perf_counter() - inicio
+            resultados.append({"cenario": "leitura", "arquivos": len(peer.files),
+                               "carga_inicial_s": round(carga, 3), **cenario_leitura(peer, args)})
+            for modo in args.modos:
+                resultados.append({"cenario": "propagacao", "modo": modo, **cenario_propagacao(peer, modo, args)})
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    for r in resultados:
+        if r["cenario"] == "leitura":
+            print(f"{r['arquivos']} arquivos, carga inicial (hash de todos) {r['carga_inicial_s']} s")
+            print(f"  get_lista_arquivos: antes {r['get_lista_antes_p50_ms']} ms | agora {r['get_lista_depois_p50_us']} us")
+        else:
+            print(f"{r['modo']:<10} arquivo novo visível em p50 {r['propagacao_p50_ms']} ms / máx {r['propagacao_max_ms']} ms"
+                  f" | varredura completa {r['varredura_completa_ms']} ms x {r['varreduras_por_minuto']}/min")
+
+
+if __name__ == "__main__":
+    main()
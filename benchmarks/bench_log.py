@@ -0,0 +1,206 @@
+"""
+Mede o jitter dos heartbeats quando os peers escrevem muito no terminal.
+
+Um tracker e N peers (peer.py) rodam no mesmo processo. Cada peer reproduz o
+volume de mensagens da versão antiga: uma linha por heartbeat recebido e uma
+linha 20 vezes por segundo no monitoramento do tracker. O terminal é simulado
+por uma saída que serializa as escritas e demora --atraso-escrita-us por escrita.
+
+Modos comparados:
+  print           print() síncrono, como antes
+  log_sem_limite  log assíncrono (fila + thread de escrita), sem limite de taxa
+  log             log assíncrono com limite de taxa por mensagem (configurar_log padrão)
+
+Jitter = |intervalo entre dois heartbeats recebidos - INTERVALO_HEARTBEAT|.
+Atraso de entrega = chegada do heartbeat - início da rodada de envio do tracker.
+
+Uso: python benchmarks/bench_log.py [--peers 20] [--duracao 5] [--json]
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Pyro5.api
+import peer as P
+from bench_cluster import ServicoNomesMemoria
+from bench_proxies import percentil
+
+MODOS = ("print", "log_sem_limite", "log")
+
+
+class TerminalLento:
+    # Saída que aceita uma escrita por vez e demora um tempo fixo em cada uma, como um terminal.
+    def __init__(self, caminho, atraso):
+        self.arquivo = open(caminho, "w")
+        self.atraso = atraso
+        self.linhas = 0
+        self.lock = threading.Lock()
+
+    def write(self, texto):
+        with self.lock:
+            time.sleep(self.atraso)
+            self.linhas += texto.count("\n")
+            return self.arquivo.write(texto)
+
+    def flush(self):
+        with self.lock:
+            self.arquivo.flush()
+
+    def close(self):
+        self.arquivo.close()
+
+
+@Pyro5.api.expose
+class PeerMedido(P.Peer):
+    # Registra a chegada de cada heartbeat e escreve uma linha por heartbeat, como a versão antiga.
+    def __init__(self, peer_id, escrever):
+        super().__init__(peer_id)
+        self.escrever = escrever
+        self.chegadas = []
+        self.latencias = []
+
+    def receber_heartbeat(self, epoca, tracker_uri=None):
+        inicio = time.perf_counter()
+        self.chegadas.append(inicio)
+        self.escrever("Peer %s: Heartbeat recebido do tracker (Época %s)", self.peer_id, epoca)
+        resultado = super().receber_heartbeat(epoca, tracker_uri)
+        self.latencias.append(time.perf_counter() - inicio)
+        return resultado
+
+
+def tagarelar(peer, escrever, parar):
+    # O monitoramento antigo: uma linha a cada 50 ms com o tempo desde o último heartbeat.
+    while not parar.is_set():
+        ultimo = peer.chegadas[-1] if peer.chegadas else time.perf_counter()
+        escrever("Peer %s: Tempo desde último heartbeat: %.3fs", peer.peer_id, time.perf_counter() - ultimo)
+        time.sleep(0.05)
+
+
+def executar_modo(modo, args, saida):
+    # Marca o início de cada rodada de heartbeats do tracker.
+    rodadas = []
+    difundir = P.difundir_heartbeat
+
+    def difundir_marcando(*a, **k):
+        rodadas.append(time.perf_counter())
+        return difundir(*a, **k)
+    P.difundir_heartbeat = difundir_marcando
+
+    if modo == "print":
+        def escrever(modelo, *valores):
+            print(modelo % valores, file=saida, flush=True)
+        ouvinte = None
+    else:
+        taxa = float("inf") if modo == "log_sem_limite" else P.TAXA_LOG_POR_MENSAGEM
+        ouvinte = P.configurar_log(logging.INFO, saida=saida, taxa=taxa)
+        escrever = P.log.info
+
+    nomes = ServicoNomesMemoria()
+    pool = P.PoolProxies()
+    peers = []
+    for peer_id in range(1, args.peers + 2):
+        peer = PeerMedido(peer_id, escrever)
+        peer.nomes = nomes
+        peer.proxies = pool
+        peer.daemon = Pyro5.api.Daemon()
+        peer.registrar_no_servico_nomes()
+        threading.Thread(target=peer.daemon.requestLoop, daemon=True).start()
+        peers.append(peer)
+    tracker, receptores = peers[0], peers[1:]
+
+    parar = threading.Event()
+    tagarelas = [threading.Thread(target=tagarelar, args=(p, escrever, parar), daemon=True) for p in receptores]
+    for t in tagarelas:
+        t.start()
+    tracker.is_tracker = True
+    threading.Thread(target=tracker.loop_heartbeat, daemon=True).start()
+    time.sleep(args.duracao)
+    tracker.is_tracker = False
+    parar.set()
+    for t in tagarelas:
+        t.join()
+
+    desvios = []
+    for p in receptores:
+        # Descarta o primeiro intervalo (inclui a abertura das conexões).
+        for a, b in list(zip(p.chegadas, p.chegadas[1:]))[1:]:
+            desvios.append(abs((b - a) - args.intervalo))
+    latencias = [x for p in receptores for x in p.latencias]
+    atrasos = [c - rodadas[bisect.bisect_right(rodadas, c) - 1]
+               for p in receptores for c in p.chegadas if c >= rodadas[0]]
+    P.difundir_heartbeat = difundir
+    for peer in peers:
+        peer.stop_threads = True
+        peer.daemon.shutdown()
+    pool.fechar()
+    if ouvinte is not None:
+        ouvinte.stop()
+        for handler in list(P.log.handlers):
+            P.log.removeHandler(handler)
+        P.log.addHandler(logging.NullHandler())
+    return {
+        "modo": modo,
+        "heartbeats": len(latencias),
+        "jitter_p50_ms": round(percentil(desvios, 0.50) * 1000, 3) if desvios else None,
+        "jitter_p99_ms": round(percentil(desvios, 0.99) * 1000, 3) if desvios else None,
+        "jitter_max_ms": round(max(desvios) * 1000, 3) if desvios else None,
+        "atraso_p50_ms": round(percentil(atrasos, 0.50) * 1000, 3) if atrasos else None,
+        "atraso_p99_ms": round(percentil(atrasos, 0.99) * 1000, 3) if atrasos else None,
+        "receber_heartbeat_p99_ms": round(percentil(latencias, 0.99) * 1000, 3) if latencias else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peers", type=int, default=20)
+    parser.add_argument("--duracao", type=float, default=5.0)
+    parser.add_argument("--intervalo", type=float, default=0.1, help="intervalo entre heartbeats (s)")
+    parser.add_argument("--atraso-escrita-us", type=float, default=100.0)
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--saida", default=os.devnull, help="arquivo que recebe as linhas escritas")
+    parser.add_argument("--dir", default=None, help="diretório base para os arquivos temporários")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+    P.INTERVALO_HEARTBEAT = args.intervalo
+
+    # Os diretórios peer_N_shared (e os caches de hash) dos peers ficam num diretório temporário.
+    caminho_saida = os.path.abspath(args.saida)
+    diretorio = tempfile.mkdtemp(prefix="bench_log_", dir=args.dir)
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    resultados = []
+    try:
+        for modo in args.modos:
+            saida = TerminalLento(caminho_saida, args.atraso_escrita_us / 1e6)
+            resultado = executar_modo(modo, args, saida)
+            resultado["linhas_escritas"] = saida.linhas
+            saida.close()
+            resultados.append(resultado)
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{args.peers} peers, heartbeat a cada {args.intervalo * 1000:g} ms, "
+          f"{args.atraso_escrita_us:g} us por escrita no terminal")
+    print(f"{'modo':<16} {'heartbeats':>10} {'jitter p50':>11} {'p99':>8} {'máx':>8} "
+          f"{'atraso p50':>11} {'p99':>8} {'handler p99':>12} {'linhas':>7}   (ms)")
+    for r in resultados:
+        print(f"{r['modo']:<16} {r['heartbeats']:>10} {r['jitter_p50_ms']:>11} {r['jitter_p99_ms']:>8} "
+              f"{r['jitter_max_ms']:>8} {r['atraso_p50_ms']:>11} {r['atraso_p99_ms']:>8} "
+              f"{r['receber_heartbeat_p99_ms']:>12} {r['linhas_escritas']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Mede o estado persistente do tracker (peer.py): instantâneo do registro + log de alterações.
+
+Cenários:
+  carga  um tracker com --peers x --arquivos entradas no registro. Compara o tempo para
+         reconstruir o registro de um tracker reiniciado: carregando o disco (instantâneo
+         e log) contra puxar a lista completa de cada peer por Pyro, um após o outro,
+         como solicitar_todos_arquivos (sem a espera inicial de 1 s)
+  log    --operacoes deltas seguidos (um arquivo adicionado e um removido por vez), com a
+         compactação chamada como no loop do tracker. Mostra o custo de cada escrita no log,
+         o maior uso de disco (instantâneo + log) e o tempo de carga do estado final
+
+Os peers do cenário carga rodam no mesmo processo, cada um com seu daemon Pyro, e
+anunciam nomes de arquivo sintéticos (sem criar os arquivos em disco).
+
+Uso: python benchmarks/bench_persistencia.py [--peers 50] [--arquivos 1000] [--operacoes 50000] [--json]
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Pyro5.api
+import peer as P
+from bench_cluster import ServicoNomesMemoria
+from bench_proxies import percentil
+
+CENARIOS = ("carga", "log")
+
+
+def digest_sintetico(nome):
+    h = hashlib.sha256(nome.encode()).hexdigest()
+    return {"tamanho": 4096, "tamanho_peca": P.TAMANHO_BLOCO, "pecas": [h], "hash": h}
+
+
+def novo_tracker(peer_id):
+    tracker = P.Peer(peer_id)
+    tracker.is_tracker = True
+    tracker.epoca = 1
+    return tracker
+
+
+def uso_disco(persistencia):
+    total = 0
+    for caminho in (persistencia.caminho, persistencia.caminho_log, persistencia.caminho_log_antigo):
+        with contextlib.suppress(OSError):
+            total += os.path.getsize(caminho)
+    return total
+
+
+def cenario_carga(args):
+    nomes = ServicoNomesMemoria()
+    pool = P.PoolProxies()
+    peers = []
+    for peer_id in range(1, args.peers + 1):
+        peer = P.Peer(peer_id)
+        peer.files = [f"peer_{peer_id}_arquivo_{k:06d}.pdf" for k in range(args.arquivos)]
+        peer.digests = {f: digest_sintetico(f) for f in peer.files}
+        peer.nomes = nomes
+        peer.proxies = pool
+        peer.daemon = Pyro5.api.Daemon()
+        peer.registrar_no_servico_nomes()
+        threading.Thread(target=peer.daemon.requestLoop, daemon=True).start()
+        peers.append(peer)
+
+    # Tracker original: puxa de todos e grava o estado em disco ao longo do caminho.
+    tracker = novo_tracker(9000)
+    tracker.nomes = nomes
+    tracker.proxies = pool
+    inicio = time.perf_counter()
+    for nome, uri in tracker.listar_peers_ativos():
+        tracker._puxar_registro(nome, uri)
+    puxar = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    P.compactar_registro(tracker)
+    compactar = time.perf_counter() - inicio
+    tracker.persistencia.fechar()
+    disco = uso_disco(tracker.persistencia)
+
+    # Tracker reiniciado: um processo novo (mesmo peer_id) que carrega o disco.
+    reiniciado = novo_tracker(9000)
+    inicio = time.perf_counter()
+    with reiniciado.registry_lock:
+        P.carregar_registro(reiniciado)
+    carregar = time.perf_counter() - inicio
+    # Verificação incremental: com as versões conhecidas, cada peer responde um delta vazio.
+    reiniciado.nomes = nomes
+    reiniciado.proxies = pool
+    inicio = time.perf_counter()
+    for nome, uri in reiniciado.listar_peers_ativos():
+        reiniciado._puxar_registro(nome, uri)
+    verificar = time.perf_counter() - inicio
+    igual = reiniciado.obter_todos_arquivos() == tracker.obter_todos_arquivos()
+
+    for peer in peers:
+        peer.daemon.shutdown()
+    pool.fechar()
+    yield {
+        "peers": args.peers,
+        "arquivos_por_peer": args.arquivos,
+        "puxar_todos_rpc_s": round(puxar, 4),
+        "carregar_disco_s": round(carregar, 4),
+        "verificar_com_peers_s": round(verificar, 4),
+        "compactar_s": round(compactar, 4),
+        "disco_mb": round(disco / 1e6, 2),
+        "registro_igual": igual,
+    }
+
+
+def cenario_log(args):
+    tracker = novo_tracker(9001)
+    for peer_id in range(1, args.peers + 1):
+        files = [f"peer_{peer_id}_arquivo_{k:06d}.pdf" for k in range(args.arquivos)]
+        tracker.atualizar_registro_arquivos(peer_id, files, {f: digest_sintetico(f) for f in files}, 0)
+    P.compactar_registro(tracker)
+
+    escritas = []
+    pico = uso_disco(tracker.persistencia)
+    compactacoes = 0
+    versoes = {peer_id: 0 for peer_id in range(1, args.peers + 1)}
+    for i in range(args.operacoes):
+        peer_id = i % args.peers + 1
+        novo = f"peer_{peer_id}_novo_{i:08d}.txt"
+        antigo = f"peer_{peer_id}_arquivo_{(i // args.peers) % args.arquivos:06d}.pdf"
+        inicio = time.perf_counter()
+        tracker.aplicar_delta_registro(peer_id, versoes[peer_id], versoes[peer_id] + 1, [novo], [antigo],
+                                       {novo: digest_sintetico(novo)})
+        escritas.append(time.perf_counter() - inicio)
+        versoes[peer_id] += 1
+        if i % 100 == 0:
+            # O loop do tracker confere a compactação a cada rodada de replicação.
+            if tracker.persistencia.precisa_compactar():
+                P.compactar_registro(tracker)
+                compactacoes += 1
+            pico = max(pico, uso_disco(tracker.persistencia))
+    tracker.persistencia.fechar()
+    final = uso_disco(tracker.persistencia)
+
+    reiniciado = novo_tracker(9001)
+    inicio = time.perf_counter()
+    with reiniciado.registry_lock:
+        P.carregar_registro(reiniciado)
+    carregar = time.perf_counter() - inicio
+    yield {
+        "operacoes": args.operacoes,
+        "escrita_p50_us": round(percentil(escritas, 0.50) * 1e6, 1),
+        "escrita_p99_us": round(percentil(escritas, 0.99) * 1e6, 1),
+        "compactacoes": compactacoes,
+        "disco_pico_mb": round(pico / 1e6, 2),
+        "disco_final_mb": round(final / 1e6, 2),
+        "carregar_disco_s": round(carregar, 4),
+        "registro_igual": reiniciado.obter_todos_arquivos() == tracker.obter_todos_arquivos(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cenarios", nargs="+", choices=CENARIOS, default=list(CENARIOS))
+    parser.add_argument("--peers", type=int, default=50)
+    parser.add_argument("--arquivos", type=int, default=1000, help="arquivos anunciados por peer")
+    parser.add_argument("--operacoes", type=int, default=50000, help="deltas no cenário log")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix="bench_persistencia_")
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    funcoes = {"carga": cenario_carga, "log": cenario_log}
+    resultados = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for cenario in args.cenarios:
+                for resultado in funcoes[cenario](args):
+                    resultados.append({"cenario": cenario, **resultado})
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    for r in resultados:
+        if r["cenario"] == "carga":
+            print(f"carga: {r['peers']} peers x {r['arquivos_por_peer']} arquivos, {r['disco_mb']} MB em disco")
+            print(f"  puxar de todos por RPC {r['puxar_todos_rpc_s']} s | carregar do disco {r['carregar_disco_s']} s"
+                  f" + verificar com os peers {r['verificar_com_peers_s']} s | compactar {r['compactar_s']} s"
+                  f" | registro igual: {'sim' if r['registro_igual'] else 'não'}")
+        else:
+            print(f"log: {r['operacoes']} deltas, escrita p50 {r['escrita_p50_us']} us / p99 {r['escrita_p99_us']} us,"
+                  f" {r['compactacoes']} compactações")
+            print(f"  disco pico {r['disco_pico_mb']} MB, final {r['disco_final_mb']} MB,"
+                  f" carregar {r['carregar_disco_s']} s | registro igual: {'sim' if r['registro_igual'] else 'não'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compara chamadas remotas abrindo um Pyro5.api.Proxy novo a cada chamada com o
+PoolProxies do peer.py: chamadas por segundo e latência p50/p99.
+
+Uso: python benchmarks/bench_proxies.py [--chamadas 2000] [--threads 8]
+Não precisa do serviço de nomes: o objeto remoto é registrado num daemon local.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Pyro5.api
+from peer import PoolProxies
+
+
+@Pyro5.api.expose
+class Eco:
+    def receber_heartbeat(self, epoca):
+        return True
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def medir(nome, chamar, uri, chamadas, threads):
+    latencias = []
+    lock = threading.Lock()
+
+    def trabalhador(n):
+        locais = []
+        for _ in range(n):
+            inicio = time.perf_counter()
+            chamar(uri)
+            locais.append(time.perf_counter() - inicio)
+        with lock:
+            latencias.extend(locais)
+
+    por_thread = chamadas // threads
+    inicio = time.perf_counter()
+    ts = [threading.Thread(target=trabalhador, args=(por_thread,)) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    return {
+        "modo": nome,
+        "chamadas": len(latencias),
+        "chamadas_por_s": round(len(latencias) / duracao, 1),
+        "p50_ms": round(percentil(latencias, 0.50) * 1000, 3),
+        "p99_ms": round(percentil(latencias, 0.99) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chamadas", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    daemon = Pyro5.api.Daemon()
+    uri = daemon.register(Eco())
+    threading.Thread(target=daemon.requestLoop, daemon=True).start()
+
+    def proxy_novo(uri):
+        with Pyro5.api.Proxy(uri) as p:
+            return p.receber_heartbeat(1)
+
+    pool = PoolProxies()
+
+    def proxy_do_pool(uri):
+        with pool.proxy(uri) as p:
+            return p.receber_heartbeat(1)
+
+    resultados = [
+        medir("proxy novo por chamada", proxy_novo, uri, args.chamadas, args.threads),
+        medir("pool de proxies", proxy_do_pool, uri, args.chamadas, args.threads),
+    ]
+    pool.fechar()
+    daemon.shutdown()
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{'modo':<24} {'chamadas/s':>12} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for r in resultados:
+        print(f"{r['modo']:<24} {r['chamadas_por_s']:>12} {r['p50_ms']:>10} {r['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Mede a transferência de arquivos entre peers (peer.py) pelo loopback:
+MB/s, pico de memória (RSS) e CPU por transferência.
+O RSS inclui as páginas de arquivos mapeados (cache de páginas, compartilhado e
+descartável); "anon" conta só a memória anônima (buffers, cópias dos blocos).
+
+Cenários:
+  unico       um downloader e uma fonte, para cada tamanho em --tamanhos
+  concorrente --downloaders peers baixando o mesmo arquivo da mesma fonte ao mesmo tempo
+  pequenos    muitos arquivos pequenos baixados em sequência por um downloader
+  swarm       baixar_arquivo_swarm com 1, 2, 4... fontes (--fontes)
+  controle    o cenário concorrente com a fonte num processo separado, enquanto outro
+              processo mede a latência de uma chamada Pyro curta à fonte a cada 10 ms
+              (comparada com a fonte ociosa)
+
+Cada cenário roda com cada motor de --motores: "serpent" é a linha de base
+(bytes codificados em base64), "marshal" é o SERIALIZADOR_DADOS atual pelo
+Pyro e "canal" usa o canal de dados (CanalDados) no lugar do Pyro.
+Fontes e downloaders rodam no mesmo processo, então a CPU medida inclui os
+dois lados. Os arquivos são gerados num diretório temporário (--dir).
+
+Uso: python benchmarks/bench_transferencia.py [--tamanhos 1K 1M 64M 1G] [--cenarios unico swarm] [--json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Pyro5.api
+import peer as P
+from bench_cluster import ServicoNomesMemoria
+from bench_proxies import percentil
+
+UNIDADES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+CENARIOS = ("unico", "concorrente", "pequenos", "swarm", "controle")
+MOTORES = ("serpent", "marshal", "canal")
+
+
+def tamanho(texto):
+    texto = texto.strip().upper().rstrip("B")
+    if texto and texto[-1] in UNIDADES:
+        return int(float(texto[:-1]) * UNIDADES[texto[-1]])
+    return int(texto)
+
+
+def legivel(n):
+    for sufixo, fator in (("G", UNIDADES["G"]), ("M", UNIDADES["M"]), ("K", UNIDADES["K"])):
+        if n >= fator:
+            return f"{n / fator:g}{sufixo}"
+    return f"{n}B"
+
+
+def memoria_atual():
+    # (RSS, RSS anônimo) em bytes.
+    try:
+        with open("/proc/self/statm") as f:
+            campos = f.read().split()
+        pagina = os.sysconf("SC_PAGE_SIZE")
+        return int(campos[1]) * pagina, (int(campos[1]) - int(campos[2])) * pagina
+    except OSError:
+        # Sem /proc: o melhor disponível é o pico do processo inteiro (KiB no Linux).
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return rss, rss
+
+
+class AmostradorMemoria:
+    # Amostra o RSS do processo em segundo plano e guarda o pico desde o último reinício.
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self.reiniciar()
+        self.parar = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while not self.parar.is_set():
+            rss, anon = memoria_atual()
+            self.pico = max(self.pico, rss)
+            self.pico_anon = max(self.pico_anon, anon)
+            time.sleep(self.intervalo)
+
+    def reiniciar(self):
+        self.base, self.base_anon = memoria_atual()
+        self.pico, self.pico_anon = self.base, self.base_anon
+
+    def encerrar(self):
+        self.parar.set()
+        self.thread.join()
+
+
+def gerar_arquivo(caminho, tamanho_total):
+    bloco = os.urandom(min(tamanho_total, P.TAMANHO_BLOCO)) if tamanho_total else b""
+    with open(caminho, "wb") as f:
+        restante = tamanho_total
+        while restante > 0:
+            f.write(bloco[:restante])
+            restante -= len(bloco)
+            # Varia o conteúdo entre blocos para que peças iguais não se repitam.
+            bloco = bloco[1:] + bloco[:1]
+
+
+def copiar(origem, destino):
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copyfile(origem, destino)
+
+
+class Ambiente:
+    # Fontes registradas num daemon Pyro próprio e downloaders descartáveis,
+    # todos com o mesmo serviço de nomes em memória e o mesmo pool de proxies.
+    def __init__(self, arquivos, fontes):
+        self.nomes = ServicoNomesMemoria()
+        self.proxies = P.PoolProxies()
+        self.arquivos = arquivos
+        self.daemons = []
+        self.fontes = []
+        self.proximo_id = 1000
+        for peer_id in range(1, fontes + 1):
+            shared = f"peer_{peer_id}_shared"
+            os.makedirs(shared, exist_ok=True)
+            for nome, caminho in arquivos.items():
+                copiar(caminho, os.path.join(shared, nome))
+            peer = P.Peer(peer_id)
+            peer.nomes = self.nomes
+            peer.proxies = self.proxies
+            peer.daemon = Pyro5.api.Daemon()
+            peer.registrar_no_servico_nomes()
+            threading.Thread(target=peer.daemon.requestLoop, daemon=True).start()
+            self.daemons.append(peer.daemon)
+            self.fontes.append(peer)
+
+    def novo_downloader(self):
+        peer = P.Peer(self.proximo_id)
+        self.proximo_id += 1
+        peer.nomes = self.nomes
+        peer.proxies = self.proxies
+        return peer
+
+    def descartar(self, peer):
+        shutil.rmtree(peer.shared_dir, ignore_errors=True)
+        with contextlib.suppress(OSError):
+            os.remove(f"{peer.shared_dir}.hashes.json")
+
+    def encerrar(self):
+        for daemon in self.daemons:
+            daemon.shutdown()
+        self.proxies.fechar()
+
+
+def medir(amostrador, funcao, bytes_total):
+    amostrador.reiniciar()
+    cpu = time.process_time()
+    inicio = time.perf_counter()
+    ok = funcao()
+    duracao = max(time.perf_counter() - inicio, 1e-9)
+    cpu = time.process_time() - cpu
+    return {
+        "ok": bool(ok),
+        "segundos": round(duracao, 4),
+        "mb_por_s": round(bytes_total / duracao / 1e6, 2),
+        "cpu_s": round(cpu, 4),
+        "cpu_s_por_gb": round(cpu / (bytes_total / 1e9), 3) if bytes_total else None,
+        "rss_pico_mb": round(amostrador.pico / 1e6, 1),
+        "rss_extra_mb": round(max(0, amostrador.pico - amostrador.base) / 1e6, 1),
+        "anon_extra_mb": round(max(0, amostrador.pico_anon - amostrador.base_anon) / 1e6, 1),
+    }
+
+
+def cenario_unico(ambiente, amostrador, args):
+    fonte = ambiente.fontes[0].peer_id
+    for tamanho_total in args.tamanhos:
+        downloader = ambiente.novo_downloader()
+        nome = f"unico_{tamanho_total}.bin"
+        resultado = medir(amostrador, lambda: downloader.baixar_arquivo(nome, fonte), tamanho_total)
+        ambiente.descartar(downloader)
+        yield {"tamanho": tamanho_total, **resultado}
+
+
+def cenario_concorrente(ambiente, amostrador, args):
+    fonte = ambiente.fontes[0].peer_id
+    nome = f"concorrente_{args.tamanho_concorrente}.bin"
+    downloaders = [ambiente.novo_downloader() for _ in range(args.downloaders)]
+    resultados = []
+
+    def todos():
+        threads = [threading.Thread(target=lambda d=d: resultados.append(d.baixar_arquivo(nome, fonte)))
+                   for d in downloaders]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return len(resultados) == len(downloaders) and all(resultados)
+
+    resultado = medir(amostrador, todos, args.tamanho_concorrente * args.downloaders)
+    for downloader in downloaders:
+        ambiente.descartar(downloader)
+    yield {"tamanho": args.tamanho_concorrente, "downloaders": args.downloaders, **resultado}
+
+
+def cenario_pequenos(ambiente, amostrador, args):
+    fonte = ambiente.fontes[0].peer_id
+    downloader = ambiente.novo_downloader()
+    nomes = [f"pequeno_{i}.bin" for i in range(args.pequenos)]
+    resultado = medir(amostrador, lambda: all([downloader.baixar_arquivo(n, fonte) for n in nomes]),
+                      args.tamanho_pequeno * args.pequenos)
+    ambiente.descartar(downloader)
+    resultado["arquivos_por_s"] = round(args.pequenos / resultado["segundos"], 1)
+    yield {"tamanho": args.tamanho_pequeno, "arquivos": args.pequenos, **resultado}
+
+
+def cenario_swarm(ambiente, amostrador, args):
+    nome = f"swarm_{args.tamanho_swarm}.bin"
+    for fontes in args.fontes:
+        ids = [p.peer_id for p in ambiente.fontes[:fontes]]
+        downloader = ambiente.novo_downloader()
+        resultado = medir(amostrador, lambda: downloader.baixar_arquivo_swarm(nome, ids), args.tamanho_swarm)
+        ambiente.descartar(downloader)
+        yield {"tamanho": args.tamanho_swarm, "fontes": fontes, **resultado}
+
+
+FONTE_CONTROLE = 900
+
+
+def sondar(uri, parar, saida, intervalo=0.01):
+    # Processo separado: chamada de controle barata, como um heartbeat, até 'parar'.
+    latencias = []
+    with Pyro5.api.Proxy(uri) as proxy:
+        proxy._pyroBind()
+        saida.send("pronto")
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            proxy.get_lista_arquivos()
+            latencias.append(time.perf_counter() - inicio)
+            time.sleep(intervalo)
+    saida.send(latencias)
+
+
+def servir_fonte(diretorio, nome, caminho, saida):
+    # Processo separado: a fonte do cenário controle, para que a sonda meça só o processo que envia.
+    os.chdir(diretorio)
+    destino = os.path.join(f"peer_{FONTE_CONTROLE}_shared", nome)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    if not os.path.exists(destino):
+        copiar(caminho, destino)
+    peer = P.Peer(FONTE_CONTROLE)
+    peer.daemon = Pyro5.api.Daemon()
+    saida.send(str(peer.daemon.register(peer)))
+    peer.daemon.requestLoop()
+
+
+def cenario_controle(ambiente, amostrador, args):
+    contexto = multiprocessing.get_context("spawn")
+    nome = f"concorrente_{args.tamanho_concorrente}.bin"
+    recebe, envia = contexto.Pipe(duplex=False)
+    fonte = contexto.Process(target=servir_fonte, args=(os.getcwd(), nome, ambiente.arquivos[nome], envia), daemon=True)
+    fonte.start()
+    uri = recebe.recv()
+    ambiente.nomes.registrar(f"Peer_{FONTE_CONTROLE}", uri)
+
+    def sondando(funcao):
+        # Retorna (resultado de funcao, latências medidas pela sonda enquanto ela rodava).
+        parar = contexto.Event()
+        recebe, envia = contexto.Pipe(duplex=False)
+        sonda = contexto.Process(target=sondar, args=(uri, parar, envia), daemon=True)
+        sonda.start()
+        recebe.recv()
+        try:
+            resultado = funcao()
+        finally:
+            parar.set()
+            latencias = recebe.recv()
+            sonda.join()
+        return resultado, latencias
+
+    try:
+        _, ociosa = sondando(lambda: time.sleep(1.0))
+        downloaders = [ambiente.novo_downloader() for _ in range(args.downloaders)]
+        resultados = []
+
+        def todos():
+            threads = [threading.Thread(target=lambda d=d: resultados.append(d.baixar_arquivo(nome, FONTE_CONTROLE)))
+                       for d in downloaders]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            return len(resultados) == len(downloaders) and all(resultados)
+
+        resultado, latencias = sondando(lambda: medir(amostrador, todos, args.tamanho_concorrente * args.downloaders))
+        for downloader in downloaders:
+            ambiente.descartar(downloader)
+    finally:
+        fonte.terminate()
+        fonte.join()
+        ambiente.nomes.remover(f"Peer_{FONTE_CONTROLE}")
+    yield {"tamanho": args.tamanho_concorrente, "downloaders": args.downloaders, **resultado,
+           "ocioso_p99_ms": round(percentil(ociosa, 0.99) * 1000, 2),
+           "controle_p50_ms": round(percentil(latencias, 0.50) * 1000, 2),
+           "controle_p99_ms": round(percentil(latencias, 0.99) * 1000, 2),
+           "controle_max_ms": round(max(latencias) * 1000, 2)}
+
+
+def gerar_arquivos(args, diretorio):
+    arquivos = {}
+
+    def novo(nome, tamanho_total):
+        caminho = os.path.join(diretorio, nome)
+        if nome not in arquivos:
+            gerar_arquivo(caminho, tamanho_total)
+            arquivos[nome] = caminho
+
+    if "unico" in args.cenarios:
+        for tamanho_total in args.tamanhos:
+            novo(f"unico_{tamanho_total}.bin", tamanho_total)
+    if "concorrente" in args.cenarios or "controle" in args.cenarios:
+        novo(f"concorrente_{args.tamanho_concorrente}.bin", args.tamanho_concorrente)
+    if "pequenos" in args.cenarios:
+        for i in range(args.pequenos):
+            novo(f"pequeno_{i}.bin", args.tamanho_pequeno)
+    if "swarm" in args.cenarios:
+        novo(f"swarm_{args.tamanho_swarm}.bin", args.tamanho_swarm)
+    return arquivos
+
+
+def executar(args):
+    gerados = os.path.abspath("dados")
+    os.makedirs(gerados)
+    arquivos = gerar_arquivos(args, gerados)
+    fontes = max(args.fontes) if "swarm" in args.cenarios else 1
+    ambiente = Ambiente(arquivos, fontes)
+    amostrador = AmostradorMemoria()
+    funcoes = {"unico": cenario_unico, "concorrente": cenario_concorrente,
+               "pequenos": cenario_pequenos, "swarm": cenario_swarm, "controle": cenario_controle}
+    resultados = []
+    try:
+        for cenario in args.cenarios:
+            for motor in args.motores:
+                P.SERIALIZADOR_DADOS = "marshal" if motor == "canal" else motor
+                P.CANAL_DADOS_ATIVO = motor == "canal"
+                for resultado in funcoes[cenario](ambiente, amostrador, args):
+                    resultados.append({"cenario": cenario, "motor": motor, **resultado})
+    finally:
+        amostrador.encerrar()
+        ambiente.encerrar()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cenarios", nargs="+", choices=CENARIOS, default=list(CENARIOS))
+    parser.add_argument("--motores", nargs="+", choices=MOTORES, default=list(MOTORES),
+                        help="serpent = base64 pelo Pyro, marshal = bytes pelo Pyro, canal = canal de dados")
+    parser.add_argument("--tamanhos", nargs="+", type=tamanho, default=[tamanho(t) for t in ("1K", "1M", "16M", "128M")])
+    parser.add_argument("--downloaders", type=int, default=4)
+    parser.add_argument("--tamanho-concorrente", type=tamanho, default=tamanho("32M"))
+    parser.add_argument("--pequenos", type=int, default=200)
+    parser.add_argument("--tamanho-pequeno", type=tamanho, default=tamanho("4K"))
+    parser.add_argument("--fontes", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--tamanho-swarm", type=tamanho, default=tamanho("64M"))
+    parser.add_argument("--dir", default=None, help="diretório base para os arquivos temporários")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix="bench_transferencia_", dir=args.dir)
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    try:
+        # Os peers imprimem cada transferência; a saída deles é descartada.
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultados = executar(args)
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{'cenário':<12} {'motor':<8} {'tamanho':>8} {'detalhe':>10} {'MB/s':>9} {'CPU (s)':>8} "
+          f"{'CPU s/GB':>9} {'RSS pico':>9} {'RSS +MB':>8} {'anon +MB':>9} {'ok':>3}")
+    for r in resultados:
+        detalhe = (f"{r['downloaders']} downl." if "downloaders" in r else
+                   f"{r['arquivos']} arq." if "arquivos" in r else
+                   f"{r['fontes']} fontes" if "fontes" in r else "")
+        print(f"{r['cenario']:<12} {r['motor']:<8} {legivel(r['tamanho']):>8} {detalhe:>10} {r['mb_por_s']:>9} "
+              f"{r['cpu_s']:>8} {str(r['cpu_s_por_gb']):>9} {r['rss_pico_mb']:>9} {r['rss_extra_mb']:>8} "
+              f"{r['anon_extra_mb']:>9} {'sim' if r['ok'] else 'não':>3}")
+        if "controle_p99_ms" in r:
+            print(f"{'':<12} latência de controle (ms): ociosa p99 {r['ocioso_p99_ms']}, durante a carga "
+                  f"p50 {r['controle_p50_ms']} / p99 {r['controle_p99_ms']} / máx {r['controle_max_ms']}")
+
+
+if __name__ == "__main__":
+    main()
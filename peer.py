@@ -1,10 +1,1984 @@
 import sys
 import os
+import asyncio
 import Pyro5.api
+import Pyro5.errors
 import random
 import threading
 import time
-import base64
+import collections
+import bisect
+import fnmatch
+import hashlib
+import mmap
+import itertools
+import json
+import re
+import socket
+import secrets
+import struct
+import weakref
+import zlib
+import contextlib
+import serpent
+import math
+import functools
+import inspect
+import logging
+import logging.handlers
+import queue
+import ctypes
+import select
+import stat
+from statistics import NormalDist, fmean, pstdev
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+# Tamanho padrão dos blocos usados na transferência de arquivos.
+TAMANHO_BLOCO = 1024 * 1024
+TAMANHO_MAXIMO_BLOCO = 8 * 1024 * 1024
+# O serializador marshal transporta bytes crus (o serpent os codifica em base64).
+SERIALIZADOR_DADOS = "marshal"
+
+# Download em enxame (swarm): peças buscadas em paralelo de todas as fontes.
+MAX_FONTES_SWARM = 8
+CONEXOES_POR_FONTE = 2
+TIMEOUT_PECA = 10.0
+MAX_FALHAS_FONTE = 3
+
+# Downloads parciais: arquivos .part com um bitmap lateral das peças já verificadas.
+EXTENSOES_TEMPORARIAS = (".tmp", ".part", ".part.estado")
+PECAS_POR_SALVAMENTO = 8
+
+# Diretório compartilhado acompanhado por inotify (Linux). Sem inotify, é varrido com
+# os.scandir a cada INTERVALO_VARREDURA segundos. Eventos próximos são agrupados numa só alteração.
+OBSERVADOR_INOTIFY_ATIVO = sys.platform.startswith("linux")
+INTERVALO_VARREDURA = 2.0
+ATRASO_AGRUPAMENTO = 0.1
+
+# Quantos arquivos compartilhados ficam mapeados (mmap) ao mesmo tempo para envio.
+MAX_ARQUIVOS_MAPEADOS = 64
+
+# Canal de dados: conteúdo dos arquivos por um socket TCP próprio, fora do loop de requisições do Pyro.
+CANAL_DADOS_ATIVO = True
+TAMANHO_BUFFER_DADOS = 4 * 1024 * 1024
+MAX_CONEXOES_DADOS = 32
+VALIDADE_TICKET = 30.0
+TAMANHO_TICKET = 32
+
+# Compressão por bloco nas transferências, negociada entre os peers.
+COMPRESSOES_ACEITAS = ("zlib",)
+NIVEL_COMPRESSAO = 1
+AMOSTRA_COMPRESSAO = 16 * 1024
+LIMIAR_COMPRESSAO = 0.9
+EXTENSOES_COMPRIMIDAS = frozenset((".jpg", ".jpeg", ".png", ".gif", ".webp", ".zip", ".gz", ".bz2", ".xz",
+                                   ".zst", ".7z", ".rar", ".mp3", ".mp4", ".mkv", ".avi", ".ogg", ".webm"))
+
+# Busca por nome no tracker (prefixo, trecho e padrão glob), com paginação.
+LIMITE_PADRAO_BUSCA = 50
+LIMITE_MAXIMO_BUSCA = 500
+
+# Sincronização do registro por deltas: alterações guardadas até a confirmação do tracker.
+MAX_HISTORICO_REGISTRO = 4096
+
+# Réplica do registro do tracker em peers em espera (hot standby), atualizada a cada alteração.
+REPLICAS_STANDBY = 2
+INTERVALO_REPLICACAO = 0.2
+MAX_OPERACOES_REPLICACAO = 4096
+FATOR_TIMEOUT_STANDBY = 0.6
+
+# Estado do tracker em disco: instantâneo do registro e log das alterações feitas desde ele.
+PERSISTENCIA_REGISTRO_ATIVA = True
+MAX_ENTRADAS_LOG_REGISTRO = 10000
+INTERVALO_INSTANTANEO_REGISTRO = 30.0
+
+# Reconstrução do registro por um tracker novo: pedidos em paralelo, com prazo por peer
+# e novas tentativas (com espera crescente) para quem não respondeu.
+MAX_WORKERS_COLETA = 16
+TIMEOUT_COLETA_PEER = 2.0
+TENTATIVAS_COLETA = 4
+ESPERA_RETENTATIVA_COLETA = 0.5
+
+# Heartbeats enviados em paralelo por um pool limitado, com prazo por rodada.
+INTERVALO_HEARTBEAT = 1.5
+PRAZO_RODADA_HEARTBEAT = 1.0
+MAX_WORKERS_HEARTBEAT = 64
+
+# Detecção de falha do tracker: prazo rearmado a cada heartbeat, adaptado ao jitter observado.
+LIMIAR_SUSPEITA = 8.0
+JANELA_HEARTBEATS = 100
+MIN_AMOSTRAS_SUSPEITA = 5
+DESVIO_MINIMO_RELATIVO = 0.1
+ESPALHAMENTO_TIMEOUT = 0.5
+
+# Pool de proxies: conexões Pyro reaproveitadas entre chamadas, por URI.
+MAX_PROXIES_OCIOSOS_POR_URI = 8
+TEMPO_MAXIMO_OCIOSO = 60.0
+
+# Eleição: pedidos de voto em paralelo, com prazo por eleição.
+PRAZO_ELEICAO = 2.0
+MAX_WORKERS_VOTOS = 64
+
+# Runtime asyncio: threads compartilhadas por todos os peers do processo para as chamadas Pyro bloqueantes
+# e, num pool separado, para atender as requisições recebidas.
+MAX_WORKERS_ASYNC = 64
+MAX_WORKERS_REQUISICOES_ASYNC = 32
+
+# Cache local do serviço de nomes (listas por prefixo e lookups), com validade limitada.
+TTL_CACHE_NOMES = 5.0
+
+# Métricas: contadores e histogramas de latência (em segundos) dos métodos remotos.
+METRICAS_ATIVAS = True
+LIMITES_HISTOGRAMA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_ELEICOES_METRICAS = 32
+
+# Log: níveis, limite de taxa por modelo de mensagem e escrita numa thread separada.
+TAXA_LOG_POR_MENSAGEM = 5.0
+RAJADA_LOG_POR_MENSAGEM = 20
+
+log = logging.getLogger("peer")
+log.addHandler(logging.NullHandler())
+
+class LimitadorTaxa(logging.Filter):
+    # Balde de fichas por modelo de mensagem (record.msg, antes de aplicar os argumentos):
+    # repetições em rajada são descartadas e a próxima que passar informa quantas foram.
+    def __init__(self, taxa=TAXA_LOG_POR_MENSAGEM, rajada=RAJADA_LOG_POR_MENSAGEM):
+        super().__init__()
+        self.taxa = taxa
+        self.rajada = rajada
+        self.baldes = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        chave = (record.name, record.msg)
+        agora = time.monotonic()
+        with self.lock:
+            fichas, instante, suprimidas = self.baldes.get(chave, (self.rajada, agora, 0))
+            fichas = min(self.rajada, fichas + (agora - instante) * self.taxa)
+            if fichas < 1:
+                self.baldes[chave] = (fichas, agora, suprimidas + 1)
+                return False
+            self.baldes[chave] = (fichas - 1, agora, 0)
+        if suprimidas:
+            record.suprimidas = suprimidas
+        return True
+
+class FormatadorTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(message)s")
+
+    def format(self, record):
+        texto = super().format(record)
+        suprimidas = getattr(record, "suprimidas", 0)
+        return f"{texto} ({suprimidas} mensagens iguais suprimidas)" if suprimidas else texto
+
+class FormatadorJSON(logging.Formatter):
+    # Uma linha JSON por evento, para ferramentas de coleta de log.
+    def format(self, record):
+        evento = {"ts": round(record.created, 6), "nivel": record.levelname, "logger": record.name,
+                  "thread": record.threadName, "msg": record.getMessage()}
+        if getattr(record, "suprimidas", 0):
+            evento["suprimidas"] = record.suprimidas
+        if record.exc_info:
+            evento["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False)
+
+def configurar_log(nivel=logging.INFO, formato="texto", saida=None,
+                   taxa=TAXA_LOG_POR_MENSAGEM, rajada=RAJADA_LOG_POR_MENSAGEM):
+    # Quem registra só filtra e enfileira; uma thread do QueueListener formata e escreve na
+    # saída, então heartbeats e votos nunca esperam pelo terminal. Retorna o listener, que
+    # deve ser parado (stop) no encerramento para esvaziar a fila.
+    fila = queue.SimpleQueue()
+    escritor = logging.StreamHandler(saida or sys.stdout)
+    escritor.setFormatter(FormatadorJSON() if formato == "json" else FormatadorTexto())
+    enfileirador = logging.handlers.QueueHandler(fila)
+    enfileirador.addFilter(LimitadorTaxa(taxa, rajada))
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.addHandler(enfileirador)
+    log.setLevel(nivel)
+    log.propagate = False
+    ouvinte = logging.handlers.QueueListener(fila, escritor)
+    ouvinte.start()
+    return ouvinte
+
+class PoolProxies:
+    # Proxies Pyro ociosos por (URI, serializador). Cada proxy é usado por uma thread de
+    # cada vez (a que o retirou do pool), como o Pyro exige.
+    def __init__(self, max_ociosos=MAX_PROXIES_OCIOSOS_POR_URI, tempo_ocioso=TEMPO_MAXIMO_OCIOSO):
+        self.max_ociosos = max_ociosos
+        self.tempo_ocioso = tempo_ocioso
+        self.ociosos = {}
+        self.ultima_limpeza = time.time()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _conexao_viva(proxy):
+        # Verificação sem ida e volta: um socket fechado pelo outro lado lê b"" imediatamente.
+        conexao = getattr(proxy, "_pyroConnection", None)
+        if conexao is None:
+            return True
+        sock = conexao.sock
+        timeout = sock.gettimeout()
+        try:
+            sock.setblocking(False)
+            return sock.recv(1, socket.MSG_PEEK) != b""
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    @staticmethod
+    def _descartar(proxy):
+        # O proxy pode ter sido devolvido por outra thread: é preciso assumi-lo antes de liberar.
+        with contextlib.suppress(Pyro5.errors.PyroError):
+            proxy._pyroClaimOwnership()
+            proxy._pyroRelease()
+
+    def _retirar(self, chave):
+        agora = time.time()
+        with self.lock:
+            ociosos = self.ociosos.get(chave, [])
+            while ociosos:
+                proxy, ultimo_uso = ociosos.pop()
+                if agora - ultimo_uso <= self.tempo_ocioso:
+                    break
+                self._descartar(proxy)
+            else:
+                return None
+        proxy._pyroClaimOwnership()
+        if not self._conexao_viva(proxy):
+            # O Pyro reconecta sozinho na próxima chamada depois de liberar a conexão.
+            proxy._pyroRelease()
+        return proxy
+
+    def _devolver(self, chave, proxy):
+        agora = time.time()
+        with self.lock:
+            ociosos = self.ociosos.setdefault(chave, [])
+            if len(ociosos) < self.max_ociosos:
+                ociosos.append((proxy, agora))
+                proxy = None
+            if agora - self.ultima_limpeza > self.tempo_ocioso / 2:
+                self._limpar_ociosos(agora)
+        if proxy is not None:
+            proxy._pyroRelease()
+
+    def _limpar_ociosos(self, agora):
+        self.ultima_limpeza = agora
+        for chave in list(self.ociosos):
+            vivos = []
+            for proxy, ultimo_uso in self.ociosos[chave]:
+                if agora - ultimo_uso <= self.tempo_ocioso:
+                    vivos.append((proxy, ultimo_uso))
+                else:
+                    self._descartar(proxy)
+            if vivos:
+                self.ociosos[chave] = vivos
+            else:
+                del self.ociosos[chave]
+
+    @contextlib.contextmanager
+    def proxy(self, uri, timeout=None, serializador=None):
+        chave = (str(uri), serializador)
+        proxy = self._retirar(chave)
+        if proxy is None:
+            proxy = Pyro5.api.Proxy(chave[0])
+            if serializador:
+                proxy._pyroSerializer = serializador
+        proxy._pyroTimeout = timeout
+        try:
+            yield proxy
+        except Pyro5.errors.CommunicationError:
+            # Conexão quebrada ou timeout: o proxy é descartado em vez de voltar ao pool.
+            proxy._pyroRelease()
+            raise
+        except BaseException:
+            self._devolver(chave, proxy)
+            raise
+        self._devolver(chave, proxy)
+
+    def fechar(self):
+        with self.lock:
+            ociosos, self.ociosos = self.ociosos, {}
+        for lista in ociosos.values():
+            for proxy, _ in lista:
+                self._descartar(proxy)
+
+proxies = PoolProxies()
+
+class CacheServicoNomes:
+    # Guarda o URI do serviço de nomes (o proxy vem do pool) e as respostas de list/lookup
+    # por TTL_CACHE_NOMES segundos. Registros e remoções feitos por este processo atualizam
+    # o cache na hora; falhas de conexão o invalidam.
+    def __init__(self, proxies, ttl=TTL_CACHE_NOMES):
+        self.proxies = proxies
+        self.ttl = ttl
+        self.ns_uri = None
+        self.listas = {}
+        self.uris = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _ns(self):
+        if self.ns_uri is None:
+            with Pyro5.api.locate_ns() as ns:
+                self.ns_uri = str(ns._pyroUri)
+        try:
+            with self.proxies.proxy(self.ns_uri) as ns:
+                yield ns
+        except Pyro5.errors.CommunicationError:
+            self.ns_uri = None
+            self.invalidar()
+            raise
+
+    def listar(self, prefixo, atualizar=False):
+        with self.lock:
+            entrada = self.listas.get(prefixo)
+            if entrada and not atualizar and time.time() - entrada[0] < self.ttl:
+                return dict(entrada[1])
+        with self._ns() as ns:
+            nomes = {nome: str(uri) for nome, uri in ns.list(prefix=prefixo).items()}
+        with self.lock:
+            self.listas[prefixo] = (time.time(), nomes)
+        return dict(nomes)
+
+    def lookup(self, nome):
+        agora = time.time()
+        with self.lock:
+            entrada = self.uris.get(nome)
+            if entrada and agora - entrada[0] < self.ttl:
+                return entrada[1]
+            for prefixo, (instante, nomes) in self.listas.items():
+                if nome.startswith(prefixo) and nome in nomes and agora - instante < self.ttl:
+                    return nomes[nome]
+        with self._ns() as ns:
+            uri = str(ns.lookup(nome))
+        with self.lock:
+            self.uris[nome] = (time.time(), uri)
+        return uri
+
+    def registrar(self, nome, uri):
+        with self._ns() as ns:
+            ns.register(nome, uri)
+        with self.lock:
+            self.uris[nome] = (time.time(), str(uri))
+            for prefixo, (_, nomes) in self.listas.items():
+                if nome.startswith(prefixo):
+                    nomes[nome] = str(uri)
+
+    def remover(self, nome):
+        with self._ns() as ns:
+            ns.remove(nome)
+        self.invalidar(nome)
+
+    def invalidar(self, nome=None):
+        with self.lock:
+            if nome is None:
+                self.listas = {}
+                self.uris = {}
+                return
+            self.uris.pop(nome, None)
+            for _, nomes in self.listas.values():
+                nomes.pop(nome, None)
+
+servico_nomes = CacheServicoNomes(proxies)
+
+class Metricas:
+    # Contadores, histogramas de latência e o histórico das últimas eleições de um peer.
+    # Com ativo=False os pontos instrumentados só testam a flag e não registram nada.
+    def __init__(self, ativo=METRICAS_ATIVAS, limites=LIMITES_HISTOGRAMA):
+        self.ativo = ativo
+        self.limites = limites
+        self.contadores = collections.Counter()
+        self.histogramas = {}
+        self.eleicoes = collections.deque(maxlen=MAX_ELEICOES_METRICAS)
+        self.lock = threading.Lock()
+
+    def contar(self, nome, valor=1):
+        if not self.ativo:
+            return
+        with self.lock:
+            self.contadores[nome] += valor
+
+    def observar(self, nome, segundos):
+        if not self.ativo:
+            return
+        i = bisect.bisect_left(self.limites, segundos)
+        with self.lock:
+            histograma = self.histogramas.get(nome)
+            if histograma is None:
+                histograma = self.histogramas[nome] = {"contagens": [0] * (len(self.limites) + 1), "soma": 0.0, "total": 0}
+            histograma["contagens"][i] += 1
+            histograma["soma"] += segundos
+            histograma["total"] += 1
+
+    def registrar_eleicao(self, epoca, duracao, votos, votos_necessarios, venceu):
+        if not self.ativo:
+            return
+        self.contar("eleicoes_vencidas" if venceu else "eleicoes_perdidas")
+        self.observar("eleicao", duracao)
+        with self.lock:
+            self.eleicoes.append({"epoca": epoca, "duracao": round(duracao, 6), "votos": votos,
+                                  "votos_necessarios": votos_necessarios, "venceu": venceu})
+
+    def instantaneo(self, medidores=None):
+        with self.lock:
+            return {
+                "ativo": self.ativo,
+                "contadores": dict(self.contadores),
+                "histogramas": {nome: {"limites": list(self.limites), "contagens": list(h["contagens"]),
+                                       "soma": h["soma"], "total": h["total"]}
+                                for nome, h in self.histogramas.items()},
+                "eleicoes": list(self.eleicoes),
+                "medidores": dict(medidores or {}),
+            }
+
+    def prometheus(self, medidores=None, rotulos=None, prefixo="pyro_peer"):
+        # Formato texto de exposição do Prometheus; os buckets do histograma são cumulativos.
+        dados = self.instantaneo(medidores)
+        base = ",".join(f'{chave}="{valor}"' for chave, valor in (rotulos or {}).items())
+        def rotular(extra=""):
+            partes = ",".join(p for p in (base, extra) if p)
+            return "{" + partes + "}" if partes else ""
+        linhas = []
+        for nome, valor in sorted(dados["contadores"].items()):
+            linhas.append(f"# TYPE {prefixo}_{nome}_total counter")
+            linhas.append(f"{prefixo}_{nome}_total{rotular()} {valor}")
+        for nome, h in sorted(dados["histogramas"].items()):
+            metrica = f"{prefixo}_{nome}_segundos"
+            linhas.append(f"# TYPE {metrica} histogram")
+            acumulado = 0
+            for limite, contagem in zip(list(h["limites"]) + ["+Inf"], h["contagens"]):
+                acumulado += contagem
+                le = f'le="{limite}"'
+                linhas.append(f"{metrica}_bucket{rotular(le)} {acumulado}")
+            linhas.append(f"{metrica}_sum{rotular()} {h['soma']}")
+            linhas.append(f"{metrica}_count{rotular()} {h['total']}")
+        for nome, valor in sorted(dados["medidores"].items()):
+            linhas.append(f"# TYPE {prefixo}_{nome} gauge")
+            linhas.append(f"{prefixo}_{nome}{rotular()} {float(valor)}")
+        return "\n".join(linhas) + "\n"
+
+def instrumentado(nome):
+    # Conta erros e mede a latência do método em self.metricas. Para geradores (iteradores
+    # remotos), mede do início ao fim da iteração.
+    def decorador(metodo):
+        if inspect.isgeneratorfunction(metodo):
+            @functools.wraps(metodo)
+            def gerador(self, *args, **kwargs):
+                metricas = self.metricas
+                if not metricas.ativo:
+                    yield from metodo(self, *args, **kwargs)
+                    return
+                inicio = time.perf_counter()
+                try:
+                    yield from metodo(self, *args, **kwargs)
+                except Exception:
+                    metricas.contar(f"{nome}_erros")
+                    raise
+                finally:
+                    metricas.observar(nome, time.perf_counter() - inicio)
+            return gerador
+
+        @functools.wraps(metodo)
+        def envolvido(self, *args, **kwargs):
+            metricas = self.metricas
+            if not metricas.ativo:
+                return metodo(self, *args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return metodo(self, *args, **kwargs)
+            except Exception:
+                metricas.contar(f"{nome}_erros")
+                raise
+            finally:
+                metricas.observar(nome, time.perf_counter() - inicio)
+        return envolvido
+    return decorador
+
+def para_bytes(dados):
+    if isinstance(dados, dict):
+        return serpent.tobytes(dados)
+    if isinstance(dados, bytearray):
+        return dados
+    return bytes(dados)
+
+@functools.lru_cache(maxsize=1024)
+def _vale_comprimir(filepath, chave):
+    # Formatos já comprimidos são descartados pela extensão; os demais, por uma amostra
+    # do início, meio e fim do arquivo. 'chave' (inode, tamanho, mtime) invalida o cache.
+    if os.path.splitext(filepath)[1].lower() in EXTENSOES_COMPRIMIDAS:
+        return False
+    tamanho = chave[1]
+    amostra = bytearray()
+    with open(filepath, 'rb') as f:
+        for posicao in sorted({0, max(0, tamanho // 2 - AMOSTRA_COMPRESSAO // 2), max(0, tamanho - AMOSTRA_COMPRESSAO)}):
+            f.seek(posicao)
+            amostra += f.read(AMOSTRA_COMPRESSAO)
+    return bool(amostra) and len(zlib.compress(amostra, NIVEL_COMPRESSAO)) <= len(amostra) * LIMIAR_COMPRESSAO
+
+def escolher_compressao(filepath, aceitas):
+    # None: o cliente não negociou compressão (blocos vão crus, como antes).
+    # "": negociou, mas o arquivo não comprime; senão o nome do algoritmo.
+    if aceitas is None:
+        return None
+    if "zlib" not in aceitas:
+        return ""
+    st = os.stat(filepath)
+    return "zlib" if _vale_comprimir(filepath, (st.st_ino, st.st_size, st.st_mtime_ns)) else ""
+
+def comprimir_bloco(bloco, compressao):
+    # (algoritmo, dados); o bloco vai cru ("") quando não diminui o bastante.
+    if compressao == "zlib":
+        dados = zlib.compress(bloco, NIVEL_COMPRESSAO)
+        if len(dados) <= len(bloco) * LIMIAR_COMPRESSAO:
+            return "zlib", dados
+    return "", bloco
+
+def descomprimir_bloco(item, limite=TAMANHO_MAXIMO_BLOCO):
+    # Aceita tanto blocos crus (fonte sem compressão) quanto pares (algoritmo, dados).
+    if not isinstance(item, (tuple, list)):
+        return para_bytes(item)
+    compressao, dados = item
+    dados = para_bytes(dados)
+    if not compressao:
+        return dados
+    if compressao != "zlib":
+        raise ValueError(f"compressão desconhecida: {compressao}")
+    descompressor = zlib.decompressobj()
+    bloco = descompressor.decompress(dados, limite)
+    if descompressor.unconsumed_tail or not descompressor.eof:
+        raise ValueError("bloco comprimido inválido ou maior que o limite")
+    return bloco
+
+def blocos_arquivo(mapa, offset, tamanho, tamanho_bloco, compressao, metricas):
+    # Gerador dos blocos de [offset, offset + tamanho) do mapeamento. Com compressao
+    # negociada (não None), cada bloco vai como (algoritmo, dados).
+    inicio = max(0, int(offset))
+    fim = len(mapa) if tamanho is None else min(len(mapa), inicio + int(tamanho))
+    for posicao in range(inicio, fim, tamanho_bloco):
+        bloco = mapa.ler(posicao, min(posicao + tamanho_bloco, fim))
+        if not bloco:
+            break  # arquivo truncado durante o envio
+        metricas.contar("bytes_enviados", len(bloco))
+        if compressao is None:
+            yield bloco
+            continue
+        algoritmo, dados = comprimir_bloco(bloco, compressao)
+        metricas.contar("bytes_economizados_compressao", len(bloco) - len(dados))
+        yield algoritmo, dados
+
+def hash_bloco(dados):
+    return hashlib.sha256(dados).hexdigest()
+
+def hash_pecas(pecas):
+    # O hash do arquivo é o hash da lista de hashes das peças, verificável sem reler o arquivo.
+    return hashlib.sha256(b"".join(bytes.fromhex(p) for p in pecas)).hexdigest()
+
+def calcular_digest(filepath, tamanho_peca=TAMANHO_BLOCO):
+    pecas = []
+    tamanho = 0
+    with open(filepath, 'rb') as f:
+        while True:
+            bloco = f.read(tamanho_peca)
+            if not bloco:
+                break
+            tamanho += len(bloco)
+            pecas.append(hash_bloco(bloco))
+    return {"tamanho": tamanho, "tamanho_peca": tamanho_peca, "pecas": pecas, "hash": hash_pecas(pecas)}
+
+def arquivo_temporario(filename):
+    return filename.endswith(EXTENSOES_TEMPORARIAS)
+
+class EstadoParcial:
+    def __init__(self, filepath, digest):
+        self.filepath = filepath
+        self.part_path = filepath + ".part"
+        self.estado_path = filepath + ".part.estado"
+        self.digest = digest
+        self.total_pecas = len(digest["pecas"])
+        self.concluidas = set()
+        self.nao_salvas = 0
+        self.lock = threading.Lock()
+        self._carregar()
+
+    def _carregar(self):
+        try:
+            with open(self.estado_path, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            if dados["hash"] == self.digest["hash"] and os.path.getsize(self.part_path) == self.digest["tamanho"]:
+                bitmap = bytes.fromhex(dados["bitmap"])
+                self.concluidas = {p for p in range(self.total_pecas) if bitmap[p // 8] >> (p % 8) & 1}
+                return
+        except (OSError, ValueError, KeyError, IndexError):
+            pass
+        # Estado ausente ou de outra versão do arquivo: recomeça do zero.
+        with open(self.part_path, 'wb') as f:
+            f.truncate(self.digest["tamanho"])
+        self.concluidas = set()
+        self.salvar()
+
+    def _salvar(self):
+        bitmap = bytearray((self.total_pecas + 7) // 8)
+        for p in self.concluidas:
+            bitmap[p // 8] |= 1 << (p % 8)
+        temp_path = self.estado_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"hash": self.digest["hash"], "bitmap": bitmap.hex()}, f)
+        os.replace(temp_path, self.estado_path)
+        self.nao_salvas = 0
+
+    def salvar(self):
+        with self.lock:
+            self._salvar()
+
+    def marcar(self, peca):
+        # Os dados da peça são gravados sem buffer antes de o bitmap ser atualizado.
+        with self.lock:
+            self.concluidas.add(peca)
+            self.nao_salvas += 1
+            if self.nao_salvas >= PECAS_POR_SALVAMENTO:
+                self._salvar()
+
+    def faltantes(self):
+        with self.lock:
+            return [p for p in range(self.total_pecas) if p not in self.concluidas]
+
+    def intervalos_faltantes(self):
+        intervalos = []
+        for p in self.faltantes():
+            if intervalos and intervalos[-1][1] == p:
+                intervalos[-1][1] = p + 1
+            else:
+                intervalos.append([p, p + 1])
+        return intervalos
+
+    def completo(self):
+        with self.lock:
+            return len(self.concluidas) == self.total_pecas
+
+    def finalizar(self):
+        os.replace(self.part_path, self.filepath)
+        if os.path.exists(self.estado_path):
+            os.remove(self.estado_path)
+
+def receber_exato(sock, tamanho, buffer=None):
+    buffer = buffer if buffer is not None else bytearray(tamanho)
+    visao = memoryview(buffer)
+    lidos = 0
+    while lidos < tamanho:
+        n = sock.recv_into(visao[lidos:tamanho])
+        if n == 0:
+            raise ConnectionError("canal de dados fechado antes do fim")
+        lidos += n
+    return buffer
+
+def compressoes_aceitas():
+    return COMPRESSOES_ACEITAS or None
+
+def reservar_canal(fonte, filename, offset, tamanho, tamanho_bloco=TAMANHO_BLOCO):
+    # Pede à fonte um ticket do canal de dados; None se o canal estiver desligado ou a fonte não tiver um.
+    if not CANAL_DADOS_ATIVO:
+        return None
+    try:
+        return fonte.reservar_envio(filename, offset, tamanho, compressoes_aceitas(), tamanho_bloco)
+    except AttributeError:
+        return None
+
+def receber_canal(ticket, tamanho_bloco):
+    # Gerador: lê o intervalo reservado pelo ticket em blocos de tamanho_bloco. Com compressão,
+    # cada bloco chega num quadro (1 byte: comprimido ou não, 4 bytes: tamanho, dados).
+    with socket.create_connection((ticket["host"], ticket["porta"]), timeout=TIMEOUT_PECA) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMANHO_BUFFER_DADOS)
+        sock.sendall(ticket["ticket"].encode("ascii"))
+        restante = struct.unpack("!Q", receber_exato(sock, 8))[0]
+        compressao = ticket.get("compressao")
+        while restante > 0:
+            tamanho = min(tamanho_bloco, restante)
+            if compressao:
+                comprimido, tamanho_quadro = struct.unpack("!BI", receber_exato(sock, 5))
+                if tamanho_quadro > TAMANHO_MAXIMO_BLOCO + 1024:
+                    raise ValueError("quadro do canal de dados grande demais")
+                bloco = descomprimir_bloco((compressao if comprimido else "", receber_exato(sock, tamanho_quadro)))
+                if len(bloco) != tamanho:
+                    raise ValueError(f"bloco com {len(bloco)} de {tamanho} bytes")
+                yield bloco
+            else:
+                yield receber_exato(sock, tamanho)
+            restante -= tamanho
+
+def ler_intervalo(fonte, filename, offset, tamanho):
+    # Um intervalo pelo canal de dados da fonte ou, sem ele, por enviar_bloco.
+    ticket = reservar_canal(fonte, filename, offset, tamanho, tamanho)
+    if ticket is None:
+        dados = fonte.enviar_bloco(filename, offset, tamanho, compressoes_aceitas())
+        return descomprimir_bloco(dados) if dados is not None else b""
+    return b"".join(receber_canal(ticket, tamanho))
+
+def transferir_pecas(fonte, filename, estado):
+    # Pede à fonte apenas as sequências de peças que ainda faltam.
+    digest = estado.digest
+    tamanho_peca = digest["tamanho_peca"]
+    recebidos = 0
+    try:
+        with open(estado.part_path, 'r+b', buffering=0) as f:
+            for inicio, fim in estado.intervalos_faltantes():
+                offset = inicio * tamanho_peca
+                tamanho = min(fim * tamanho_peca, digest["tamanho"]) - offset
+                peca = inicio
+                ticket = reservar_canal(fonte, filename, offset, tamanho, tamanho_peca)
+                if ticket is not None:
+                    blocos = receber_canal(ticket, tamanho_peca)
+                else:
+                    blocos = fonte.enviar_arquivo(filename, tamanho_peca, offset, tamanho, compressoes_aceitas())
+                for bloco in blocos:
+                    if peca >= fim:
+                        raise ValueError("fonte enviou mais dados que o pedido")
+                    bloco = descomprimir_bloco(bloco)
+                    # Peças corrompidas são buscadas novamente, uma a uma.
+                    tentativas = 0
+                    while hash_bloco(bloco) != digest["pecas"][peca]:
+                        tentativas += 1
+                        if tentativas > MAX_FALHAS_FONTE:
+                            raise ValueError(f"hash inválido na peça {peca}")
+                        log.warning("Peça %s de %s corrompida, buscando novamente.", peca, filename)
+                        bloco = ler_intervalo(fonte, filename, peca * tamanho_peca, tamanho_peca)
+                    f.seek(peca * tamanho_peca)
+                    f.write(bloco)
+                    estado.marcar(peca)
+                    recebidos += len(bloco)
+                    peca += 1
+    finally:
+        estado.salvar()
+    return recebidos
+
+class IndiceArquivos:
+    # Índice invertido do tracker: nome do arquivo -> conjunto de peers que o possuem.
+    # Os nomes também ficam em uma lista ordenada (buscas por prefixo) e em um índice
+    # de trigramas em minúsculas (buscas por trecho), para não varrer o registro inteiro.
+    def __init__(self):
+        self.peers_por_arquivo = {}
+        self.nomes = []
+        self.trigramas = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _trigramas(texto):
+        texto = texto.lower()
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    def _adicionar_nome(self, filename):
+        bisect.insort(self.nomes, filename)
+        for trigrama in self._trigramas(filename):
+            self.trigramas.setdefault(trigrama, set()).add(filename)
+
+    def _remover_nome(self, filename):
+        i = bisect.bisect_left(self.nomes, filename)
+        if i < len(self.nomes) and self.nomes[i] == filename:
+            del self.nomes[i]
+        for trigrama in self._trigramas(filename):
+            nomes = self.trigramas.get(trigrama)
+            if nomes:
+                nomes.discard(filename)
+                if not nomes:
+                    del self.trigramas[trigrama]
+
+    def atualizar(self, peer_id, adicionados=(), removidos=()):
+        with self.lock:
+            for filename in removidos:
+                peers = self.peers_por_arquivo.get(filename)
+                if peers:
+                    peers.discard(peer_id)
+                    if not peers:
+                        del self.peers_por_arquivo[filename]
+                        self._remover_nome(filename)
+            for filename in adicionados:
+                if filename not in self.peers_por_arquivo:
+                    self.peers_por_arquivo[filename] = set()
+                    self._adicionar_nome(filename)
+                self.peers_por_arquivo[filename].add(peer_id)
+
+    def buscar(self, filename):
+        with self.lock:
+            return sorted(self.peers_por_arquivo.get(filename, ()))
+
+    def limpar(self):
+        with self.lock:
+            self.peers_por_arquivo = {}
+            self.nomes = []
+            self.trigramas = {}
+
+    def _com_prefixo(self, prefixo):
+        for i in range(bisect.bisect_left(self.nomes, prefixo), len(self.nomes)):
+            if not self.nomes[i].startswith(prefixo):
+                break
+            yield self.nomes[i]
+
+    def _candidatos_trigramas(self, literais):
+        # Usa só o trigrama mais raro; o filtro final da busca confere o restante.
+        conjuntos = [self.trigramas.get(t, set()) for literal in literais for t in self._trigramas(literal)]
+        if not conjuntos:
+            return None
+        menor = min(conjuntos, key=len)
+        if len(menor) * 16 < len(self.nomes):
+            return sorted(menor)
+        # Conjunto grande: percorre a lista ordenada e para assim que a página estiver cheia.
+        return (nome for nome in self.nomes if nome in menor)
+
+    def _paginar(self, nomes, offset, limite):
+        offset = max(0, int(offset))
+        limite = max(1, min(int(limite), LIMITE_MAXIMO_BUSCA))
+        pagina = list(itertools.islice(nomes, offset, offset + limite + 1))
+        proximo = offset + limite if len(pagina) > limite else None
+        arquivos = [(nome, sorted(self.peers_por_arquivo[nome])) for nome in pagina[:limite]]
+        return {"arquivos": arquivos, "proximo": proximo}
+
+    def buscar_prefixo(self, prefixo, offset=0, limite=LIMITE_PADRAO_BUSCA):
+        with self.lock:
+            return self._paginar(self._com_prefixo(prefixo), offset, limite)
+
+    def buscar_trecho(self, trecho, offset=0, limite=LIMITE_PADRAO_BUSCA):
+        trecho = trecho.lower()
+        with self.lock:
+            candidatos = self._candidatos_trigramas([trecho]) if len(trecho) >= 3 else None
+            if candidatos is None:
+                candidatos = self.nomes
+            return self._paginar((n for n in candidatos if trecho in n.lower()), offset, limite)
+
+    def buscar_padrao(self, padrao, offset=0, limite=LIMITE_PADRAO_BUSCA):
+        # Usa o prefixo literal do padrão ou, sem ele, os trechos literais com 3+ caracteres.
+        prefixo = re.split(r"[*?\[]", padrao, maxsplit=1)[0]
+        with self.lock:
+            if prefixo:
+                candidatos = self._com_prefixo(prefixo)
+            else:
+                literais = [t for t in re.split(r"\[[^\]]*\]|[*?]", padrao) if len(t) >= 3]
+                candidatos = self._candidatos_trigramas(literais)
+                if candidatos is None:
+                    candidatos = self.nomes
+            return self._paginar((n for n in candidatos if fnmatch.fnmatchcase(n, padrao)), offset, limite)
+
+class HistoricoRegistro:
+    # Versão monotônica do registro local de arquivos e as alterações feitas desde então.
+    def __init__(self):
+        # Começa num ponto sorteado: versões de execuções diferentes do peer não se confundem
+        # num registro antigo (réplica ou disco) que o tracker ainda tenha.
+        self.versao = random.getrandbits(32) << 20
+        self.alteracoes = collections.deque(maxlen=MAX_HISTORICO_REGISTRO)
+        self.confirmada = None
+        self.lock = threading.Lock()
+
+    def registrar(self, adicionados=(), removidos=()):
+        adicionados, removidos = list(adicionados), list(removidos)
+        if not adicionados and not removidos:
+            return
+        with self.lock:
+            self.versao += 1
+            self.alteracoes.append((self.versao, adicionados, removidos))
+
+    def confirmar(self, epoca, versao):
+        with self.lock:
+            self.confirmada = (epoca, versao)
+
+    def _desde(self, base):
+        if base == self.versao:
+            return base, base, [], []
+        if base is None or base > self.versao or not self.alteracoes or self.alteracoes[0][0] > base + 1:
+            return None
+        presentes = {}
+        for versao, adicionados, removidos in self.alteracoes:
+            if versao <= base:
+                continue
+            for filename in removidos:
+                presentes[filename] = False
+            for filename in adicionados:
+                presentes[filename] = True
+        return (base, self.versao,
+                [f for f, presente in presentes.items() if presente],
+                [f for f, presente in presentes.items() if not presente])
+
+    def delta(self, epoca):
+        # Retorna (versao_base, versao, adicionados, removidos) desde a última versão confirmada
+        # nesta época, ou None se for preciso enviar a lista completa.
+        with self.lock:
+            if self.confirmada is None or self.confirmada[0] != epoca:
+                return None
+            return self._desde(self.confirmada[1])
+
+    def desde(self, base):
+        # Como delta, mas a partir de uma versão informada pelo tracker (ex.: a do registro replicado).
+        with self.lock:
+            return self._desde(base)
+
+class ReplicacaoRegistro:
+    # Log das alterações do registro do tracker (numeradas por seq) e a seq que cada peer
+    # em espera já aplicou. Quem fica para trás do log recebe o registro completo.
+    def __init__(self, maximo=MAX_OPERACOES_REPLICACAO):
+        self.seq = 0
+        self.operacoes = collections.deque(maxlen=maximo)
+        self.standbys = {}
+        self.evento = threading.Event()
+        self.lock = threading.Lock()
+
+    def registrar(self, operacao):
+        with self.lock:
+            self.seq += 1
+            self.operacoes.append((self.seq, operacao))
+        self.evento.set()
+
+    def reiniciar(self):
+        with self.lock:
+            self.seq = 0
+            self.operacoes.clear()
+            self.standbys = {}
+
+    def desde(self, seq):
+        # (seq atual, operações posteriores a seq), ou None se o log já as descartou.
+        with self.lock:
+            if seq == self.seq:
+                return seq, []
+            if seq > self.seq or not self.operacoes or self.operacoes[0][0] > seq + 1:
+                return None
+            return self.seq, [operacao for s, operacao in self.operacoes if s > seq]
+
+    def escolher(self, candidatos, quantidade):
+        # Mantém os standbys atuais que continuam ativos e completa com peers sorteados.
+        with self.lock:
+            escolhidos = [uri for uri in self.standbys if uri in candidatos][:quantidade]
+            livres = [uri for uri in candidatos if uri not in escolhidos]
+            escolhidos += random.sample(livres, min(len(livres), quantidade - len(escolhidos)))
+            self.standbys = {uri: self.standbys.get(uri) for uri in escolhidos}
+            return escolhidos
+
+    def confirmar(self, uri, seq):
+        with self.lock:
+            if uri in self.standbys:
+                self.standbys[uri] = seq
+
+def limpar_registro(peer):
+    peer.file_registry = {}
+    peer.file_digests = {}
+    peer.registry_versions = {}
+    peer.file_index.limpar()
+
+def aplicar_operacao_registro(peer, operacao):
+    # Aplica uma alteração ao registro do tracker (ou à réplica de um standby).
+    # Quem chama segura peer.registry_lock.
+    tipo, peer_id = operacao[0], operacao[1]
+    if tipo == "completo":
+        novos, digests, versao = set(operacao[2]), operacao[3], operacao[4]
+        antigos = peer.file_registry.get(peer_id, set())
+        peer.file_index.atualizar(peer_id, novos - antigos, antigos - novos)
+        peer.file_registry[peer_id] = novos
+        peer.file_digests[peer_id] = dict(digests or {})
+        peer.registry_versions[peer_id] = versao
+    elif tipo == "delta":
+        adicionados, removidos, digests, versao = operacao[2:]
+        files = peer.file_registry.setdefault(peer_id, set())
+        peer_digests = peer.file_digests.setdefault(peer_id, {})
+        removidos = [f for f in removidos if f in files]
+        adicionados = [f for f in adicionados if f not in files]
+        files.difference_update(removidos)
+        files.update(adicionados)
+        peer.file_index.atualizar(peer_id, adicionados, removidos)
+        for filename in removidos:
+            peer_digests.pop(filename, None)
+        peer_digests.update(digests or {})
+        peer.registry_versions[peer_id] = versao
+    elif tipo == "remover":
+        peer.file_index.atualizar(peer_id, removidos=peer.file_registry.pop(peer_id, ()))
+        peer.file_digests.pop(peer_id, None)
+        peer.registry_versions.pop(peer_id, None)
+
+def alterar_registro(peer, operacao):
+    # No tracker: aplica a alteração e a coloca nos logs de replicação e em disco. Segura peer.registry_lock.
+    aplicar_operacao_registro(peer, operacao)
+    peer.replicacao.registrar(operacao)
+    peer.persistencia.registrar(operacao)
+
+def instantaneo_registro(peer):
+    # O registro inteiro como operações "completo", para um standby novo ou atrasado.
+    return [("completo", pid, sorted(files), peer.file_digests.get(pid, {}), peer.registry_versions.get(pid))
+            for pid, files in peer.file_registry.items()]
+
+class PersistenciaRegistro:
+    # Registro do tracker em disco: um instantâneo (JSON) e um log só de acréscimos com as
+    # operações posteriores a ele, uma por linha. Cada operação tem uma seq; a compactação
+    # troca o log por um novo antes de gravar o instantâneo, e quem carrega ignora as
+    # operações que o instantâneo já contém, então uma queda no meio não perde nem repete nada.
+    def __init__(self, caminho_base, ativo=None):
+        self.caminho = caminho_base + ".json"
+        self.caminho_log = caminho_base + ".log"
+        self.caminho_log_antigo = caminho_base + ".log.antigo"
+        self.ativo = ativo
+        self.seq = 0
+        self.entradas_log = 0
+        self.ultimo_instantaneo = time.monotonic()
+        self.compactacao_pedida = False
+        self.arquivo_log = None
+        self.lock = threading.Lock()
+
+    def _ativa(self):
+        return PERSISTENCIA_REGISTRO_ATIVA if self.ativo is None else self.ativo
+
+    @staticmethod
+    def _ler_log(caminho, seq_minima):
+        operacoes = []
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    try:
+                        seq, operacao = json.loads(linha)
+                    except ValueError:
+                        # Linha cortada por uma queda durante a escrita.
+                        continue
+                    if seq > seq_minima:
+                        operacoes.append((seq, operacao))
+        except OSError:
+            pass
+        return operacoes
+
+    def carregar(self):
+        # Retorna (época, operações) do instantâneo mais o log; (None, []) se não houver estado.
+        if not self._ativa():
+            return None, []
+        epoca, seq, operacoes = None, 0, []
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            epoca, seq, operacoes = dados["epoca"], dados["seq"], dados["registro"]
+        except (OSError, ValueError, KeyError):
+            pass
+        posteriores = self._ler_log(self.caminho_log_antigo, seq) + self._ler_log(self.caminho_log, seq)
+        with self.lock:
+            self.seq = max([seq] + [s for s, _ in posteriores])
+        return epoca, operacoes + [operacao for _, operacao in posteriores]
+
+    @staticmethod
+    def _abrir_log(caminho):
+        # Abre para acréscimo; se a última linha ficou cortada, a próxima começa numa linha nova.
+        cortada = False
+        with contextlib.suppress(OSError):
+            with open(caminho, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                cortada = f.read(1) != b"\n"
+        arquivo = open(caminho, 'a', encoding='utf-8')
+        if cortada:
+            arquivo.write("\n")
+        return arquivo
+
+    def registrar(self, operacao):
+        if not self._ativa():
+            return
+        with self.lock:
+            if self.arquivo_log is None:
+                self.arquivo_log = self._abrir_log(self.caminho_log)
+            self.seq += 1
+            self.arquivo_log.write(json.dumps([self.seq, operacao], separators=(",", ":")) + "\n")
+            self.arquivo_log.flush()
+            self.entradas_log += 1
+
+    def pedir_compactacao(self):
+        # A próxima rodada do loop de replicação grava um instantâneo mesmo sem log acumulado.
+        self.compactacao_pedida = True
+
+    def precisa_compactar(self):
+        return self._ativa() and (self.compactacao_pedida or self.entradas_log >= MAX_ENTRADAS_LOG_REGISTRO or
+                                  (self.entradas_log > 0 and
+                                   time.monotonic() - self.ultimo_instantaneo >= INTERVALO_INSTANTANEO_REGISTRO))
+
+    def rotacionar(self):
+        # Chamado junto com a cópia do registro (sob registry_lock): as próximas operações vão
+        # para um log novo. Retorna a seq que o instantâneo vai cobrir.
+        with self.lock:
+            if self.arquivo_log is not None:
+                self.arquivo_log.close()
+                self.arquivo_log = None
+            if os.path.exists(self.caminho_log_antigo):
+                # Sobra de uma compactação interrompida, ainda não coberta por um instantâneo.
+                with contextlib.suppress(FileNotFoundError):
+                    with open(self.caminho_log, 'r', encoding='utf-8') as origem, \
+                            self._abrir_log(self.caminho_log_antigo) as destino:
+                        destino.writelines(origem)
+                    os.remove(self.caminho_log)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.replace(self.caminho_log, self.caminho_log_antigo)
+            self.entradas_log = 0
+            self.compactacao_pedida = False
+            return self.seq
+
+    def gravar_instantaneo(self, epoca, seq, operacoes):
+        temp_path = self.caminho + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"epoca": epoca, "seq": seq, "registro": operacoes}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.caminho)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.caminho_log_antigo)
+        self.ultimo_instantaneo = time.monotonic()
+
+    def fechar(self):
+        with self.lock:
+            if self.arquivo_log is not None:
+                self.arquivo_log.close()
+                self.arquivo_log = None
+
+def compactar_registro(peer):
+    # Grava o registro atual como instantâneo e descarta o log que ele substitui.
+    persistencia = peer.persistencia
+    if not persistencia._ativa():
+        return
+    inicio = time.perf_counter()
+    with peer.registry_lock:
+        operacoes = instantaneo_registro(peer)
+        seq = persistencia.rotacionar()
+    persistencia.gravar_instantaneo(peer.epoca, seq, operacoes)
+    peer.metricas.observar("compactar_registro", time.perf_counter() - inicio)
+
+def carregar_registro(peer):
+    # Aplica o registro salvo em disco (de quando este peer já foi tracker); quem chama
+    # segura registry_lock. Retorna a época salva, ou None se não havia nada.
+    inicio = time.perf_counter()
+    epoca, operacoes = peer.persistencia.carregar()
+    for operacao in operacoes:
+        aplicar_operacao_registro(peer, operacao)
+    peer.metricas.observar("carregar_registro", time.perf_counter() - inicio)
+    return epoca if operacoes else None
+
+def enviar_replica(peer, uri, timeout=PRAZO_RODADA_HEARTBEAT):
+    # Envia ao standby só as operações que ele ainda não aplicou; se ele estiver sem réplica,
+    # em outra época ou atrás do que o log ainda guarda, envia o registro completo.
+    replicacao = peer.replicacao
+    base = replicacao.standbys.get(uri)
+    pendente = None if base is None else replicacao.desde(base)
+    if pendente is not None and pendente[0] == base:
+        return True
+    with peer.proxies.proxy(uri, timeout) as standby:
+        if pendente is not None:
+            seq, operacoes = pendente
+            resposta = standby.replicar_registro(peer.epoca, base, seq, operacoes)
+            if resposta["ok"]:
+                replicacao.confirmar(uri, seq)
+                return True
+            if not resposta["resync"]:
+                return False
+        with peer.registry_lock:
+            seq = replicacao.seq
+            operacoes = instantaneo_registro(peer)
+        resposta = standby.replicar_registro(peer.epoca, None, seq, operacoes)
+        if resposta["ok"]:
+            replicacao.confirmar(uri, seq)
+            peer.metricas.contar("replicas_completas")
+        return resposta["ok"]
+
+def replicar_para_standbys(peer, quantidade=None):
+    # Uma rodada de replicação do tracker para até 'quantidade' peers em espera.
+    peer.replicacao.evento.clear()
+    quantidade = REPLICAS_STANDBY if quantidade is None else quantidade
+    if quantidade <= 0:
+        return
+    candidatos = [str(uri) for _, uri in peer.listar_peers_ativos()]
+    for uri in peer.replicacao.escolher(candidatos, quantidade):
+        try:
+            enviar_replica(peer, uri)
+        except Exception as e:
+            peer.metricas.contar("replicacao_erros")
+            log.debug("Tracker (Peer %s): Falha ao replicar o registro para %s: %s", peer.peer_id, uri, e)
+
+def aplicar_replica(peer, epoca, seq_base, seq, operacoes):
+    # Lado do standby: aplica as operações se partirem da seq que ele tem (ou do zero, com seq_base None).
+    with peer.registry_lock:
+        if peer.is_tracker or epoca < peer.epoca:
+            return {"ok": False, "resync": False}
+        if seq_base is None:
+            limpar_registro(peer)
+        elif peer.replica != (epoca, seq_base):
+            return {"ok": False, "resync": True}
+        for operacao in operacoes:
+            aplicar_operacao_registro(peer, operacao)
+        peer.replica = (epoca, seq)
+    # Com o registro em mãos, o standby é quem deve assumir primeiro se o tracker cair.
+    peer.detector.priorizar(FATOR_TIMEOUT_STANDBY)
+    return {"ok": True, "resync": False}
+
+def descartar_replica_antiga(peer, epoca):
+    # Uma réplica de época anterior à observada já não é o registro do tracker atual: não pode
+    # ser promovida por um become_tracker futuro, e a prioridade de standby deixa de valer.
+    replica = peer.replica
+    if replica is not None and replica[0] < epoca:
+        with peer.registry_lock:
+            if peer.replica is not None and peer.replica[0] < epoca:
+                peer.replica = None
+                limpar_registro(peer)
+    if peer.replica is None:
+        peer.detector.priorizar(1.0)
+
+def puxar_registro(tracker, peer_id, remoto, epoca):
+    # Com uma versão já conhecida (registro replicado), o peer só manda o que mudou desde ela.
+    versao = tracker.registry_versions.get(peer_id)
+    registro = remoto.get_registro_completo(epoca, versao)
+    if "arquivos" not in registro:
+        resposta = tracker.aplicar_delta_registro(peer_id, registro["base"], registro["versao"], registro["adicionados"],
+                                                  registro["removidos"], registro["digests"])
+        if resposta["ok"]:
+            return
+        registro = remoto.get_registro_completo(epoca)
+    tracker.atualizar_registro_arquivos(peer_id, registro["arquivos"], registro["digests"], registro["versao"])
+
+def registro_para(historico, epoca, versao, files, digests):
+    # Resposta de get_registro_completo: delta desde 'versao', se possível, senão a lista completa.
+    delta = None if versao is None else historico.desde(versao)
+    if delta is not None:
+        base, atual, adicionados, removidos = delta
+        registro = {"base": base, "versao": atual, "adicionados": adicionados, "removidos": removidos,
+                    "digests": {f: digests[f] for f in adicionados if f in digests}}
+    else:
+        atual = historico.versao
+        registro = {"versao": atual, "arquivos": list(files), "digests": dict(digests)}
+    if epoca is not None:
+        historico.confirmar(epoca, atual)
+    return registro
+
+def _registrar_coleta(tracker, inicio, total, pendentes):
+    duracao = time.perf_counter() - inicio
+    tracker.metricas.observar("reconstrucao_registro", duracao)
+    log.info("Tracker (Peer %s): Registro reconstruído em %.3fs (%s de %s peers; %s a tentar de novo).",
+             tracker.peer_id, duracao, total - len(pendentes), total, len(pendentes))
+
+def coletar_registros(tracker, active_peers, puxar):
+    # Puxa o registro de todos os peers ao mesmo tempo (até MAX_WORKERS_COLETA por vez); cada
+    # resposta entra no índice assim que chega, e um peer lento só ocupa um worker até o prazo.
+    # puxar(name, uri) retorna False em caso de falha; quem falhou é tentado de novo com espera
+    # crescente, enquanto ainda estiver no serviço de nomes. Retorna os que nunca responderam.
+    inicio = time.perf_counter()
+    pendentes = list(active_peers)
+    espera = ESPERA_RETENTATIVA_COLETA
+    if not pendentes:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(pendentes), MAX_WORKERS_COLETA)) as pool:
+        for tentativa in range(TENTATIVAS_COLETA):
+            if tentativa:
+                time.sleep(espera)
+                espera *= 2
+                ativos = {name for name, _ in tracker.listar_peers_ativos()}
+                pendentes = [(name, uri) for name, uri in pendentes if name in ativos]
+            if not tracker.is_tracker or not pendentes:
+                break
+            resultados = list(pool.map(lambda peer: puxar(*peer), pendentes))
+            pendentes = [peer for peer, ok in zip(pendentes, resultados) if not ok]
+            if tentativa == 0:
+                _registrar_coleta(tracker, inicio, len(active_peers), pendentes)
+    tracker.metricas.contar("coleta_registro_desistencias", len(pendentes))
+    return pendentes
+
+async def coletar_registros_async(runtime, tracker, active_peers, puxar):
+    # Versão de coletar_registros para o runtime asyncio: os pedidos usam o pool do runtime,
+    # limitados por um semáforo, e as esperas entre tentativas não prendem threads.
+    limite = asyncio.Semaphore(MAX_WORKERS_COLETA)
+
+    async def pedir(name, uri):
+        async with limite:
+            return await runtime.executar(puxar, name, uri)
+
+    inicio = time.perf_counter()
+    pendentes = list(active_peers)
+    espera = ESPERA_RETENTATIVA_COLETA
+    if not pendentes:
+        return []
+    for tentativa in range(TENTATIVAS_COLETA):
+        if tentativa:
+            await asyncio.sleep(espera)
+            espera *= 2
+            ativos = {name for name, _ in await runtime.executar(tracker.listar_peers_ativos)}
+            pendentes = [(name, uri) for name, uri in pendentes if name in ativos]
+        if not tracker.is_tracker or not pendentes:
+            break
+        resultados = await asyncio.gather(*(pedir(name, uri) for name, uri in pendentes), return_exceptions=True)
+        pendentes = [peer for peer, ok in zip(pendentes, resultados) if ok is not True]
+        if tentativa == 0:
+            _registrar_coleta(tracker, inicio, len(active_peers), pendentes)
+    tracker.metricas.contar("coleta_registro_desistencias", len(pendentes))
+    return pendentes
+
+def podar_registro(peer, ativos):
+    # Descarta do registro (replicado) os peers que já não estão no serviço de nomes.
+    with peer.registry_lock:
+        for pid in [pid for pid in peer.file_registry if pid not in ativos and pid != peer.peer_id]:
+            alterar_registro(peer, ("remover", pid))
+
+def enviar_registro(tracker, peer_id, historico, epoca, files, digests):
+    # Envia só o delta desde a versão confirmada; a lista completa vai quando o tracker
+    # pede ressincronização (versão diferente da esperada ou nova época).
+    delta = historico.delta(epoca)
+    if delta is not None:
+        base, versao, adicionados, removidos = delta
+        if base == versao:
+            return True
+        resposta = tracker.aplicar_delta_registro(peer_id, base, versao, adicionados, removidos,
+                                                  {f: digests[f] for f in adicionados if f in digests})
+        if resposta["ok"]:
+            historico.confirmar(epoca, versao)
+            return True
+        if not resposta["resync"]:
+            return False
+    # A versão é lida antes da lista: uma alteração concorrente só será reenviada (de forma idempotente).
+    versao = historico.versao
+    if tracker.atualizar_registro_arquivos(peer_id, list(files), dict(digests), versao):
+        historico.confirmar(epoca, versao)
+        return True
+    return False
+
+def difundir_heartbeat(pool, pendentes, destinos, enviar, prazo=PRAZO_RODADA_HEARTBEAT):
+    # Dispara enviar(destino) para todos os destinos e espera no máximo 'prazo' segundos.
+    # Um destino cujo envio da rodada anterior ainda não terminou é pulado, para que
+    # peers mortos não acumulem tarefas no pool.
+    futuros = []
+    for destino in destinos:
+        anterior = pendentes.get(destino)
+        if anterior is not None and not anterior.done():
+            continue
+        pendentes[destino] = pool.submit(enviar, destino)
+        futuros.append(pendentes[destino])
+    for destino in [d for d, futuro in pendentes.items() if d not in destinos and futuro.done()]:
+        del pendentes[destino]
+    concluidos, _ = wait(futuros, timeout=prazo)
+    return sum(1 for futuro in concluidos if futuro.exception() is None and futuro.result())
+
+class DetectorFalhas:
+    # Detector de falha orientado a prazo: a thread de monitoramento dorme até o prazo expirar
+    # e cada heartbeat rearma o prazo. O prazo acompanha a distribuição dos intervalos entre
+    # heartbeats (suspeita no estilo phi-accrual), mas nunca fica abaixo de timeout_minimo.
+    # Cada detector sorteia um espalhamento para que os peers não expirem todos juntos.
+    def __init__(self, timeout_minimo, limiar=LIMIAR_SUSPEITA, janela=JANELA_HEARTBEATS):
+        self.timeout_minimo = timeout_minimo
+        self.z = NormalDist().inv_cdf(1 - 10 ** -limiar)
+        self.espalhamento = 1.0 + random.uniform(0, ESPALHAMENTO_TIMEOUT)
+        self.fator = 1.0
+        self.intervalos = collections.deque(maxlen=janela)
+        self.ultimo = time.monotonic()
+        self.amostrar = False
+        self.parado = False
+        self.despertar = None
+        self.cond = threading.Condition()
+
+    def heartbeat(self):
+        with self.cond:
+            agora = time.monotonic()
+            if self.amostrar:
+                self.intervalos.append(agora - self.ultimo)
+            self.ultimo = agora
+            self.amostrar = True
+            self.cond.notify_all()
+
+    def rearmar(self, timeout_minimo=None):
+        # Reinicia o prazo sem contar o intervalo como amostra (ex.: novo tracker encontrado).
+        with self.cond:
+            if timeout_minimo is not None:
+                self.timeout_minimo = timeout_minimo
+            self.ultimo = time.monotonic()
+            self.amostrar = False
+            self.cond.notify_all()
+        if self.despertar is not None:
+            self.despertar()
+
+    def priorizar(self, fator):
+        # Fator < 1 faz este peer expirar (e se candidatar) antes dos outros; 1.0 desfaz.
+        with self.cond:
+            if fator != self.fator:
+                self.fator = fator
+                self.cond.notify_all()
+
+    def parar(self):
+        with self.cond:
+            self.parado = True
+            self.cond.notify_all()
+        if self.despertar is not None:
+            self.despertar()
+
+    def _distribuicao(self):
+        if len(self.intervalos) < MIN_AMOSTRAS_SUSPEITA:
+            return None
+        media = fmean(self.intervalos)
+        desvio = max(pstdev(self.intervalos, media), media * DESVIO_MINIMO_RELATIVO, 1e-3)
+        return NormalDist(media, desvio)
+
+    def timeout(self):
+        with self.cond:
+            distribuicao = self._distribuicao()
+            if distribuicao is None:
+                return self.timeout_minimo * self.fator
+            adaptado = (distribuicao.mean + self.z * distribuicao.stdev) * self.espalhamento
+            return max(self.timeout_minimo, adaptado) * self.fator
+
+    def restante(self):
+        # Segundos até o prazo atual expirar (negativo se já expirou).
+        with self.cond:
+            return self.ultimo + self.timeout() - time.monotonic()
+
+    def suspeita(self):
+        # phi = -log10(probabilidade de o próximo heartbeat ainda chegar depois de tanto tempo).
+        with self.cond:
+            decorrido = time.monotonic() - self.ultimo
+            distribuicao = self._distribuicao()
+            if distribuicao is None:
+                return 0.0 if decorrido < self.timeout_minimo else math.inf
+            restante = 1.0 - distribuicao.cdf(decorrido)
+            return max(0.0, -math.log10(restante)) if restante > 0 else math.inf
+
+    def aguardar_expiracao(self, ativo):
+        # Bloqueia até o prazo expirar enquanto ativo() for verdadeiro (retorna True)
+        # ou até o detector ser parado (retorna False).
+        with self.cond:
+            while not self.parado:
+                if not ativo():
+                    # Nada a monitorar (somos o tracker ou ainda não há um): espera ser rearmado.
+                    self.cond.wait(self.timeout_minimo)
+                    continue
+                restante = self.restante()
+                if restante <= 0:
+                    return True
+                self.cond.wait(restante)
+            return False
+
+class MapaArquivo:
+    # mmap somente leitura de um arquivo compartilhado, com o arquivo aberto. Cada leitura
+    # confere (fstat) se o arquivo ainda tem o tamanho e o mtime do mapeamento: ler páginas
+    # de um arquivo truncado no lugar mata o processo com SIGBUS, e com ele todos os peers
+    # hospedados. Se o arquivo mudou, a leitura vai ao arquivo atual com os.pread.
+    def __init__(self, filepath):
+        self.arquivo = open(filepath, 'rb', buffering=0)
+        st = os.fstat(self.arquivo.fileno())
+        self.chave = (st.st_ino, st.st_size, st.st_mtime_ns)
+        # mmap não mapeia arquivos vazios
+        self.mapa = mmap.mmap(self.arquivo.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else None
+
+    def _intacto(self, st):
+        return self.mapa is not None and (st.st_size, st.st_mtime_ns) == self.chave[1:]
+
+    def __len__(self):
+        return os.fstat(self.arquivo.fileno()).st_size
+
+    def ler(self, inicio, fim):
+        st = os.fstat(self.arquivo.fileno())
+        if self._intacto(st):
+            return self.mapa[inicio:fim]
+        return os.pread(self.arquivo.fileno(), max(0, min(fim, st.st_size) - inicio), inicio)
+
+class ArquivosMapeados:
+    # Mapeamentos mmap somente leitura dos arquivos compartilhados, reaproveitados por todos
+    # os envios enquanto o arquivo não mudar: os blocos saem direto do cache de páginas, sem
+    # abrir/posicionar/ler o arquivo a cada pedido. Um mapeamento descartado continua válido
+    # para os envios em andamento (que guardam a referência). Arquivos substituídos com
+    # os.replace, como nos downloads, seguem lidos do mapeamento antigo; um arquivo alterado
+    # no lugar ganha um mapeamento novo no próximo pedido, e os envios em andamento passam
+    # a ler dele com os.pread (ver MapaArquivo).
+    def __init__(self, maximo=MAX_ARQUIVOS_MAPEADOS):
+        self.maximo = maximo
+        self.mapas = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def abrir(self, filepath):
+        st = os.stat(filepath)
+        chave = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.lock:
+            atual = self.mapas.get(filepath)
+            if atual is not None and atual[0] == chave:
+                self.mapas.move_to_end(filepath)
+                return atual[1]
+        mapa = MapaArquivo(filepath)
+        with self.lock:
+            self.mapas[filepath] = (chave, mapa)
+            self.mapas.move_to_end(filepath)
+            while len(self.mapas) > self.maximo:
+                self.mapas.popitem(last=False)
+        return mapa
+
+arquivos_mapeados = ArquivosMapeados()
+
+class CanalDados:
+    # Servidor TCP para o conteúdo dos arquivos, um por daemon Pyro. O downloader reserva um
+    # intervalo com Peer.reservar_envio (uma chamada Pyro curta) e recebe um ticket; depois
+    # conecta aqui, envia o ticket e recebe o tamanho (8 bytes) seguido dos dados, copiados
+    # pelo kernel com sendfile. Assim as transferências não ocupam as threads do daemon nem
+    # passam pelo serializador, e heartbeats e votos não esperam atrás delas.
+    def __init__(self, host, familia=socket.AF_INET, max_conexoes=MAX_CONEXOES_DADOS):
+        self.sock = socket.create_server((host, 0), family=familia)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TAMANHO_BUFFER_DADOS)
+        self.host, self.porta = self.sock.getsockname()[:2]
+        self.tickets = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_conexoes, thread_name_prefix="canal-dados")
+        self.fechado = False
+        threading.Thread(target=self._aceitar, daemon=True).start()
+
+    def reservar(self, filepath, offset, tamanho, metricas=None, compressao=None, tamanho_bloco=TAMANHO_BLOCO):
+        agora = time.monotonic()
+        ticket = secrets.token_hex(TAMANHO_TICKET // 2)
+        tamanho_bloco = min(int(tamanho_bloco), TAMANHO_MAXIMO_BLOCO)
+        with self.lock:
+            for antigo in [t for t, r in self.tickets.items() if r[3] < agora]:
+                del self.tickets[antigo]
+            self.tickets[ticket] = (filepath, max(0, int(offset)), tamanho, agora + VALIDADE_TICKET, metricas,
+                                    compressao, tamanho_bloco)
+        return {"host": self.host, "porta": self.porta, "ticket": ticket, "compressao": compressao}
+
+    def _aceitar(self):
+        while not self.fechado:
+            try:
+                conexao, _ = self.sock.accept()
+            except OSError:
+                return
+            self.pool.submit(self._atender, conexao)
+
+    def _atender(self, conexao):
+        with conexao:
+            try:
+                conexao.settimeout(TIMEOUT_PECA)
+                ticket = receber_exato(conexao, TAMANHO_TICKET).decode("ascii", "replace")
+                with self.lock:
+                    reserva = self.tickets.pop(ticket, None)
+                if reserva is None or reserva[3] < time.monotonic():
+                    return
+                filepath, offset, tamanho, _, metricas, compressao, tamanho_bloco = reserva
+                conexao.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TAMANHO_BUFFER_DADOS)
+                if compressao:
+                    self._enviar_comprimido(conexao, filepath, offset, tamanho, metricas, compressao, tamanho_bloco)
+                    return
+                with open(filepath, 'rb') as f:
+                    disponivel = max(0, os.fstat(f.fileno()).st_size - offset)
+                    total = disponivel if tamanho is None else min(int(tamanho), disponivel)
+                    conexao.sendall(struct.pack("!Q", total))
+                    enviados = conexao.sendfile(f, offset, total) if total else 0
+                if metricas is not None:
+                    metricas.contar("bytes_enviados", enviados)
+            except OSError as e:
+                log.warning("Canal de dados: Falha ao enviar: %s", e)
+
+    def _enviar_comprimido(self, conexao, filepath, offset, tamanho, metricas, compressao, tamanho_bloco):
+        mapa = arquivos_mapeados.abrir(filepath)
+        disponivel = max(0, len(mapa) - offset)
+        total = disponivel if tamanho is None else min(int(tamanho), disponivel)
+        conexao.sendall(struct.pack("!Q", total))
+        for algoritmo, dados in blocos_arquivo(mapa, offset, total, tamanho_bloco, compressao, metricas or Metricas(False)):
+            conexao.sendall(struct.pack("!BI", 1 if algoritmo else 0, len(dados)))
+            conexao.sendall(dados)
+
+    def fechar(self):
+        self.fechado = True
+        with contextlib.suppress(OSError):
+            self.sock.close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+canais_dados = weakref.WeakKeyDictionary()
+canais_lock = threading.Lock()
+
+def canal_dados(daemon):
+    # Canal de dados do daemon, criado no primeiro uso na mesma interface em que o daemon escuta.
+    with canais_lock:
+        canal = canais_dados.get(daemon)
+        if canal is None:
+            canal = canais_dados[daemon] = CanalDados(daemon.sock.getsockname()[0], daemon.sock.family)
+        return canal
+
+def fechar_canal_dados(daemon):
+    with canais_lock:
+        canal = canais_dados.pop(daemon, None)
+    if canal is not None:
+        canal.fechar()
+
+class HashCache:
+    # Cache em disco dos digests, indexado por (caminho, tamanho, mtime).
+    def __init__(self, caminho, tamanho_peca=TAMANHO_BLOCO):
+        self.caminho = caminho
+        self.tamanho_peca = tamanho_peca
+        self.entradas = {}
+        self.alterado = False
+        self.lock = threading.Lock()
+        self._carregar()
+
+    def _carregar(self):
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            if dados.get("tamanho_peca") == self.tamanho_peca:
+                self.entradas = dados.get("arquivos", {})
+        except (OSError, ValueError):
+            self.entradas = {}
+
+    def salvar(self):
+        with self.lock:
+            if not self.alterado:
+                return
+            temp_path = self.caminho + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"tamanho_peca": self.tamanho_peca, "arquivos": self.entradas}, f)
+            os.replace(temp_path, self.caminho)
+            self.alterado = False
+
+    def digest(self, filepath):
+        st = os.stat(filepath)
+        with self.lock:
+            entrada = self.entradas.get(filepath)
+            if entrada and entrada["tamanho"] == st.st_size and entrada["mtime"] == st.st_mtime_ns:
+                return {k: v for k, v in entrada.items() if k != "mtime"}
+        digest = calcular_digest(filepath, self.tamanho_peca)
+        self.registrar(filepath, digest, st)
+        return digest
+
+    def registrar(self, filepath, digest, st=None):
+        st = st or os.stat(filepath)
+        with self.lock:
+            self.entradas[filepath] = dict(digest, mtime=st.st_mtime_ns)
+            self.alterado = True
+
+    def podar(self, caminhos):
+        caminhos = set(caminhos)
+        with self.lock:
+            for filepath in [c for c in self.entradas if c not in caminhos]:
+                del self.entradas[filepath]
+                self.alterado = True
+
+    def remover(self, caminhos):
+        with self.lock:
+            for filepath in caminhos:
+                if self.entradas.pop(filepath, None) is not None:
+                    self.alterado = True
+
+class Inotify:
+    # inotify(7) pela libc via ctypes; só existe no Linux (nos outros sistemas o construtor falha).
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    IN_ISDIR = 0x40000000
+    EVENTO = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            erro = ctypes.get_errno()
+            raise OSError(erro, os.strerror(erro))
+
+    def adicionar(self, caminho, mascara):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(caminho), mascara)
+        if wd < 0:
+            erro = ctypes.get_errno()
+            raise OSError(erro, os.strerror(erro), caminho)
+        return wd
+
+    def remover(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def ler(self):
+        # Retorna [(wd, mascara, nome)] dos eventos já disponíveis (sem bloquear).
+        try:
+            dados = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        eventos, posicao = [], 0
+        while posicao < len(dados):
+            wd, mascara, _, tamanho = self.EVENTO.unpack_from(dados, posicao)
+            posicao += self.EVENTO.size
+            nome = os.fsdecode(dados[posicao:posicao + tamanho].rstrip(b"\0"))
+            posicao += tamanho
+            eventos.append((wd, mascara, nome))
+        return eventos
+
+# Só arquivos prontos: fechados depois de escritos ou movidos para dentro (não IN_CREATE/IN_MODIFY,
+# que apontariam um arquivo ainda pela metade).
+MASCARA_INOTIFY = (Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO | Inotify.IN_MOVED_FROM | Inotify.IN_DELETE |
+                   Inotify.IN_ATTRIB | Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF | Inotify.IN_ONLYDIR)
+
+class DiretorioCompartilhado:
+    # Índice em memória do diretório compartilhado: nome -> (tamanho, mtime). Com inotify só os
+    # nomes apontados pelos eventos são consultados; sem ele, o diretório é varrido por inteiro a
+    # cada 'intervalo' e comparado com o índice.
+    def __init__(self, caminho, intervalo=INTERVALO_VARREDURA):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.entradas = {}
+        self.pendentes = set()
+        self.varredura_pendente = False
+        self.observado = False
+        self.wd = None
+        self.parado = False
+        self.despertar = None
+        self.evento = threading.Event()
+        self.lock = threading.Lock()
+
+    def varrer(self):
+        # Retorna (alterados, removidos) desde o último estado conhecido.
+        atuais = {}
+        with os.scandir(self.caminho) as entradas:
+            for entrada in entradas:
+                if arquivo_temporario(entrada.name):
+                    continue
+                try:
+                    if entrada.is_file():
+                        st = entrada.stat()
+                        atuais[entrada.name] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+        with self.lock:
+            alterados = [nome for nome, assinatura in atuais.items() if self.entradas.get(nome) != assinatura]
+            removidos = [nome for nome in self.entradas if nome not in atuais]
+            self.entradas = atuais
+        return alterados, removidos
+
+    def verificar(self, nomes):
+        # Como varrer, mas só para os nomes informados.
+        alterados, removidos = [], []
+        for nome in nomes:
+            if arquivo_temporario(nome):
+                continue
+            try:
+                st = os.stat(os.path.join(self.caminho, nome))
+                assinatura = (st.st_size, st.st_mtime_ns) if stat.S_ISREG(st.st_mode) else None
+            except OSError:
+                assinatura = None
+            with self.lock:
+                anterior = self.entradas.get(nome)
+                if assinatura is None:
+                    if anterior is not None:
+                        del self.entradas[nome]
+                        removidos.append(nome)
+                elif assinatura != anterior:
+                    self.entradas[nome] = assinatura
+                    alterados.append(nome)
+        return alterados, removidos
+
+    def notificar(self, nomes=None):
+        # Chamado pelo observador com os nomes alterados; None pede uma varredura completa.
+        with self.lock:
+            if nomes is None:
+                self.varredura_pendente = True
+            else:
+                self.pendentes.update(nomes)
+        self.evento.set()
+        if self.despertar is not None:
+            self.despertar()
+
+    def espera(self):
+        # Quanto esperar por eventos antes de coletar: sem inotify, até a próxima varredura.
+        return None if self.observado else self.intervalo
+
+    def coletar(self):
+        with self.lock:
+            completa = self.varredura_pendente or not self.observado
+            nomes, self.pendentes = self.pendentes, set()
+            self.varredura_pendente = False
+        if completa:
+            return self.varrer()
+        return self.verificar(nomes)
+
+    def aguardar(self):
+        # Bloqueia até haver alterações (ou até a próxima varredura) e retorna (alterados, removidos).
+        self.evento.wait(self.espera())
+        self.evento.clear()
+        if self.parado:
+            return [], []
+        if self.observado:
+            time.sleep(ATRASO_AGRUPAMENTO)
+        return self.coletar()
+
+    def parar(self):
+        self.parado = True
+        self.evento.set()
+        if self.despertar is not None:
+            self.despertar()
+
+class ObservadorArquivos:
+    # Um único inotify e uma thread para os diretórios compartilhados de todos os peers do
+    # processo. A thread só repassa os nomes alterados a cada diretório; quem aplica as
+    # alterações é o peer. Se o inotify não estiver disponível (ou faltar watch), o
+    # diretório fica na varredura periódica.
+    def __init__(self, ativo=None):
+        self.ativo = ativo
+        self.inotify = None
+        self.diretorios = {}
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def observar(self, diretorio):
+        diretorio.parado = False
+        ativo = OBSERVADOR_INOTIFY_ATIVO if self.ativo is None else self.ativo
+        with self.lock:
+            try:
+                if not ativo:
+                    raise OSError("inotify desativado")
+                if self.inotify is None:
+                    self.inotify = Inotify()
+                wd = self.inotify.adicionar(diretorio.caminho, MASCARA_INOTIFY)
+            except (OSError, AttributeError) as e:
+                log.info("Observador: %s será varrido a cada %ss (%s)", diretorio.caminho, diretorio.intervalo, e)
+                diretorio.observado = False
+                return False
+            self.diretorios[wd] = diretorio
+            diretorio.wd = wd
+            diretorio.observado = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="observador-arquivos", daemon=True)
+                self.thread.start()
+        # O que mudou entre a última varredura e o início do watch só aparece numa varredura completa.
+        diretorio.notificar()
+        return True
+
+    def cancelar(self, diretorio):
+        with self.lock:
+            if self.diretorios.get(diretorio.wd) is diretorio:
+                del self.diretorios[diretorio.wd]
+                self.inotify.remover(diretorio.wd)
+            diretorio.wd = None
+            diretorio.observado = False
+        diretorio.parar()
+
+    def _loop(self):
+        while True:
+            select.select([self.inotify.fd], [], [])
+            alterados = {}
+            for wd, mascara, nome in self.inotify.ler():
+                if mascara & Inotify.IN_Q_OVERFLOW:
+                    # Fila do kernel cheia: eventos perdidos, todos os diretórios são varridos de novo.
+                    with self.lock:
+                        for diretorio in self.diretorios.values():
+                            alterados[diretorio] = None
+                    continue
+                with self.lock:
+                    diretorio = self.diretorios.get(wd)
+                    if diretorio is None:
+                        continue
+                    if mascara & (Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF | Inotify.IN_IGNORED):
+                        # O próprio diretório sumiu: volta para a varredura periódica.
+                        del self.diretorios[wd]
+                        diretorio.wd = None
+                        diretorio.observado = False
+                        alterados[diretorio] = None
+                        continue
+                if mascara & Inotify.IN_ISDIR or not nome:
+                    continue
+                nomes = alterados.setdefault(diretorio, set())
+                if nomes is not None:
+                    nomes.add(nome)
+            for diretorio, nomes in alterados.items():
+                # O loop de um runtime já encerrado não pode mais ser acordado.
+                with contextlib.suppress(RuntimeError):
+                    diretorio.notificar(nomes)
+
+observador_arquivos = ObservadorArquivos()
+
+def atualizar_arquivos_locais(peer, alterados, removidos):
+    # Aplica a files/digests as alterações vistas no diretório compartilhado e as registra no
+    # histórico (o delta enviado ao tracker). Retorna True se algo mudou para o tracker.
+    novos = {}
+    for filename in alterados:
+        try:
+            novos[filename] = peer.hash_cache.digest(os.path.join(peer.shared_dir, filename))
+        except OSError as e:
+            # Removido entre o evento e o hash: a remoção chega no próximo evento.
+            log.warning("Peer %s: Erro ao calcular hash de %s: %s", peer.peer_id, filename, e)
+    peer.hash_cache.remover(os.path.join(peer.shared_dir, f) for f in removidos)
+    with peer.arquivos_lock:
+        # Cópias novas em vez de alterar no lugar: get_lista_arquivos e get_digests retornam as
+        # atuais sem lock, e elas podem estar sendo serializadas por outra thread.
+        digests = dict(peer.digests)
+        adicionados = [f for f, d in novos.items() if f not in digests or digests[f]["hash"] != d["hash"]]
+        removidos = [f for f in removidos if f in digests]
+        if adicionados or removidos:
+            for filename in removidos:
+                del digests[filename]
+            for filename in adicionados:
+                digests[filename] = novos[filename]
+            peer.digests = digests
+            peer.files = list(digests)
+            # Um arquivo alterado volta como adicionado, levando o digest novo ao tracker.
+            peer.historico.registrar(adicionados, removidos)
+    peer.hash_cache.salvar()
+    if adicionados or removidos:
+        peer.metricas.contar("arquivos_locais_alterados", len(adicionados) + len(removidos))
+        log.info("Peer %s: Diretório compartilhado alterado (+%s -%s arquivos)", peer.peer_id, len(adicionados), len(removidos))
+        return True
+    return False
+
+def observar_diretorio(peer):
+    # Thread do peer: aplica cada lote de alterações do diretório e envia o delta ao tracker.
+    observador_arquivos.observar(peer.diretorio)
+    while not peer.stop_threads:
+        try:
+            alterados, removidos = peer.diretorio.aguardar()
+            if (alterados or removidos) and atualizar_arquivos_locais(peer, alterados, removidos):
+                peer.notificar_arquivos_tracker()
+        except Exception as e:
+            log.error("Peer %s: Erro ao observar %s: %s", peer.peer_id, peer.shared_dir, e)
+            time.sleep(peer.diretorio.intervalo)
+
+def solicitar_votos(proxies, active_peers, candidate_id, epoca, votos, votes_needed, prazo=PRAZO_ELEICAO):
+    # Pede votos a todos os peers ao mesmo tempo e retorna assim que o quórum é atingido,
+    # sem esperar peers lentos ou mortos (que ficam limitados ao prazo da eleição).
+    def pedir(uri):
+        with proxies.proxy(uri, prazo) as remote_peer:
+            return remote_peer.request_vote(candidate_id, epoca)
+
+    if len(votos) >= votes_needed or not active_peers:
+        return votos
+    pool = ThreadPoolExecutor(max_workers=min(len(active_peers), MAX_WORKERS_VOTOS))
+    futuros = {pool.submit(pedir, uri): name for name, uri in active_peers}
+    try:
+        for futuro in as_completed(futuros, timeout=prazo):
+            name = futuros[futuro]
+            try:
+                if futuro.result():
+                    votos.add(name.split('_')[-1])
+            except Exception as e:
+                log.warning("Peer %s: Falha ao pedir voto para %s: %s", candidate_id, name, e)
+            if len(votos) >= votes_needed:
+                break
+    except FuturesTimeoutError:
+        log.warning("Peer %s: Prazo da eleição esgotado com %s votos.", candidate_id, len(votos))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return votos
+
+async def solicitar_votos_async(runtime, proxies, active_peers, candidate_id, epoca, votos, votes_needed,
+                                prazo=PRAZO_ELEICAO):
+    # Versão de solicitar_votos para o runtime asyncio: os pedidos usam o pool do runtime
+    # em vez de um pool de threads por eleição.
+    def pedir(name, uri):
+        try:
+            with proxies.proxy(uri, prazo) as remote_peer:
+                return name if remote_peer.request_vote(candidate_id, epoca) else None
+        except Exception as e:
+            log.warning("Peer %s: Falha ao pedir voto para %s: %s", candidate_id, name, e)
+            return None
+
+    if len(votos) >= votes_needed or not active_peers:
+        return votos
+    futuros = [runtime.executar(pedir, name, uri) for name, uri in active_peers]
+    try:
+        for proximo in asyncio.as_completed(futuros, timeout=prazo):
+            name = await proximo
+            if name is not None:
+                votos.add(name.split('_')[-1])
+            if len(votos) >= votes_needed:
+                break
+    except asyncio.TimeoutError:
+        log.warning("Peer %s: Prazo da eleição esgotado com %s votos.", candidate_id, len(votos))
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+    return votos
 
 class ElectionManager:
     def __init__(self, peer):
@@ -19,40 +1993,49 @@ class ElectionManager:
             self.epoca = epoca
 
     def inicia_election(self):
+        epoca = self.abrir_eleicao()
+        if epoca is None:
+            return
+        inicio = time.perf_counter()
+        active_peers = self.peer.listar_peers_ativos()
+        votes_needed = (len(active_peers) + 1) // 2 + 1
+        solicitar_votos(self.peer.proxies, active_peers, self.peer.peer_id, epoca,
+                        self.votes_received, votes_needed)
+        self.concluir_eleicao(epoca, inicio, votes_needed)
+
+    def abrir_eleicao(self):
+        # Retorna a época da nova eleição, ou None se já houver uma em andamento.
         with self.lock:
             if self.election_in_progress:
-                return
+                return None
             self.election_in_progress = True
             self.epoca += 1
-            print(f"Peer {self.peer.peer_id}: Iniciando eleição para a ÉPOCA {self.epoca}.")
-            self.voted_in_epoch = self.epoca
+            epoca = self.epoca
+            log.info("Peer %s: Iniciando eleição para a ÉPOCA %s.", self.peer.peer_id, epoca)
+            self.voted_in_epoch = epoca
             self.votes_received = {str(self.peer.peer_id)}
+            return epoca
 
-        active_peers = self.peer.listar_peers_ativos()
-        votes_needed = (len(active_peers) + 1) // 2 + 1
-
-        for peer_name, peer_uri in active_peers:
-            try:
-                with Pyro5.api.Proxy(peer_uri) as remote_peer:
-                    if remote_peer.request_vote(self.peer.peer_id, self.epoca):
-                        self.votes_received.add(peer_name.split('_')[-1])
-            except Exception as e:
-                print(f"Peer {self.peer.peer_id}: Falha ao pedir voto para {peer_name}: {e}")
-
+    def concluir_eleicao(self, epoca, inicio, votes_needed):
         with self.lock:
-            if len(self.votes_received) >= votes_needed:
-                print(f"Peer {self.peer.peer_id}: Ganhou a eleição para a época {self.epoca} com votos de: {self.votes_received}")
+            # Se outro candidato levou a época adiante durante a votação, esta eleição não vale mais.
+            venceu = len(self.votes_received) >= votes_needed and self.epoca == epoca
+            self.peer.metricas.registrar_eleicao(epoca, time.perf_counter() - inicio, len(self.votes_received),
+                                                 votes_needed, venceu)
+            if venceu:
+                log.info("Peer %s: Ganhou a eleição para a época %s com votos de: %s", self.peer.peer_id, epoca, self.votes_received)
                 self.peer.become_tracker()
             else:
-                print(f"Peer {self.peer.peer_id}: Perdeu a eleição para a época {self.epoca}. Votos recebidos: {self.votes_received}")
+                log.info("Peer %s: Perdeu a eleição para a época %s. Votos recebidos: %s", self.peer.peer_id, epoca, self.votes_received)
             self.election_in_progress = False
 
     def request_vote(self, candidate_id, epoca):
         with self.lock:
             if self.peer.is_tracker:
                 if epoca > self.epoca:
-                    print(f"Tracker (Peer {self.peer.peer_id}): Recebeu pedido para época superior ({epoca}). Aceitando e renunciando.")
+                    log.warning("Tracker (Peer %s): Recebeu pedido para época superior (%s). Aceitando e renunciando.", self.peer.peer_id, epoca)
                     self.peer.is_tracker = False
+                    self.peer.detector.rearmar()
                 else:
                     return False
 
@@ -62,11 +2045,151 @@ class ElectionManager:
 
             if epoca == self.epoca and self.voted_in_epoch < epoca:
                 self.voted_in_epoch = epoca
-                print(f"Peer {self.peer.peer_id}: Votou em {candidate_id} para a época {epoca}.")
+                log.debug("Peer %s: Votou em %s para a época %s.", self.peer.peer_id, candidate_id, epoca)
+                # Quem vota dá tempo ao candidato em vez de abrir uma eleição concorrente.
+                self.peer.detector.rearmar()
                 return True
             
             return False
 
+class SwarmDownload:
+    def __init__(self, peer, filename, fontes, digest=None):
+        self.peer = peer
+        self.filename = filename
+        self.fontes = dict(list(fontes.items())[:MAX_FONTES_SWARM])
+        self.digest = digest
+        self.tamanho_peca = TAMANHO_BLOCO
+        self.tamanho = None
+        self.total_pecas = 0
+        self.pendentes = collections.deque()
+        self.em_andamento = {}
+        self.concluidas = set()
+        self.estado = None
+        self.bytes_por_fonte = {}
+        self.lock = threading.Lock()
+
+    def _consultar_fontes(self):
+        infos = {}
+        for source_id, uri in list(self.fontes.items()):
+            try:
+                with self.peer.proxies.proxy(uri, TIMEOUT_PECA) as fonte:
+                    info = fonte.info_arquivo(self.filename)
+                if info:
+                    infos[source_id] = info
+                    continue
+            except Exception as e:
+                log.warning("Peer %s: Fonte %s indisponível: %s", self.peer.peer_id, source_id, e)
+                if isinstance(e, Pyro5.errors.CommunicationError):
+                    self.peer.nomes.invalidar(f"Peer_{source_id}")
+            del self.fontes[source_id]
+        if not infos:
+            return False
+        if self.digest is None:
+            # Sem digest anunciado pelo tracker, vale o conteúdo mais comum entre as fontes.
+            mais_comum = collections.Counter(info["hash"] for info in infos.values()).most_common(1)[0][0]
+            self.digest = next(info for info in infos.values() if info["hash"] == mais_comum)
+        for source_id, info in infos.items():
+            if info["hash"] != self.digest["hash"]:
+                log.warning("Peer %s: Fonte %s tem outra versão de %s.", self.peer.peer_id, source_id, self.filename)
+                del self.fontes[source_id]
+        self.tamanho = self.digest["tamanho"]
+        self.tamanho_peca = self.digest["tamanho_peca"]
+        return bool(self.fontes)
+
+    def _intervalo(self, peca):
+        offset = peca * self.tamanho_peca
+        return offset, min(self.tamanho_peca, self.tamanho - offset)
+
+    def _proxima_peca(self):
+        with self.lock:
+            if self.pendentes:
+                peca = self.pendentes.popleft()
+            else:
+                # Fase final: duplica a peça em andamento com menos cópias,
+                # para não ficar esperando pela fonte mais lenta.
+                restantes = [p for p in self.em_andamento if p not in self.concluidas]
+                if not restantes:
+                    return None
+                peca = min(restantes, key=lambda p: self.em_andamento[p])
+            self.em_andamento[peca] = self.em_andamento.get(peca, 0) + 1
+            return peca
+
+    def _devolver_peca(self, peca):
+        with self.lock:
+            # Na fase final a outra cópia pode já ter concluído (e retirado) a peça.
+            if peca not in self.em_andamento or peca in self.concluidas:
+                return
+            self.em_andamento[peca] -= 1
+            if self.em_andamento[peca] == 0:
+                del self.em_andamento[peca]
+                if peca not in self.concluidas:
+                    self.pendentes.appendleft(peca)
+
+    def _concluir_peca(self, peca, source_id, tamanho):
+        with self.lock:
+            self.em_andamento.pop(peca, None)
+            if peca not in self.concluidas:
+                self.concluidas.add(peca)
+                self.bytes_por_fonte[source_id] += tamanho
+                self.estado.marcar(peca)
+
+    def _trabalhador(self, source_id, uri):
+        falhas = 0
+        with self.peer.proxies.proxy(uri, TIMEOUT_PECA, SERIALIZADOR_DADOS) as fonte, \
+                open(self.estado.part_path, 'r+b', buffering=0) as f:
+            while falhas < MAX_FALHAS_FONTE:
+                peca = self._proxima_peca()
+                if peca is None:
+                    return
+                offset, tamanho = self._intervalo(peca)
+                try:
+                    dados = ler_intervalo(fonte, self.filename, offset, tamanho)
+                    if len(dados) != tamanho:
+                        raise ValueError(f"peça {peca} com {len(dados)} de {tamanho} bytes")
+                    if hash_bloco(dados) != self.digest["pecas"][peca]:
+                        raise ValueError(f"hash inválido na peça {peca}")
+                except Exception as e:
+                    falhas += 1
+                    self._devolver_peca(peca)
+                    log.warning("Peer %s: Falha na peça %s da fonte %s: %s", self.peer.peer_id, peca, source_id, e)
+                    continue
+                with self.lock:
+                    ja_concluida = peca in self.concluidas
+                if not ja_concluida:
+                    f.seek(offset)
+                    f.write(dados)
+                self._concluir_peca(peca, source_id, tamanho)
+        log.warning("Peer %s: Fonte %s descartada após %s falhas.", self.peer.peer_id, source_id, falhas)
+
+    def executar(self, filepath):
+        if not self._consultar_fontes():
+            log.warning("Peer %s: Nenhuma fonte possui %s.", self.peer.peer_id, self.filename)
+            return False
+        if hash_pecas(self.digest["pecas"]) != self.digest["hash"]:
+            log.error("Peer %s: Digest inconsistente para %s.", self.peer.peer_id, self.filename)
+            return False
+        self.estado = EstadoParcial(filepath, self.digest)
+        self.total_pecas = self.estado.total_pecas
+        self.concluidas = set(self.estado.concluidas)
+        if self.concluidas:
+            log.info("Peer %s: Retomando %s (%s de %s peças já baixadas).", self.peer.peer_id, self.filename, len(self.concluidas), self.total_pecas)
+        self.bytes_por_fonte = {source_id: 0 for source_id in self.fontes}
+        self.pendentes.extend(self.estado.faltantes())
+        trabalhadores = [(sid, uri) for sid, uri in self.fontes.items() for _ in range(CONEXOES_POR_FONTE)]
+        try:
+            with ThreadPoolExecutor(max_workers=len(trabalhadores)) as pool:
+                futuros = {pool.submit(self._trabalhador, source_id, uri): source_id
+                           for source_id, uri in trabalhadores}
+                for futuro in as_completed(futuros):
+                    try:
+                        futuro.result()
+                    except Exception as e:
+                        log.error("Peer %s: Conexão com a fonte %s encerrada por erro: %s",
+                                  self.peer.peer_id, futuros[futuro], e)
+        finally:
+            self.estado.salvar()
+        return self.estado.completo()
+
 # --- CLASSE PEER PRINCIPAL ---
 @Pyro5.api.expose
 class Peer:
@@ -75,16 +2198,33 @@ class Peer:
         self.is_tracker = False
         self.epoca = 0
         self.current_tracker_uri = None
-        self.last_heartbeat = time.time()
         self.heartbeat_timeout = random.uniform(3.0, 5.0)
+        self.detector = DetectorFalhas(self.heartbeat_timeout)
         self.daemon = None
         self.shared_dir = f"peer_{self.peer_id}_shared"
         self.files = []
+        self.digests = {}
         self.file_registry = {}
+        self.file_digests = {}
+        self.file_index = IndiceArquivos()
+        self.registry_versions = {}
+        self.registry_lock = threading.Lock()
+        self.historico = HistoricoRegistro()
+        self.replicacao = ReplicacaoRegistro()
+        self.replica = None
+        self.persistencia = PersistenciaRegistro(f"{self.shared_dir}.registro")
         self.stop_threads = False
         self.election_manager = ElectionManager(self)
+        self.proxies = proxies
+        self.nomes = servico_nomes
+        self.arquivos_mapeados = arquivos_mapeados
         self.heartbeat_lock = threading.Lock()
         self.lock = threading.Lock()
+        self.hash_cache = HashCache(f"{self.shared_dir}.hashes.json")
+        self.diretorio = DiretorioCompartilhado(self.shared_dir)
+        self.arquivos_lock = threading.Lock()
+        self.metricas = Metricas()
+        self.runtime = None
         
         self._setup_local_files()
 
@@ -94,207 +2234,814 @@ class Peer:
             filename = f"arquivo_peer_{self.peer_id}.txt"
             with open(os.path.join(self.shared_dir, filename), "w") as f:
                 f.write(f"Conteúdo de teste do peer {self.peer_id}")
-        self.files = [f for f in os.listdir(self.shared_dir) if os.path.isfile(os.path.join(self.shared_dir, f))]
+        # Varredura inicial; depois disso o diretório é acompanhado por observar_diretorio.
+        # O cache só recalcula o hash de arquivos cujo tamanho ou mtime mudou.
+        alterados, _ = self.diretorio.varrer()
+        atualizar_arquivos_locais(self, alterados, ())
+        self.hash_cache.podar(os.path.join(self.shared_dir, f) for f in self.digests)
+        self.hash_cache.salvar()
 
     def get_uri_name(self):
         return f"Peer_{self.peer_id}"
 
     def registrar_no_servico_nomes(self):
         try:
-            with Pyro5.api.locate_ns() as ns:
-                uri = self.daemon.register(self)
-                ns.register(self.get_uri_name(), uri)
-                print(f"Peer {self.peer_id}: Registrado como {self.get_uri_name()}")
+            uri = self.daemon.register(self)
+            self.nomes.registrar(self.get_uri_name(), uri)
+            log.info("Peer %s: Registrado como %s", self.peer_id, self.get_uri_name())
         except Exception as e:
-            print(f"Peer {self.peer_id}: Erro ao registrar: {e}")
+            log.error("Peer %s: Erro ao registrar: %s", self.peer_id, e)
 
     def listar_peers_ativos(self):
         peers = []
         try:
-            with Pyro5.api.locate_ns() as ns:
-                for name, uri in ns.list(prefix="Peer_").items():
-                    if name != self.get_uri_name():
-                        peers.append((name, uri))
+            for name, uri in self.nomes.listar("Peer_").items():
+                if name != self.get_uri_name():
+                    peers.append((name, uri))
         except Exception:
             pass
         return peers
 
     def buscar_tracker(self):
         try:
-            with Pyro5.api.locate_ns() as ns:
-                all_trackers = {name: uri for name, uri in ns.list(prefix="Tracker_Epoca_").items()}
-                if not all_trackers:
-                    return False
+            # Sempre consulta o serviço de nomes: após uma eleição o cache pode não ter o novo tracker.
+            all_trackers = self.nomes.listar("Tracker_Epoca_", atualizar=True)
+            if not all_trackers:
+                return False
 
-                latest_epoca = -1
-                latest_tracker_uri = None
-                for name, uri in all_trackers.items():
-                    try:
-                        epoca = int(name.split('_')[-1])
-                        if epoca > latest_epoca:
-                            latest_epoca = epoca
-                            latest_tracker_uri = str(uri)
-                    except (ValueError, IndexError):
-                        continue
-                
-                if latest_tracker_uri and latest_epoca >= self.epoca:
-                    self.current_tracker_uri = latest_tracker_uri
-                    self.epoca = latest_epoca
-                    self.election_manager.set_epoca(latest_epoca)
-                    print(f"Peer {self.peer_id}: Tracker MAIS RECENTE encontrado: Tracker_Epoca_{latest_epoca}")
-                    self.last_heartbeat = time.time()
-                    return True
+            latest_epoca = -1
+            latest_tracker_uri = None
+            for name, uri in all_trackers.items():
+                try:
+                    epoca = int(name.split('_')[-1])
+                    if epoca > latest_epoca:
+                        latest_epoca = epoca
+                        latest_tracker_uri = str(uri)
+                except (ValueError, IndexError):
+                    continue
+            
+            if latest_tracker_uri and latest_epoca >= self.epoca:
+                self.current_tracker_uri = latest_tracker_uri
+                self.epoca = latest_epoca
+                self.election_manager.set_epoca(latest_epoca)
+                log.info("Peer %s: Tracker MAIS RECENTE encontrado: Tracker_Epoca_%s", self.peer_id, latest_epoca)
+                self.detector.rearmar()
+                return True
         except Exception as e:
-            print(f"Peer {self.peer_id}: Erro ao buscar tracker: {e}")
+            log.error("Peer %s: Erro ao buscar tracker: %s", self.peer_id, e)
         return False
             
     def become_tracker(self):
         with self.lock:
             self.is_tracker = True
             self.epoca = self.election_manager.epoca
-            self.file_registry = {}
-            self.file_registry[self.peer_id] = self.files
+            self.assumir_registro()
+            self.notificar_arquivos_tracker()
             try:
-                with Pyro5.api.locate_ns() as ns:
-                    uri = self.daemon.uriFor(self)
-                    tracker_name = f"Tracker_Epoca_{self.epoca}"
-                    ns.register(tracker_name, uri)
-                print(f"Peer {self.peer_id}: Tornou-se o tracker para a época {self.epoca}.")
-                threading.Thread(target=self.loop_heartbeat, daemon=True).start()
-                threading.Thread(target=self.solicitar_todos_arquivos, daemon=True).start()
+                uri = self.daemon.uriFor(self)
+                tracker_name = f"Tracker_Epoca_{self.epoca}"
+                self.nomes.registrar(tracker_name, uri)
+                log.info("Peer %s: Tornou-se o tracker para a época %s.", self.peer_id, self.epoca)
+                if self.runtime is not None:
+                    self.runtime.iniciar_tracker(self)
+                else:
+                    threading.Thread(target=self.loop_heartbeat, daemon=True).start()
+                    threading.Thread(target=self.loop_replicacao, daemon=True).start()
+                    threading.Thread(target=self.solicitar_todos_arquivos, daemon=True).start()
             except Exception as e:
-                print(f"Peer {self.peer_id}: Erro ao se tornar tracker: {e}")
+                log.error("Peer %s: Erro ao se tornar tracker: %s", self.peer_id, e)
                 self.is_tracker = False
 
+    def assumir_registro(self):
+        # Um standby assume com a réplica do registro; sem ela, com o registro salvo em disco
+        # (se este peer já foi tracker). Em ambos os casos só a diferença é reconciliada com os peers.
+        with self.registry_lock:
+            if self.replica is None:
+                limpar_registro(self)
+                epoca = carregar_registro(self)
+                if epoca is not None:
+                    log.info("Tracker (Peer %s): Assumindo com o registro salvo em disco na época %s (%s peers).",
+                             self.peer_id, epoca, len(self.file_registry))
+                    self.metricas.contar("assumiu_com_disco")
+            else:
+                log.info("Tracker (Peer %s): Assumindo com o registro replicado da época %s (%s peers).",
+                         self.peer_id, self.replica[0], len(self.file_registry))
+                self.metricas.contar("assumiu_com_replica")
+            self.replica = None
+            self.replicacao.reiniciar()
+        # O instantâneo da nova época é gravado pelo loop de replicação, depois do registro no
+        # serviço de nomes: a eleição e os heartbeats não esperam pelo disco.
+        self.persistencia.pedir_compactacao()
+        self.detector.priorizar(1.0)
+
     def solicitar_todos_arquivos(self):
         if not self.is_tracker: return
-        time.sleep(1)
-        print(f"Tracker (Peer {self.peer_id}): Puxando listas de arquivos dos outros peers...")
+        log.info("Tracker (Peer %s): Puxando listas de arquivos dos outros peers...", self.peer_id)
         active_peers = self.listar_peers_ativos()
-        for peer_name, peer_uri in active_peers:
-            try:
-                with Pyro5.api.Proxy(peer_uri) as remote_peer:
-                    peer_id_str = peer_name.split('_')[-1]
-                    peer_id = int(peer_id_str)
-                    files = remote_peer.get_lista_arquivos()
-                    self.atualizar_registro_arquivos(peer_id, files)
-            except Exception as e:
-                print(f"Tracker (Peer {self.peer_id}): Falha ao solicitar arquivos de {peer_name}. Erro: {e}")
+        podar_registro(self, {int(name.split('_')[-1]) for name, _ in active_peers})
+        coletar_registros(self, active_peers, self._puxar_registro)
+
+    def loop_replicacao(self):
+        # Acorda a cada alteração do registro (ou a cada INTERVALO_REPLICACAO, para standbys novos)
+        # e, quando o log em disco passa do limite, compacta o registro num instantâneo.
+        while self.is_tracker and not self.stop_threads:
+            replicar_para_standbys(self)
+            if self.persistencia.precisa_compactar():
+                compactar_registro(self)
+            self.replicacao.evento.wait(INTERVALO_REPLICACAO)
+
+    def _puxar_registro(self, peer_name, peer_uri):
+        try:
+            with self.proxies.proxy(peer_uri, TIMEOUT_COLETA_PEER) as remote_peer:
+                puxar_registro(self, int(peer_name.split('_')[-1]), remote_peer, self.epoca)
+            return True
+        except Exception as e:
+            log.warning("Tracker (Peer %s): Falha ao solicitar arquivos de %s. Erro: %s", self.peer_id, peer_name, e)
+            return False
 
     @Pyro5.api.expose
     def get_lista_arquivos(self):
         return self.files
 
+    @Pyro5.api.expose
+    def get_digests(self):
+        return self.digests
+
+    @Pyro5.api.expose
+    def get_registro_completo(self, epoca=None, versao=None):
+        # Com 'versao' (a que o tracker já tem), responde só o delta desde ela quando possível.
+        return registro_para(self.historico, epoca, versao, self.files, self.digests)
+
+    @Pyro5.api.expose
+    @instrumentado("replicar_registro")
+    def replicar_registro(self, epoca, seq_base, seq, operacoes):
+        return aplicar_replica(self, epoca, seq_base, seq, operacoes)
+
+    def _enviar_heartbeat(self, peer_uri):
+        inicio = time.perf_counter()
+        try:
+            with self.proxies.proxy(peer_uri, PRAZO_RODADA_HEARTBEAT) as peer:
+                return peer.receber_heartbeat(self.epoca, str(self.daemon.uriFor(self)))
+        except Exception:
+            self.metricas.contar("envio_heartbeat_erros")
+            raise
+        finally:
+            self.metricas.observar("envio_heartbeat", time.perf_counter() - inicio)
+
     def loop_heartbeat(self):
-        while self.is_tracker:
-            time.sleep(1.5)
-            active_peers = self.listar_peers_ativos()
-            for peer_name, peer_uri in active_peers:
-                try:
-                    with Pyro5.api.Proxy(peer_uri) as peer:
-                        peer.receber_heartbeat(self.epoca)
-                except Exception:
-                    pass
+        pendentes = {}
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS_HEARTBEAT) as pool:
+            while self.is_tracker:
+                inicio = time.time()
+                destinos = [str(uri) for _, uri in self.listar_peers_ativos()]
+                difundir_heartbeat(pool, pendentes, destinos, self._enviar_heartbeat)
+                time.sleep(max(0.0, INTERVALO_HEARTBEAT - (time.time() - inicio)))
 
     @Pyro5.api.expose
-    def receber_heartbeat(self, epoca):
+    @instrumentado("receber_heartbeat")
+    def receber_heartbeat(self, epoca, tracker_uri=None):
         with self.heartbeat_lock:
             if epoca >= self.epoca:
-                self.last_heartbeat = time.time()
+                # Um tracker de época maior já foi eleito: este deixa de ser tracker (evita split-brain).
+                if self.is_tracker and epoca > self.epoca:
+                    log.warning("Tracker (Peer %s): Heartbeat do tracker da época %s. Renunciando.", self.peer_id, epoca)
+                    self.is_tracker = False
+                # A réplica (e a prioridade de standby) vale só enquanto o tracker atual replica para este peer.
+                descartar_replica_antiga(self, epoca)
+                # Quem perdeu a eleição (ou ainda segue o tracker antigo) passa a seguir o atual;
+                # o intervalo até o primeiro heartbeat do novo tracker não conta como amostra.
+                if tracker_uri and tracker_uri != self.current_tracker_uri:
+                    self.current_tracker_uri = tracker_uri
+                    self.detector.rearmar()
+                else:
+                    self.detector.heartbeat()
                 self.epoca = epoca
                 self.election_manager.set_epoca(epoca)
                 return True
             return False
 
+    def _monitorando_tracker(self):
+        return not self.stop_threads and not self.is_tracker and self.current_tracker_uri is not None
+
     def monitorar_tracker(self):
-        while not self.stop_threads:
-            time.sleep(0.5)
-            if not self.is_tracker and self.current_tracker_uri:
-                if time.time() - self.last_heartbeat > self.heartbeat_timeout:
-                    print(f"Peer {self.peer_id}: Timeout do tracker detectado. Iniciando eleição.")
-                    self.current_tracker_uri = None
+        while self.detector.aguardar_expiracao(self._monitorando_tracker):
+            log.warning("Peer %s: Timeout do tracker detectado (suspeita %.1f). Iniciando eleição.", self.peer_id, self.detector.suspeita())
+            self.current_tracker_uri = None
+            self.nomes.invalidar()
+            self.election_manager.inicia_election()
+            # Eleição perdida (ex.: votos divididos): procura o vencedor e, sem tracker, tenta de novo.
+            while not self.stop_threads and not self.is_tracker and self.current_tracker_uri is None:
+                time.sleep(random.uniform(0.2, 0.5))
+                if self.current_tracker_uri is None and not self.buscar_tracker():
                     self.election_manager.inicia_election()
 
     @Pyro5.api.expose
+    @instrumentado("request_vote")
     def request_vote(self, candidate_id, epoca):
         return self.election_manager.request_vote(candidate_id, epoca)
     
     def notificar_arquivos_tracker(self):
-        if not self.is_tracker and self.current_tracker_uri:
+        if self.is_tracker:
+            enviar_registro(self, self.peer_id, self.historico, self.epoca, self.files, self.digests)
+        elif self.current_tracker_uri:
             try:
-                with Pyro5.api.Proxy(self.current_tracker_uri) as tracker:
-                    tracker.atualizar_registro_arquivos(self.peer_id, self.files)
+                with self.proxies.proxy(self.current_tracker_uri) as tracker:
+                    enviar_registro(tracker, self.peer_id, self.historico, self.epoca, self.files, self.digests)
             except Exception as e:
-                print(f"Peer {self.peer_id}: Erro ao notificar arquivos ao tracker: {e}")
+                log.error("Peer %s: Erro ao notificar arquivos ao tracker: %s", self.peer_id, e)
 
     @Pyro5.api.expose
-    def atualizar_registro_arquivos(self, peer_id, files):
+    @instrumentado("atualizar_registro_arquivos")
+    def atualizar_registro_arquivos(self, peer_id, files, digests=None, versao=None):
         if self.is_tracker:
-            self.file_registry[peer_id] = files
-            print(f"Tracker: Registro do Peer {peer_id} atualizado com os arquivos: {files}")
+            with self.registry_lock:
+                alterar_registro(self, ("completo", peer_id, list(files), digests or {}, versao))
+            log.debug("Tracker: Registro do Peer %s atualizado com os arquivos: %s", peer_id, files)
             return True
         return False
 
+    @Pyro5.api.expose
+    @instrumentado("aplicar_delta_registro")
+    def aplicar_delta_registro(self, peer_id, versao_base, versao, adicionados, removidos, digests=None):
+        if not self.is_tracker:
+            return {"ok": False, "resync": False}
+        with self.registry_lock:
+            if versao_base is None or self.registry_versions.get(peer_id) != versao_base:
+                return {"ok": False, "resync": True}
+            alterar_registro(self, ("delta", peer_id, list(adicionados), list(removidos), digests or {}, versao))
+        log.debug("Tracker: Peer %s na versão %s (+%s -%s arquivos)", peer_id, versao, len(adicionados), len(removidos))
+        return {"ok": True, "resync": False}
+
     @Pyro5.api.expose
     def obter_todos_arquivos(self):
         if self.is_tracker:
-            return self.file_registry
+            with self.registry_lock:
+                return {pid: sorted(files) for pid, files in self.file_registry.items()}
         return {}
     
     @Pyro5.api.expose
     def buscar_arquivo(self, filename):
         if self.is_tracker:
-            return [pid for pid, flist in self.file_registry.items() if filename in flist]
+            return self.file_index.buscar(filename)
         return []
 
     @Pyro5.api.expose
-    def enviar_arquivo(self, filename):
-        filepath = os.path.join(self.shared_dir, filename)
-        if os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                return base64.b64encode(f.read()).decode('utf-8')
+    def buscar_por_prefixo(self, prefixo, offset=0, limite=LIMITE_PADRAO_BUSCA):
+        if self.is_tracker:
+            return self.file_index.buscar_prefixo(prefixo, offset, limite)
+        return {"arquivos": [], "proximo": None}
+
+    @Pyro5.api.expose
+    def buscar_por_trecho(self, trecho, offset=0, limite=LIMITE_PADRAO_BUSCA):
+        if self.is_tracker:
+            return self.file_index.buscar_trecho(trecho, offset, limite)
+        return {"arquivos": [], "proximo": None}
+
+    @Pyro5.api.expose
+    def buscar_por_padrao(self, padrao, offset=0, limite=LIMITE_PADRAO_BUSCA):
+        if self.is_tracker:
+            return self.file_index.buscar_padrao(padrao, offset, limite)
+        return {"arquivos": [], "proximo": None}
+
+    @Pyro5.api.expose
+    def buscar_digest(self, filename):
+        # Anuncia o digest da versão do arquivo presente no maior número de peers.
+        if not self.is_tracker:
+            return None
+        grupos = {}
+        for pid in self.file_index.buscar(filename):
+            digest = self.file_digests.get(pid, {}).get(filename)
+            if digest:
+                grupos.setdefault(digest["hash"], (digest, []))[1].append(pid)
+        if not grupos:
+            return None
+        digest, pids = max(grupos.values(), key=lambda grupo: len(grupo[1]))
+        return dict(digest, peers=pids)
+
+    def _caminho_compartilhado(self, filename):
+        nome = os.path.basename(filename)
+        if not nome or nome != filename or arquivo_temporario(nome):
+            return None
+        return os.path.join(self.shared_dir, nome)
+
+    @Pyro5.api.expose
+    def info_arquivo(self, filename):
+        filepath = self._caminho_compartilhado(filename)
+        if filepath and os.path.isfile(filepath):
+            return self.hash_cache.digest(filepath)
         return None
 
+    @Pyro5.api.expose
+    @instrumentado("enviar_bloco")
+    def enviar_bloco(self, filename, offset, tamanho=TAMANHO_BLOCO, compressao=None):
+        filepath = self._caminho_compartilhado(filename)
+        if not filepath or not os.path.isfile(filepath):
+            return None
+        tamanho = min(int(tamanho), TAMANHO_MAXIMO_BLOCO)
+        blocos = blocos_arquivo(self.arquivos_mapeados.abrir(filepath), offset, tamanho, tamanho,
+                                escolher_compressao(filepath, compressao), self.metricas)
+        return next(blocos, b"")
+
+    @Pyro5.api.expose
+    @instrumentado("enviar_arquivo")
+    def enviar_arquivo(self, filename, tamanho_bloco=TAMANHO_BLOCO, offset=0, tamanho=None, compressao=None):
+        # Gerador: o Pyro entrega ao cliente um iterador remoto, bloco a bloco.
+        # 'compressao' lista os algoritmos que o cliente aceita (ver escolher_compressao).
+        filepath = self._caminho_compartilhado(filename)
+        if not filepath or not os.path.isfile(filepath):
+            return
+        yield from blocos_arquivo(self.arquivos_mapeados.abrir(filepath), offset, tamanho,
+                                  min(int(tamanho_bloco), TAMANHO_MAXIMO_BLOCO),
+                                  escolher_compressao(filepath, compressao), self.metricas)
+
+    @Pyro5.api.expose
+    @instrumentado("reservar_envio")
+    def reservar_envio(self, filename, offset=0, tamanho=None, compressao=None, tamanho_bloco=TAMANHO_BLOCO):
+        # Ticket para receber o intervalo pelo canal de dados (ver CanalDados).
+        filepath = self._caminho_compartilhado(filename)
+        if not filepath or not os.path.isfile(filepath):
+            return None
+        return canal_dados(self.daemon).reservar(filepath, offset, tamanho, self.metricas,
+                                                 escolher_compressao(filepath, compressao), tamanho_bloco)
+
+    def _medidores(self):
+        with self.registry_lock:
+            medidores = {
+                "peers_registrados": len(self.file_registry),
+                "entradas_registro": sum(len(files) for files in self.file_registry.values()),
+            }
+        medidores["arquivos_indexados"] = len(self.file_index.nomes)
+        medidores["arquivos_locais"] = len(self.files)
+        medidores["epoca"] = self.epoca
+        medidores["tracker"] = int(self.is_tracker)
+        return medidores
+
+    @Pyro5.api.expose
+    def get_metrics(self):
+        return self.metricas.instantaneo(self._medidores())
+
+    @Pyro5.api.expose
+    def get_metrics_prometheus(self):
+        return self.metricas.prometheus(self._medidores(), {"peer": self.peer_id})
+
+    def _registrar_download(self, filename, filepath, digest):
+        # Com o digest já no cache, o arquivo entra no índice sem ser lido de novo.
+        self.hash_cache.registrar(filepath, digest)
+        atualizar_arquivos_locais(self, *self.diretorio.verificar([filename]))
+        self.notificar_arquivos_tracker()
+
     def baixar_arquivo(self, filename, source_peer_id):
+        filepath = self._caminho_compartilhado(filename)
+        if not filepath:
+            log.warning("Nome de arquivo inválido: %s", filename)
+            return False
         try:
-            with Pyro5.api.locate_ns() as ns:
-                source_uri = ns.lookup(f"Peer_{source_peer_id}")
-                with Pyro5.api.Proxy(source_uri) as source_peer:
-                    encoded_content = source_peer.enviar_arquivo(filename)
-                    if encoded_content:
-                        file_content = base64.b64decode(encoded_content)
-                        with open(os.path.join(self.shared_dir, filename), 'wb') as f:
-                            f.write(file_content)
-                        self.files.append(filename)
-                        self.notificar_arquivos_tracker()
-                        print(f"Arquivo {filename} baixado com sucesso do peer {source_peer_id}")
-                        return True
+            digest = self.obter_digest(filename)
+            source_uri = self.nomes.lookup(f"Peer_{source_peer_id}")
+            with self.proxies.proxy(source_uri, serializador=SERIALIZADOR_DADOS) as source_peer:
+                info = source_peer.info_arquivo(filename)
+                if not info:
+                    log.warning("Arquivo %s não encontrado no peer %s", filename, source_peer_id)
+                    return False
+                if digest is None:
+                    digest = info
+                elif info["hash"] != digest["hash"]:
+                    log.warning("Peer %s possui outra versão de %s", source_peer_id, filename)
+                    return False
+                estado = EstadoParcial(filepath, digest)
+                if estado.concluidas:
+                    log.info("Retomando %s: %s de %s peças já baixadas", filename, len(estado.concluidas), estado.total_pecas)
+                self.metricas.contar("bytes_recebidos", transferir_pecas(source_peer, filename, estado))
+            if not estado.completo():
+                log.warning("Falha ao baixar arquivo: %s de %s peças recebidas", len(estado.concluidas), estado.total_pecas)
+                return False
+            estado.finalizar()
+            self._registrar_download(filename, filepath, digest)
+            log.info("Arquivo %s baixado com sucesso do peer %s", filename, source_peer_id)
+            return True
         except Exception as e:
-            print(f"Falha ao baixar arquivo: {e}")
+            log.error("Falha ao baixar arquivo (o progresso foi salvo): %s", e)
+            if isinstance(e, Pyro5.errors.CommunicationError):
+                self.nomes.invalidar(f"Peer_{source_peer_id}")
+        return False
+
+    def buscar_fontes(self, filename):
+        if self.is_tracker:
+            return self.buscar_arquivo(filename)
+        if self.current_tracker_uri:
+            with self.proxies.proxy(self.current_tracker_uri) as tracker:
+                return tracker.buscar_arquivo(filename)
+        return []
+
+    def pesquisar_arquivos(self, termo, offset=0, limite=LIMITE_PADRAO_BUSCA):
+        metodo = "buscar_por_padrao" if any(c in termo for c in "*?[") else "buscar_por_trecho"
+        if self.is_tracker:
+            return getattr(self, metodo)(termo, offset, limite)
+        if self.current_tracker_uri:
+            with self.proxies.proxy(self.current_tracker_uri) as tracker:
+                return getattr(tracker, metodo)(termo, offset, limite)
+        return {"arquivos": [], "proximo": None}
+
+    def obter_digest(self, filename):
+        try:
+            if self.is_tracker:
+                digest = self.buscar_digest(filename)
+            elif self.current_tracker_uri:
+                with self.proxies.proxy(self.current_tracker_uri) as tracker:
+                    digest = tracker.buscar_digest(filename)
+            else:
+                return None
+        except Exception as e:
+            log.error("Peer %s: Erro ao obter digest de %s: %s", self.peer_id, filename, e)
+            return None
+        if digest:
+            digest.pop("peers", None)
+        return digest
+
+    def baixar_arquivo_swarm(self, filename, source_peer_ids=None):
+        filepath = self._caminho_compartilhado(filename)
+        if not filepath:
+            log.warning("Nome de arquivo inválido: %s", filename)
+            return False
+        try:
+            if source_peer_ids is None:
+                source_peer_ids = self.buscar_fontes(filename)
+            fontes = {}
+            for source_id in source_peer_ids:
+                if source_id == self.peer_id:
+                    continue
+                try:
+                    fontes[source_id] = self.nomes.lookup(f"Peer_{source_id}")
+                except Exception:
+                    log.warning("Peer %s: Peer_%s não está no serviço de nomes.", self.peer_id, source_id)
+            if not fontes:
+                log.warning("Nenhuma fonte disponível para %s", filename)
+                return False
+
+            inicio = time.time()
+            swarm = SwarmDownload(self, filename, fontes, self.obter_digest(filename))
+            if not swarm.executar(filepath):
+                log.warning("Falha ao baixar arquivo: %s de %s peças recebidas", len(swarm.concluidas), swarm.total_pecas)
+                return False
+            swarm.estado.finalizar()
+            duracao = max(time.time() - inicio, 1e-6)
+            self.metricas.contar("bytes_recebidos", sum(swarm.bytes_por_fonte.values()))
+            self.metricas.observar("download_swarm", duracao)
+            self._registrar_download(filename, filepath, swarm.digest)
+            log.info("Arquivo %s baixado de %s peers (%.2f MB/s). Bytes por fonte: %s",
+                     filename, len(swarm.fontes), swarm.tamanho / duracao / 1e6, swarm.bytes_por_fonte)
+            return True
+        except Exception as e:
+            log.error("Falha ao baixar arquivo (o progresso foi salvo): %s", e)
         return False
 
     def inicializar(self):
         threading.Thread(target=self.monitorar_tracker, daemon=True).start()
+        threading.Thread(target=observar_diretorio, args=(self,), daemon=True).start()
         time.sleep(random.uniform(0.1, 1.0))
         if not self.buscar_tracker():
             self.election_manager.inicia_election()
         else:
             self.notificar_arquivos_tracker()
 
+def desligar_peer(peer):
+    # Para as threads/tarefas do peer e retira seus nomes do serviço de nomes.
+    era_tracker = peer.is_tracker
+    peer.stop_threads = True
+    peer.is_tracker = False
+    peer.detector.parar()
+    observador_arquivos.cancelar(peer.diretorio)
+    peer.persistencia.fechar()
+    nomes = [peer.get_uri_name()]
+    if era_tracker:
+        nomes.append(f"Tracker_Epoca_{peer.epoca}")
+    for nome in nomes:
+        with contextlib.suppress(Exception):
+            peer.nomes.remover(nome)
+
+class HostPeers:
+    # Hospeda vários peers num só processo: um único daemon Pyro (com seu pool de threads),
+    # o mesmo pool de conexões e o mesmo cache do serviço de nomes. Cada peer continua
+    # registrado com seu próprio nome Peer_N.
+    def __init__(self, classe_peer=None, host=None):
+        self.classe_peer = classe_peer or Peer
+        self.daemon = Pyro5.api.Daemon(host=host)
+        self.peers = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.daemon.requestLoop, daemon=True).start()
+
+    def adicionar_peer(self, peer_id, inicializar=True):
+        peer = self.classe_peer(peer_id)
+        peer.daemon = self.daemon
+        peer.registrar_no_servico_nomes()
+        with self.lock:
+            self.peers[peer_id] = peer
+        if inicializar:
+            threading.Thread(target=peer.inicializar, daemon=True).start()
+        return peer
+
+    def remover_peer(self, peer_id):
+        with self.lock:
+            peer = self.peers.pop(peer_id)
+        desligar_peer(peer)
+        self.daemon.unregister(peer)
+
+    def encerrar(self):
+        for peer_id in list(self.peers):
+            self.remover_peer(peer_id)
+        fechar_canal_dados(self.daemon)
+        self.daemon.shutdown()
+
+def criar_daemon_multiplex(host=None):
+    # Daemon sem pool de threads: as requisições são atendidas por quem chamar daemon.events().
+    tipo = Pyro5.config.SERVERTYPE
+    Pyro5.config.SERVERTYPE = "multiplex"
+    try:
+        return Pyro5.api.Daemon(host=host)
+    finally:
+        Pyro5.config.SERVERTYPE = tipo
+
+def _consumir_excecao(futuro):
+    # Evita o aviso "exception was never retrieved" para chamadas cujo resultado ninguém espera.
+    if not futuro.cancelled():
+        futuro.exception()
+
+class RuntimeAsync:
+    # Executa vários peers num único event loop. Os sockets do daemon Pyro (multiplex) são
+    # vigiados pelo próprio loop, e heartbeats, monitoramento, eleições e sincronização do
+    # registro são tarefas. Os proxies Pyro são bloqueantes, então as chamadas remotas vão
+    # para um único pool limitado, compartilhado por todos os peers do processo (em vez de
+    # várias threads por peer). Os handlers das requisições recebidas (hash, leitura de disco,
+    # registry_lock) rodam num pool próprio: não travam o loop nem disputam threads com as
+    # chamadas que eles mesmos podem estar esperando de outro peer deste processo.
+    def __init__(self, host=None, max_workers=MAX_WORKERS_ASYNC, max_workers_requisicoes=MAX_WORKERS_REQUISICOES_ASYNC):
+        self.host = host
+        self.max_workers = max_workers
+        self.max_workers_requisicoes = max_workers_requisicoes
+        self.loop = None
+        self.daemon = None
+        self.executor = None
+        self.executor_requisicoes = None
+        self.leitores = {}
+        self.ocupados = set()
+        self.peers = {}
+        self.tarefas = {}
+
+    async def iniciar(self):
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pyro-async")
+        self.executor_requisicoes = ThreadPoolExecutor(max_workers=self.max_workers_requisicoes,
+                                                       thread_name_prefix="pyro-async-req")
+        self.daemon = criar_daemon_multiplex(self.host)
+        self._sincronizar_leitores()
+
+    def executar(self, funcao, *args):
+        futuro = self.loop.run_in_executor(self.executor, funcao, *args)
+        futuro.add_done_callback(_consumir_excecao)
+        return futuro
+
+    def _sincronizar_leitores(self):
+        # O conjunto de sockets do daemon muda a cada conexão aceita ou fechada. Conexões com
+        # uma requisição em atendimento ficam sem leitor até ela terminar.
+        atuais = {s.fileno(): s for s in self.daemon.sockets}
+        for fd, sock in list(self.leitores.items()):
+            if atuais.get(fd) is not sock:
+                self.loop.remove_reader(fd)
+                del self.leitores[fd]
+        for fd, sock in atuais.items():
+            if fd >= 0 and fd not in self.leitores and fd not in self.ocupados:
+                self.loop.add_reader(fd, self._evento, fd)
+                self.leitores[fd] = sock
+
+    def _evento(self, fd):
+        sock = self.leitores.get(fd)
+        if sock is None or self.daemon is None:
+            return
+        servidor = self.daemon.transportServer
+        if sock is servidor.sock:
+            # Conexão nova: accept e handshake são curtos e alteram o seletor do daemon, então ficam no loop.
+            try:
+                self.daemon.events([sock])
+            except Exception as e:
+                log.error("Runtime: Erro ao aceitar conexão: %s", e)
+            self._sincronizar_leitores()
+            return
+        # Requisição: o handler roda no pool de requisições, com o leitor da conexão pausado até terminar.
+        self.loop.remove_reader(fd)
+        del self.leitores[fd]
+        self.ocupados.add(fd)
+        futuro = self.loop.run_in_executor(self.executor_requisicoes, servidor.handleRequest, sock)
+        futuro.add_done_callback(functools.partial(self._atendida, fd, sock))
+
+    def _atendida(self, fd, sock, futuro):
+        # De volta ao loop: fecha a conexão se o cliente saiu e volta a vigiar os sockets.
+        self.ocupados.discard(fd)
+        if self.daemon is None:
+            return
+        ativa = not futuro.cancelled() and futuro.exception() is None and futuro.result()
+        if not ativa:
+            with contextlib.suppress(Exception):
+                self.daemon._clientDisconnect(sock)
+            with contextlib.suppress(KeyError, ValueError):
+                self.daemon.transportServer.selector.unregister(sock)
+            sock.close()
+        self.daemon._housekeeping()
+        self._sincronizar_leitores()
+
+    def _criar_tarefa(self, peer, corrotina):
+        tarefa = self.loop.create_task(corrotina)
+        tarefas = self.tarefas.setdefault(peer.peer_id, set())
+        tarefas.add(tarefa)
+        tarefa.add_done_callback(tarefas.discard)
+        return tarefa
+
+    async def adicionar_peer(self, peer_id, atraso_inicial=(0.1, 1.0)):
+        peer = await self.executar(Peer, peer_id)
+        peer.daemon = self.daemon
+        peer.runtime = self
+        evento = asyncio.Event()
+        peer.detector.despertar = lambda: self.loop.call_soon_threadsafe(evento.set)
+        evento_arquivos = asyncio.Event()
+        peer.diretorio.despertar = lambda: self.loop.call_soon_threadsafe(evento_arquivos.set)
+        await self.executar(peer.registrar_no_servico_nomes)
+        self.peers[peer_id] = peer
+        self._criar_tarefa(peer, self._monitorar_tracker(peer, evento))
+        self._criar_tarefa(peer, self._observar_diretorio(peer, evento_arquivos))
+        self._criar_tarefa(peer, self._inicializar(peer, atraso_inicial))
+        return peer
+
+    async def remover_peer(self, peer_id):
+        peer = self.peers.pop(peer_id)
+        await self.executar(desligar_peer, peer)
+        tarefas = list(self.tarefas.pop(peer_id, ()))
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        self.daemon.unregister(peer)
+
+    async def encerrar(self):
+        for peer_id in list(self.peers):
+            await self.remover_peer(peer_id)
+        for fd in self.leitores:
+            self.loop.remove_reader(fd)
+        self.leitores = {}
+        fechar_canal_dados(self.daemon)
+        self.daemon.close()
+        self.daemon = None
+        self.executor_requisicoes.shutdown(wait=False, cancel_futures=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _inicializar(self, peer, atraso_inicial):
+        await asyncio.sleep(random.uniform(*atraso_inicial))
+        if not await self.executar(peer.buscar_tracker):
+            await self.eleicao(peer)
+        else:
+            await self.executar(peer.notificar_arquivos_tracker)
+
+    async def eleicao(self, peer):
+        manager = peer.election_manager
+        epoca = manager.abrir_eleicao()
+        if epoca is None:
+            return
+        inicio = time.perf_counter()
+        votes_needed = 1
+        try:
+            active_peers = await self.executar(peer.listar_peers_ativos)
+            votes_needed = (len(active_peers) + 1) // 2 + 1
+            await solicitar_votos_async(self, peer.proxies, active_peers, peer.peer_id, epoca,
+                                        manager.votes_received, votes_needed)
+        finally:
+            # become_tracker registra o tracker no serviço de nomes, então roda fora do loop.
+            await self.executar(manager.concluir_eleicao, epoca, inicio, votes_needed)
+
+    async def _monitorar_tracker(self, peer, evento):
+        # Mesmo laço de Peer.monitorar_tracker: dorme até o prazo do detector, que é
+        # acordado mais cedo quando o detector é rearmado ou parado.
+        detector = peer.detector
+        while not peer.stop_threads:
+            evento.clear()
+            if not peer._monitorando_tracker():
+                espera = detector.timeout_minimo
+            else:
+                espera = detector.restante()
+            if espera > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(evento.wait(), espera)
+                continue
+            log.warning("Peer %s: Timeout do tracker detectado (suspeita %.1f). Iniciando eleição.", peer.peer_id, detector.suspeita())
+            peer.current_tracker_uri = None
+            peer.nomes.invalidar()
+            await self.eleicao(peer)
+            while not peer.stop_threads and not peer.is_tracker and peer.current_tracker_uri is None:
+                await asyncio.sleep(random.uniform(0.2, 0.5))
+                if peer.current_tracker_uri is None and not await self.executar(peer.buscar_tracker):
+                    await self.eleicao(peer)
+
+    async def _observar_diretorio(self, peer, evento):
+        # Mesmo laço de observar_diretorio; o hash e o envio ao tracker vão para o pool.
+        diretorio = peer.diretorio
+        await self.executar(observador_arquivos.observar, diretorio)
+        while not peer.stop_threads:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(evento.wait(), diretorio.espera())
+            evento.clear()
+            if peer.stop_threads:
+                break
+            if diretorio.observado:
+                await asyncio.sleep(ATRASO_AGRUPAMENTO)
+            try:
+                alterados, removidos = await self.executar(diretorio.coletar)
+                if (alterados or removidos) and await self.executar(atualizar_arquivos_locais, peer, alterados, removidos):
+                    await self.executar(peer.notificar_arquivos_tracker)
+            except Exception as e:
+                log.error("Peer %s: Erro ao observar %s: %s", peer.peer_id, peer.shared_dir, e)
+                await asyncio.sleep(diretorio.intervalo)
+
+    def iniciar_tracker(self, peer):
+        # Chamado por become_tracker (numa thread do pool): agenda as tarefas do tracker no loop.
+        def agendar():
+            if peer.peer_id in self.peers:
+                self._criar_tarefa(peer, self._loop_heartbeat(peer))
+                self._criar_tarefa(peer, self._loop_replicacao(peer))
+                self._criar_tarefa(peer, self._solicitar_todos_arquivos(peer))
+        self.loop.call_soon_threadsafe(agendar)
+
+    async def _loop_heartbeat(self, peer):
+        # Mesma política de difundir_heartbeat: um destino com envio pendente é pulado.
+        pendentes = {}
+        while peer.is_tracker and not peer.stop_threads:
+            inicio = self.loop.time()
+            destinos = [str(uri) for _, uri in await self.executar(peer.listar_peers_ativos)]
+            futuros = []
+            for destino in destinos:
+                anterior = pendentes.get(destino)
+                if anterior is not None and not anterior.done():
+                    continue
+                pendentes[destino] = self.executar(peer._enviar_heartbeat, destino)
+                futuros.append(pendentes[destino])
+            for destino in [d for d, futuro in pendentes.items() if d not in destinos and futuro.done()]:
+                del pendentes[destino]
+            if futuros:
+                await asyncio.wait(futuros, timeout=PRAZO_RODADA_HEARTBEAT)
+            await asyncio.sleep(max(0.0, INTERVALO_HEARTBEAT - (self.loop.time() - inicio)))
+
+    async def _loop_replicacao(self, peer):
+        while peer.is_tracker and not peer.stop_threads:
+            await self.executar(replicar_para_standbys, peer)
+            if peer.persistencia.precisa_compactar():
+                await self.executar(compactar_registro, peer)
+            await asyncio.sleep(INTERVALO_REPLICACAO)
+
+    async def _solicitar_todos_arquivos(self, peer):
+        if not peer.is_tracker:
+            return
+        log.info("Tracker (Peer %s): Puxando listas de arquivos dos outros peers...", peer.peer_id)
+        active_peers = await self.executar(peer.listar_peers_ativos)
+        podar_registro(peer, {int(name.split('_')[-1]) for name, _ in active_peers})
+        await coletar_registros_async(self, peer, active_peers, peer._puxar_registro)
+
+    async def baixar_arquivo(self, peer_id, filename, source_peer_id):
+        return await self.executar(self.peers[peer_id].baixar_arquivo, filename, source_peer_id)
+
+    async def baixar_arquivo_swarm(self, peer_id, filename, source_peer_ids=None):
+        return await self.executar(self.peers[peer_id].baixar_arquivo_swarm, filename, source_peer_ids)
+
+async def executar_peers_async(peer_ids):
+    # Modo sem menu: hospeda todos os peers num só processo até ser interrompido.
+    runtime = RuntimeAsync()
+    await runtime.iniciar()
+    try:
+        for peer_id in peer_ids:
+            await runtime.adicionar_peer(peer_id)
+        log.info("Runtime: %s peers em execução no event loop.", len(peer_ids))
+        await asyncio.Event().wait()
+    finally:
+        await runtime.encerrar()
+
 # --- FUNÇÃO MAIN E LÓGICA DE INTERFACE ---
 def main():
-    if len(sys.argv) < 2:
-        print("Uso: python seu_arquivo.py <id_do_peer>")
+    if len(sys.argv) < 2 or (sys.argv[1] == "--asyncio" and len(sys.argv) < 3):
+        print("Uso: python seu_arquivo.py <id_do_peer> [<id_do_peer> ...]")
+        print("     python seu_arquivo.py --asyncio <id_do_peer> [<id_do_peer> ...]")
+        print("Com vários ids, todos rodam neste processo e o menu controla o primeiro.")
         sys.exit(1)
 
-    peer_id = int(sys.argv[1])
-    peer = Peer(peer_id)
-    daemon = Pyro5.api.Daemon()
-    peer.daemon = daemon
-    peer.registrar_no_servico_nomes()
+    ouvinte_log = configurar_log(os.environ.get("PEER_LOG_NIVEL", "INFO").upper(),
+                                 os.environ.get("PEER_LOG_FORMATO", "texto"))
+    if sys.argv[1] == "--asyncio":
+        try:
+            asyncio.run(executar_peers_async([int(arg) for arg in sys.argv[2:]]))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ouvinte_log.stop()
+        return
 
-    daemon_thread = threading.Thread(target=daemon.requestLoop, daemon=True)
-    daemon_thread.start()
+    peer_ids = [int(arg) for arg in sys.argv[1:]]
+    host = HostPeers()
+    peer = host.adicionar_peer(peer_ids[0], inicializar=False)
+    for outro_id in peer_ids[1:]:
+        host.adicionar_peer(outro_id)
 
     time.sleep(1)
     peer.inicializar()
@@ -306,7 +3053,8 @@ def main():
             print("1. Listar arquivos na rede")
             print("2. Baixar arquivo")
             print("3. Listar meus arquivos")
-            print("4. Sair")
+            print("4. Pesquisar arquivos por nome (trecho ou padrão, ex: *.pdf)")
+            print("5. Sair")
             
             escolha = input("> ").strip()
 
@@ -316,7 +3064,7 @@ def main():
                     if peer.is_tracker:
                         registry = peer.obter_todos_arquivos()
                     elif peer.current_tracker_uri:
-                        with Pyro5.api.Proxy(peer.current_tracker_uri) as tracker:
+                        with peer.proxies.proxy(peer.current_tracker_uri) as tracker:
                             registry = tracker.obter_todos_arquivos()
                     
                     if not registry:
@@ -335,15 +3083,17 @@ def main():
                     if peer.is_tracker:
                         peers_with_file = peer.buscar_arquivo(filename)
                     elif peer.current_tracker_uri:
-                        with Pyro5.api.Proxy(peer.current_tracker_uri) as tracker:
+                        with peer.proxies.proxy(peer.current_tracker_uri) as tracker:
                             peers_with_file = tracker.buscar_arquivo(filename)
                     
                     if not peers_with_file:
                         print("Arquivo não encontrado na rede.")
                     else:
                         print(f"Arquivo encontrado nos peers: {peers_with_file}")
-                        source_id_str = input(f"ID do peer para baixar (ex: {peers_with_file[0]}): ").strip()
-                        if source_id_str.isdigit():
+                        source_id_str = input(f"ID do peer para baixar (ex: {peers_with_file[0]}) ou 'todos': ").strip()
+                        if source_id_str.lower() == 'todos':
+                            peer.baixar_arquivo_swarm(filename, peers_with_file)
+                        elif source_id_str.isdigit():
                             source_id = int(source_id_str)
                             if source_id in peers_with_file:
                                 peer.baixar_arquivo(filename, source_id)
@@ -363,11 +3113,28 @@ def main():
                         print(f"  - {f}")
 
             elif escolha == '4':
+                termo = input("Trecho ou padrão: ").strip()
+                offset = 0
+                try:
+                    while termo:
+                        pagina = peer.pesquisar_arquivos(termo, offset)
+                        if not pagina["arquivos"] and offset == 0:
+                            print("Nenhum arquivo encontrado.")
+                        for nome, peers in pagina["arquivos"]:
+                            print(f"  {nome} (peers: {peers})")
+                        if pagina["proximo"] is None or input("Mais resultados? (s/n) ").strip().lower() != 's':
+                            break
+                        offset = pagina["proximo"]
+                except Exception as e:
+                    print(f"Erro ao pesquisar arquivos: {e}")
+
+            elif escolha == '5':
                 break
     finally:
         print("\nEncerrando...")
-        peer.stop_threads = True
-        daemon.shutdown()
+        host.encerrar()
+        peer.proxies.fechar()
+        ouvinte_log.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
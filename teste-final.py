@@ -1,10 +1,20 @@
 import sys
 import os
 import Pyro5.api
+import Pyro5.errors
 import random
 import threading
 import time
-import base64
+from concurrent.futures import ThreadPoolExecutor
+from peer import (HashCache, IndiceArquivos, HistoricoRegistro,
+                  MAX_WORKERS_HEARTBEAT, difundir_heartbeat, enviar_registro, proxies,
+                  servico_nomes, solicitar_votos, DetectorFalhas, Metricas, instrumentado, log,
+                  configurar_log, HostPeers, arquivos_mapeados, INTERVALO_REPLICACAO, ReplicacaoRegistro,
+                  limpar_registro, replicar_para_standbys, aplicar_replica,
+                  puxar_registro, registro_para, podar_registro, PersistenciaRegistro,
+                  carregar_registro, compactar_registro, coletar_registros, TIMEOUT_COLETA_PEER,
+                  DiretorioCompartilhado, atualizar_arquivos_locais, observar_diretorio,
+                  descartar_replica_antiga, Peer as PeerBase)
 
 class ElectionManager:
     def __init__(self, peer):    
@@ -28,39 +38,35 @@ class ElectionManager:
                 return
             # Incrementa a época do gerenciador de forma atômica.
             self.epoca += 1 
-            print(f"Peer {self.peer.peer_id} iniciando eleição para a ÉPOCA {self.epoca}.")
+            log.info("Peer %s iniciando eleição para a ÉPOCA %s.", self.peer.peer_id, self.epoca)
             
             self.election_in_progress = True
             self.am_candidate = True
             
             # Garante que o peer vote em si mesmo para a nova época correta.
             self.voted_in_epoch = self.epoca
-            self.votes_received = {self.peer.peer_id}
+            self.votes_received = {str(self.peer.peer_id)}
         
         # O resto do método continua a partir daqui...
         # Precisa da maioria dos votos (quórum) para ser eleito 
+        inicio = time.perf_counter()
         active_peers = self.peer.listar_peers_ativos()
         votes_needed = (len(active_peers) + 1) // 2 + 1
 
-        # Solicita votos de outros peers
-        for name, uri in active_peers:
-            try:
-                with Pyro5.api.Proxy(uri) as new_remote_peer:
-                    # Envia o pedido de voto com a NOVA época.
-                    voted = new_remote_peer.request_vote(self.peer.peer_id, self.epoca)
-                    if voted:
-                        peer_id_str = name.split('_')[-1]
-                        self.votes_received.add(peer_id_str)
-            except Exception as e:
-                print(f"Peer {self.peer.peer_id}: Falha ao pedir voto para {name}: {e}")
+        # Solicita votos de todos os peers em paralelo (com a NOVA época) e para no quórum.
+        solicitar_votos(self.peer.proxies, active_peers, self.peer.peer_id, self.epoca,
+                        self.votes_received, votes_needed, prazo=1.0)
         
         # Verifica se recebeu votos suficientes
         with self.peer.lock:
-            if len(self.votes_received) >= votes_needed:
-                print(f"Peer {self.peer.peer_id} ganhou a eleição para a época {self.epoca} com votos de: {self.votes_received}")
+            venceu = len(self.votes_received) >= votes_needed
+            self.peer.metricas.registrar_eleicao(self.epoca, time.perf_counter() - inicio, len(self.votes_received),
+                                                 votes_needed, venceu)
+            if venceu:
+                log.info("Peer %s ganhou a eleição para a época %s com votos de: %s", self.peer.peer_id, self.epoca, self.votes_received)
                 self.peer.become_tracker()
             else:
-                print(f"Peer {self.peer.peer_id} perdeu a eleição para a época {self.epoca}. Votos recebidos: {self.votes_received}")
+                log.info("Peer %s perdeu a eleição para a época %s. Votos recebidos: %s", self.peer.peer_id, self.epoca, self.votes_received)
             
             self.election_in_progress = False
             self.am_candidate = False
@@ -76,13 +82,13 @@ class ElectionManager:
                 self.voted_in_epoch = -1 # Reseta o voto para a nova época.
             if epoca == self.epoca and self.voted_in_epoch < epoca:
                 self.voted_in_epoch = epoca # Marca que já votou nesta época.
-                print(f"Peer {self.peer.peer_id}: Votou em {candidate_id} para a época {epoca}.")
+                log.debug("Peer %s: Votou em %s para a época %s.", self.peer.peer_id, candidate_id, epoca)
                 return True
             
-            print(f"Peer {self.peer.peer_id}: Voto negado para {candidate_id} (época: {epoca}, já votou ou época inválida).")
+            log.debug("Peer %s: Voto negado para %s (época: %s, já votou ou época inválida).", self.peer.peer_id, candidate_id, epoca)
             return False
         
-        print(f"Peer {self.peer.peer_id}: Voto negado para {candidate_id} (época: {epoca}, já votou na época: {self.voted_in_epoch}).")
+        log.debug("Peer %s: Voto negado para %s (época: %s, já votou na época: %s).", self.peer.peer_id, candidate_id, epoca, self.voted_in_epoch)
         return False    
     @Pyro5.api.expose
     def set_epoca(self, epoca):
@@ -90,20 +96,36 @@ class ElectionManager:
         Define a época atual do ElectionManager.
         """
         self.epoca = epoca
-        print(f"Peer {self.peer.peer_id}: Época atual definida para {self.epoca}.")
+        log.debug("Peer %s: Época atual definida para %s.", self.peer.peer_id, self.epoca)
 class Peer:
     def __init__(self, peer_id):
-        self.daemon = Pyro5.api.Daemon()
+        self.daemon = None
         self.peer_id = peer_id
         self.other_peers = {}
         self.election_manager = ElectionManager(self)
+        self.proxies = proxies
+        self.nomes = servico_nomes
+        self.arquivos_mapeados = arquivos_mapeados
         self.file_registry = {}
+        self.file_digests = {}
+        self.file_index = IndiceArquivos()
+        self.registry_versions = {}
+        self.registry_lock = threading.Lock()
+        self.historico = HistoricoRegistro()
+        self.replicacao = ReplicacaoRegistro()
+        self.replica = None
         self.files = []
+        self.digests = {}
         self.shared_dir = f"peer_{self.peer_id}_shared"
+        self.hash_cache = HashCache(f"{self.shared_dir}.hashes.json")
+        self.diretorio = DiretorioCompartilhado(self.shared_dir)
+        self.arquivos_lock = threading.Lock()
+        self.persistencia = PersistenciaRegistro(f"{self.shared_dir}.registro")
+        self.metricas = Metricas()
         self.configurar_diretorio_compartilhado()
         self.is_tracker = False
-        self.last_heartbeat = time.time()
         self.heartbeat_timeout = random.uniform(0.8, 1.5)
+        self.detector = DetectorFalhas(self.heartbeat_timeout)
         self.heartbeat_lock = threading.Lock()
         self.lock = threading.Lock()
         self.stop_threads = False
@@ -112,25 +134,24 @@ class Peer:
     @Pyro5.api.expose
     def configurar_diretorio_compartilhado(self):
         os.makedirs(self.shared_dir, exist_ok=True)
-        print(f"Peer {self.peer_id}: Created shared directory: {self.shared_dir}")  
+        log.info("Peer %s: Created shared directory: %s", self.peer_id, self.shared_dir)  
          
     def registrar_no_servico_nomes(self):
      try:
-        with Pyro5.api.locate_ns() as ns:
-            try:
-                ns.remove(self.get_uri_name())
-            except Exception:
-                pass
-            if not hasattr(self, '_pyroId'):
-                uri = self.daemon.register(self)
-            else:
-                uri = self.daemon.uriFor(self)
-                
-            ns.register(self.get_uri_name(), uri)
-            print(f"Peer {self.peer_id}: Registrado no serviço de nomes como {self.get_uri_name()}")
-            return True
+        try:
+            self.nomes.remover(self.get_uri_name())
+        except Exception:
+            pass
+        if not hasattr(self, '_pyroId'):
+            uri = self.daemon.register(self)
+        else:
+            uri = self.daemon.uriFor(self)
+            
+        self.nomes.registrar(self.get_uri_name(), uri)
+        log.info("Peer %s: Registrado no serviço de nomes como %s", self.peer_id, self.get_uri_name())
+        return True
      except Exception as e:
-        print(f"Peer {self.peer_id}: Erro ao registrar no Nameserver: {e}")
+        log.error("Peer %s: Erro ao registrar no Nameserver: %s", self.peer_id, e)
         return False
     
     def get_uri_name(self):
@@ -142,27 +163,35 @@ class Peer:
     def listar_peers_ativos(self):
         peers = []
         try:
-            with Pyro5.api.locate_ns() as ns:
-                for name, uri in ns.list(prefix="Peer_").items():
-                    if name != self.get_uri_name():
-                        peers.append((name, uri))
+            # Lista em cache (TTL): o loop de heartbeat não consulta o serviço de nomes a cada rodada.
+            for name, uri in self.nomes.listar("Peer_").items():
+                if name != self.get_uri_name():
+                    peers.append((name, uri))
         except Exception:
             pass
         return peers
     
     def atualizar_lista_arquivos_local(self):
-        self.files = os.listdir(self.shared_dir)
+        """
+        Varre o diretório compartilhado por inteiro. Depois da primeira vez, as alterações
+        chegam pelo observador (observar_diretorio) e só os arquivos alterados são lidos.
+        """
+        # Cada alteração gera uma nova versão do registro, enviada ao tracker como delta.
+        # O cache só recalcula o hash de arquivos com tamanho ou mtime alterado.
+        alterados, removidos = self.diretorio.varrer()
+        atualizar_arquivos_locais(self, alterados, removidos)
+        self.hash_cache.podar(os.path.join(self.shared_dir, f) for f in self.digests)
+        self.hash_cache.salvar()
     #funcoes do tracker 
 
     def become_tracker(self):
         """
-        Torna este peer o tracker e limpa registros antigos.
+        Torna este peer o tracker, com o registro replicado (se era standby) ou vazio.
         """
         try:
-           with Pyro5.api.locate_ns() as ns:
             self.is_tracker = True
-            self.file_registry = {}
             self.epoca = self.election_manager.epoca 
+            self.assumir_registro()
             tracker_name = f"Tracker_Epoca_{self.epoca}" 
             
             if not hasattr(self, '_pyroId'):
@@ -170,69 +199,116 @@ class Peer:
             else:
              uri = self.daemon.uriFor(self)
              
-            with Pyro5.api.locate_ns() as ns:
-              # --- LÓGICA DE LIMPEZA ---
-              # Remove registros de trackers de épocas anteriores.
-              for name, u in ns.list(prefix="Tracker_Epoca_").items():
-                  try:
-                      old_epoca = int(name.split('_')[-1])
-                      if old_epoca < self.epoca:
-                          ns.remove(name)
-                  except Exception:
-                      pass
-              
-              ns.register(tracker_name, uri)
-              self.current_tracker_uri = uri
+            # --- LÓGICA DE LIMPEZA ---
+            # Remove registros de trackers de épocas anteriores.
+            for name in self.nomes.listar("Tracker_Epoca_", atualizar=True):
+                try:
+                    old_epoca = int(name.split('_')[-1])
+                    if old_epoca < self.epoca:
+                        self.nomes.remover(name)
+                except Exception:
+                    pass
+            
+            self.nomes.registrar(tracker_name, uri)
+            self.current_tracker_uri = uri
 
-            print(f"Peer {self.peer_id}: AGORA SOU O TRACKER para a Época {self.epoca}.")
-            self.file_registry[self.peer_id] = self.files.copy() 
+            log.info("Peer %s: AGORA SOU O TRACKER para a Época %s.", self.peer_id, self.epoca)
+            enviar_registro(self, self.peer_id, self.historico, self.epoca, self.files, self.digests)
             
             threading.Thread(target=self.loop_heartbeat, daemon=True).start()
+            threading.Thread(target=self.loop_replicacao, daemon=True).start()
             threading.Thread(target=self.solicitar_todos_arquivos, daemon=True).start()
         except Exception as e:
-            print(f"Peer {self.peer_id}: Erro ao se tornar tracker: {e}")
+            log.error("Peer %s: Erro ao se tornar tracker: %s", self.peer_id, e)
             self.is_tracker = False
+
+    def assumir_registro(self):
+        """
+        Mantém o registro replicado se este peer era standby do tracker anterior; sem
+        réplica, carrega o registro salvo em disco (instantâneo + log), se houver. Só a
+        diferença para o estado atual dos peers é reconciliada depois.
+        """
+        with self.registry_lock:
+            if self.replica is None:
+                limpar_registro(self)
+                epoca = carregar_registro(self)
+                if epoca is not None:
+                    log.info("Tracker (Peer %s): Assumindo com o registro salvo em disco na época %s (%s peers).",
+                             self.peer_id, epoca, len(self.file_registry))
+                    self.metricas.contar("assumiu_com_disco")
+            else:
+                log.info("Tracker (Peer %s): Assumindo com o registro replicado da época %s (%s peers).",
+                         self.peer_id, self.replica[0], len(self.file_registry))
+                self.metricas.contar("assumiu_com_replica")
+            self.replica = None
+            self.replicacao.reiniciar()
+        # O instantâneo da nova época fica para o loop de replicação, já com o tracker registrado.
+        self.persistencia.pedir_compactacao()
+        self.detector.priorizar(1.0)
+
+    def loop_replicacao(self):
+        """
+        Replica cada alteração do registro para os peers em espera (hot standby) e
+        compacta o log do registro em disco quando ele passa do limite.
+        """
+        while self.is_tracker and not self.stop_threads:
+            replicar_para_standbys(self)
+            if self.persistencia.precisa_compactar():
+                compactar_registro(self)
+            self.replicacao.evento.wait(INTERVALO_REPLICACAO)
             
+    def _enviar_heartbeat(self, peer_uri):
+        with self.proxies.proxy(peer_uri, 0.5) as peer:
+            return peer.receber_heartbeat(self.epoca, str(self.current_tracker_uri))
+
     def loop_heartbeat(self):
-        while self.is_tracker:
-            try:
-                active_peers = self.listar_peers_ativos()
-                for peer_uri in active_peers:
-                    try:
-                        peer = Pyro5.api.Proxy(peer_uri)
-                        peer._pyroTimeout = 0.5
-                        peer.receber_heartbeat(self.epoca,self.peer_id)
-                    except Exception:
-                        pass                
-                time.sleep(0.1) 
-            except Exception as e:
-                print(f"Tracker {self.peer_id}: Erro no loop de heartbeat: {e}")
-                break  
+        """
+        Envia heartbeats a todos os peers em paralelo. A rodada dura o tempo do peer
+        mais lento que responder, limitado ao timeout de 0.5s, e não a soma de todos.
+        """
+        pendentes = {}
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS_HEARTBEAT) as pool:
+            while self.is_tracker:
+                try:
+                    inicio = time.time()
+                    destinos = [str(uri) for _, uri in self.listar_peers_ativos()]
+                    difundir_heartbeat(pool, pendentes, destinos, self._enviar_heartbeat, prazo=0.5)
+                    time.sleep(max(0.0, 0.1 - (time.time() - inicio)))
+                except Exception as e:
+                    log.error("Tracker %s: Erro no loop de heartbeat: %s", self.peer_id, e)
+                    break  
     @Pyro5.api.expose
     def solicitar_todos_arquivos(self):
+        """
+        Reconstrói o registro pedindo a lista de cada peer em paralelo, com prazo por peer;
+        quem não responder é tentado de novo em segundo plano (ver coletar_registros).
+        """
         if not self.is_tracker:
             return
 
-        print(f"Tracker (Peer {self.peer_id}): Puxando listas de arquivos dos outros peers...")
-        time.sleep(1) 
-        
+        log.info("Tracker (Peer %s): Puxando listas de arquivos dos outros peers...", self.peer_id)
         active_peers = self.listar_peers_ativos()
-        for peer_name, peer_uri in active_peers:
-            try:
-                with Pyro5.api.Proxy(peer_uri) as remote_peer:
-                    peer_id_str = peer_name.split('_')[-1]
-                    peer_id = int(peer_id_str)
-                    files = remote_peer.get_lista_arquivos() 
-                    # O Tracker atualiza seu próprio registro com os dados recebidos
-                    self.atualizar_registro_arquivos(peer_id, files)
-            except Exception as e:
-                print(f"Tracker (Peer {self.peer_id}): Falha ao solicitar arquivos de {peer_name}. Erro: {e}")
-                
+        # Peers que saíram do serviço de nomes não ficam no registro herdado do standby.
+        podar_registro(self, {int(name.split('_')[-1]) for name, _ in active_peers})
+        coletar_registros(self, active_peers, self._puxar_registro)
+
+    def _puxar_registro(self, peer_name, peer_uri):
+        try:
+            with self.proxies.proxy(peer_uri, TIMEOUT_COLETA_PEER) as remote_peer:
+                peer_id = int(peer_name.split('_')[-1])
+                # Com registro replicado, o peer responde só o que mudou desde a versão conhecida.
+                puxar_registro(self, peer_id, remote_peer, self.epoca)
+            return True
+        except Exception as e:
+            log.warning("Tracker (Peer %s): Falha ao solicitar arquivos de %s. Erro: %s", self.peer_id, peer_name, e)
+            return False
+
     @Pyro5.api.expose        
     def iniciar_eleicao(self):
         self.election_manager.inicia_election(self.epoca)
         return self.is_tracker      
     @Pyro5.api.expose
+    @instrumentado("request_vote")
     def request_vote(self, candidate_id, epoca):
      return self.election_manager.request_vote(candidate_id, epoca)
  
@@ -242,31 +318,34 @@ class Peer:
         Recebe a notificação de um novo tracker eleito e se registra com ele.
         """
         if epoca >= self.epoca:
-            print(f"Peer {self.peer_id}: Notificado sobre o novo tracker (Época {epoca}). Registrando arquivos.")
+            log.info("Peer %s: Notificado sobre o novo tracker (Época %s). Registrando arquivos.", self.peer_id, epoca)
             self.epoca = epoca
             self.election_manager.set_epoca(epoca)
             self.current_tracker_uri = tracker_uri
             self.is_tracker = False
-            self.last_heartbeat = time.time() # Reseta o timer de timeout!
+            self.detector.rearmar() # Reseta o timer de timeout!
             self.notificar_arquivos_tracker() 
                 
+    atualizar_registro_arquivos = PeerBase.atualizar_registro_arquivos
+    aplicar_delta_registro = PeerBase.aplicar_delta_registro
+
     @Pyro5.api.expose
-    def atualizar_registro_arquivos(self, peer_id, files):
-        if self.is_tracker:
-            self.file_registry[peer_id] = files
-            return True
-        return 
+    @instrumentado("replicar_registro")
+    def replicar_registro(self, epoca, seq_base, seq, operacoes):
+        """
+        Recebe do tracker as alterações do registro; este peer passa a ser um standby.
+        """
+        return aplicar_replica(self, epoca, seq_base, seq, operacoes)
     @Pyro5.api.expose
     def notificar_arquivos_tracker(self):
         try:
          if self.current_tracker_uri:
-            tracker = Pyro5.api.Proxy(self.current_tracker_uri)
-            tracker._pyroTimeout = 2.0
-            tracker.atualizar_registro_arquivos(self.peer_id, self.files)
-            self.last_heartbeat = time.time()
-            print(f"Peer {self.peer_id}: Arquivos registrados com o tracker.")
+            with self.proxies.proxy(self.current_tracker_uri, 2.0) as tracker:
+                enviar_registro(tracker, self.peer_id, self.historico, self.epoca, self.files, self.digests)
+            self.detector.rearmar()
+            log.debug("Peer %s: Arquivos registrados com o tracker.", self.peer_id)
         except Exception as e:
-         print(f"Peer {self.peer_id}: Falha ao registrar arquivos com o tracker: {e}")
+         log.warning("Peer %s: Falha ao registrar arquivos com o tracker: %s", self.peer_id, e)
 
     def buscar_tracker(self):
         """
@@ -274,161 +353,150 @@ class Peer:
         que sempre siga o líder mais recente e legítimo.
         """
         try:
-            with Pyro5.api.locate_ns() as ns:
-
-                all_trackers = {name: uri for name, uri in ns.list(prefix="Tracker_Epoca_").items()}
+            # Ignora o cache: o tracker mais recente pode ter sido eleito há instantes.
+            all_trackers = self.nomes.listar("Tracker_Epoca_", atualizar=True)
             
-                if not all_trackers:
-                    return False
+            if not all_trackers:
+                return False
 
-                latest_epoca = -1
-                latest_tracker_uri = None
+            latest_epoca = -1
+            latest_tracker_uri = None
             
-                for name, uri in all_trackers.items():
-                    try:
-                        epoca = int(name.split('_')[-1])
-                        if epoca > latest_epoca:
-                            latest_epoca = epoca
-                            latest_tracker_uri = str(uri)
-                    except (ValueError, IndexError):
-                        continue
-                
-                if latest_tracker_uri and latest_epoca >= self.epoca:
-                    self.current_tracker_uri = latest_tracker_uri
-                    # Sincroniza a época no Peer e no seu ElectionManager
-                    self.epoca = latest_epoca
-                    self.election_manager.set_epoca(latest_epoca)
-                    print(f"Peer {self.peer_id}: Tracker MAIS RECENTE encontrado: Tracker_Epoca_{latest_epoca}")
-                    self.last_heartbeat = time.time() # Reinicia o temporizador!
-                    return True
+            for name, uri in all_trackers.items():
+                try:
+                    epoca = int(name.split('_')[-1])
+                    if epoca > latest_epoca:
+                        latest_epoca = epoca
+                        latest_tracker_uri = str(uri)
+                except (ValueError, IndexError):
+                    continue
+            
+            if latest_tracker_uri and latest_epoca >= self.epoca:
+                self.current_tracker_uri = latest_tracker_uri
+                # Sincroniza a época no Peer e no seu ElectionManager
+                self.epoca = latest_epoca
+                self.election_manager.set_epoca(latest_epoca)
+                log.info("Peer %s: Tracker MAIS RECENTE encontrado: Tracker_Epoca_%s", self.peer_id, latest_epoca)
+                self.detector.rearmar() # Reinicia o temporizador!
+                return True
         except Exception as e:
-            print(f"Peer {self.peer_id}: Erro ao buscar tracker: {e}")
+            log.error("Peer %s: Erro ao buscar tracker: %s", self.peer_id, e)
         return False
     
         """recebe heartbeat do tracker"""
     @Pyro5.api.expose
+    @instrumentado("receber_heartbeat")
     def receber_heartbeat(self, epoca, tracker_uri):
         with self.heartbeat_lock:
             if epoca >= self.epoca:
-                self.last_heartbeat = time.time()
+                self.detector.heartbeat()
+                descartar_replica_antiga(self, epoca)
                 self.epoca = epoca
                 self.current_tracker_uri = tracker_uri
-                print(f"Peer {self.peer_id}: Heartbeat recebido do tracker (Época {epoca})")
                 return True
             return False
+    def _monitorando_tracker(self):
+        return not self.stop_threads and not self.is_tracker and self.current_tracker_uri is not None
+
     @Pyro5.api.expose
     def monitorar_tracker(self):
+        """
+        Dorme até o prazo do detector expirar (cada heartbeat recebido rearma o prazo),
+        em vez de verificar o tempo desde o último heartbeat em intervalos fixos.
+        """
         while not self.stop_threads:
             try:
-                if not self.is_tracker and self.current_tracker_uri:
-                    current_time = time.time()
-                    tempo_desde_ultimo_heartbeat = current_time - self.last_heartbeat
-                    print(f"Peer {self.peer_id}: Tempo desde último heartbeat: {tempo_desde_ultimo_heartbeat:.3f}s")
-
-                    if tempo_desde_ultimo_heartbeat > self.heartbeat_timeout:
-                        print(f"Peer {self.peer_id}: Timeout de eleição atingido (> {self.heartbeat_timeout:.3f}s). Iniciando nova eleição.")
-                        if self.iniciar_eleicao():
-                            print(f"Peer {self.peer_id}: Venci a eleição e me tornei o tracker. Saindo do modo de monitoramento.")
-                            break
-                        else:
-                            print(f"Peer {self.peer_id}: Eleição não vencida. Buscando o novo tracker...")
-                            time.sleep(random.uniform(0.2, 0.5)) 
-                            if self.buscar_tracker():
-                                print(f"Peer {self.peer_id}: Novo tracker encontrado ({self.current_tracker_uri}). Estado sincronizado.")
-                                self.last_heartbeat = time.time()
-                            else:
-                                print(f"Peer {self.peer_id}: Nenhum tracker encontrado. Reiniciando timeout.")
-                                self.last_heartbeat = time.time()
-                                self.heartbeat_timeout = random.uniform(0.150, 0.300)
-                time.sleep(0.05)
+                if not self.detector.aguardar_expiracao(self._monitorando_tracker):
+                    break
+                log.warning("Peer %s: Timeout de eleição atingido (> %.3fs). Iniciando nova eleição.", self.peer_id, self.detector.timeout())
+                self.nomes.invalidar()
+                if self.iniciar_eleicao():
+                    log.info("Peer %s: Venci a eleição e me tornei o tracker. Saindo do modo de monitoramento.", self.peer_id)
+                    break
+                else:
+                    log.info("Peer %s: Eleição não vencida. Buscando o novo tracker...", self.peer_id)
+                    time.sleep(random.uniform(0.2, 0.5)) 
+                    if self.buscar_tracker():
+                        log.info("Peer %s: Novo tracker encontrado (%s). Estado sincronizado.", self.peer_id, self.current_tracker_uri)
+                    else:
+                        log.warning("Peer %s: Nenhum tracker encontrado. Reiniciando timeout.", self.peer_id)
+                        self.detector.rearmar(random.uniform(0.150, 0.300))
             except Exception as e:
-                print(f"Peer {self.peer_id}: Erro no monitoramento: {e}")
+                log.error("Peer %s: Erro no monitoramento: %s", self.peer_id, e)
                 time.sleep(1)
     
     @Pyro5.api.expose
     def get_lista_arquivos(self):
-        """ Retorna a lista de arquivos que este peer está compartilhando. """
-        self.atualizar_lista_arquivos_local() 
+        """ Retorna a lista de arquivos que este peer está compartilhando (mantida pelo observador). """
         return self.files           
+    get_digests = PeerBase.get_digests
+    @Pyro5.api.expose
+    def get_registro_completo(self, epoca=None, versao=None):
+        """
+        Retorna a lista completa de arquivos com a versão atual do registro ou, se o tracker
+        informar a versão que já conhece, só as alterações desde ela.
+        """
+        return registro_para(self.historico, epoca, versao, self.files, self.digests)
     @Pyro5.api.expose
     def obter_todos_arquivos(self):
         if self.is_tracker:
-            return self.file_registry
+            with self.registry_lock:
+                return {pid: sorted(files) for pid, files in self.file_registry.items()}
         return {}
                 
-    @Pyro5.api.expose
-    def buscar_arquivo(self, filename):
-        if self.is_tracker:
-            peers_with_file = [pid for pid, flist in self.file_registry.items() if filename in flist]
-            return peers_with_file
-        return []
-    @Pyro5.api.expose
-    def enviar_arquivo(self, filename):
-        try:
-            filepath = os.path.join(self.shared_dir, filename)
-            if not os.path.exists(filepath):
-                print(f"Arquivo não encontrado: {filepath}")
-                return None    
-            with open(filepath, 'rb') as f:
-                content = f.read()
-                encoded_content = base64.b64encode(content)
-                return encoded_content.decode('utf-8')
-        except Exception as e:
-            print(f"Falha ao enviar arquivo: {e}")
-            return None
+    buscar_arquivo = PeerBase.buscar_arquivo
+    # Busca paginada no índice do tracker: mesma implementação do peer.py.
+    buscar_por_prefixo = PeerBase.buscar_por_prefixo
+    buscar_por_trecho = PeerBase.buscar_por_trecho
+    buscar_por_padrao = PeerBase.buscar_por_padrao
+    # Digests e download verificado peça a peça: mesma implementação do peer.py.
+    buscar_digest = PeerBase.buscar_digest
+    obter_digest = PeerBase.obter_digest
+    info_arquivo = PeerBase.info_arquivo
 
-    def baixar_arquivo(self, filename, source_peer_id):
-        try:
-            with Pyro5.api.locate_ns() as ns:
-                source_uri = ns.lookup(f"Peer_{source_peer_id}")
-                source_peer = Pyro5.api.Proxy(source_uri)
-                source_peer._pyroTimeout = 5.0
-                
-                encoded_content = source_peer.enviar_arquivo(filename)
-                if not encoded_content:
-                    print(f"Conteúdo do arquivo está vazio ou nulo para {filename}")
-                    return False
-                file_content = base64.b64decode(encoded_content)
-                filepath = os.path.join(self.shared_dir, filename)
-                
-                with open(filepath, 'wb') as f:
-                    f.write(file_content)
-                self.atualizar_lista_arquivos_local()
-                self.notificar_arquivos_tracker()
-                print(f"Arquivo {filename} baixado com sucesso do peer {source_peer_id}")
-                return True
-        except Exception as e:
-            print(f"Falha ao baixar arquivo: {e}")
-            return False
+    # Envio de blocos, streaming e canal de dados: mesma implementação do peer.py.
+    _caminho_compartilhado = PeerBase._caminho_compartilhado
+    enviar_bloco = PeerBase.enviar_bloco
+    enviar_arquivo = PeerBase.enviar_arquivo
+    reservar_envio = PeerBase.reservar_envio
+
+    _registrar_download = PeerBase._registrar_download
+    baixar_arquivo = PeerBase.baixar_arquivo
         
+    # Métricas: mesma implementação do peer.py.
+    _medidores = PeerBase._medidores
+    get_metrics = PeerBase.get_metrics
+    get_metrics_prometheus = PeerBase.get_metrics_prometheus
+
     def inicializar(self):
      self.other_peers = {name: uri for name, uri in self.listar_peers_ativos()}
      self.atualizar_lista_arquivos_local()
 
       # Se for o Peer 1, automaticamente se torna tracker
      if self.peer_id == 1 and not self.buscar_tracker():
-        print(f"Peer {self.peer_id}: Nenhum tracker encontrado. Atuando como tracker inicial.")
+        log.info("Peer %s: Nenhum tracker encontrado. Atuando como tracker inicial.", self.peer_id)
         self.become_tracker()
      else:
         self.buscar_tracker()
 
      threading.Thread(target=self.monitorar_tracker, daemon=True).start()
+     threading.Thread(target=observar_diretorio, args=(self,), daemon=True).start()
    
 def main():
     if len(sys.argv) < 2:
-        print("Uso: python peer.py <peer_id>")
+        print("Uso: python peer.py <peer_id> [<peer_id> ...]")
         print("Exemplo: python peer.py 1")
+        print("Com vários ids, todos rodam neste processo com um único daemon e o menu controla o primeiro.")
         sys.exit(1)
     
     global peer_id, peer
     peer_id = int(sys.argv[1])
-    peer = Peer(peer_id)
-    daemon = Pyro5.api.Daemon()
-    peer.daemon = daemon
-    peer.registrar_no_servico_nomes()
-
-    daemon_thread = threading.Thread(target=daemon.requestLoop, daemon=True)
-    daemon_thread.start()
+    ouvinte_log = configurar_log(os.environ.get("PEER_LOG_NIVEL", "INFO").upper(),
+                                 os.environ.get("PEER_LOG_FORMATO", "texto"))
+    host = HostPeers(Peer)
+    peer = host.adicionar_peer(peer_id, inicializar=False)
+    for outro_id in sys.argv[2:]:
+        host.adicionar_peer(int(outro_id))
 
     time.sleep(1)
     peer.inicializar()
@@ -459,8 +527,8 @@ def main():
                 
                 else:
                     try:
-                        tracker = Pyro5.api.Proxy(peer.current_tracker_uri)
-                        registry = tracker.obter_todos_arquivos()
+                        with peer.proxies.proxy(peer.current_tracker_uri) as tracker:
+                            registry = tracker.obter_todos_arquivos()
                         if registry:
                             print("\nRegistro de arquivos na rede:")
                             for peer_id, files in registry.items():
@@ -480,8 +548,8 @@ def main():
                     if peer.is_tracker:
                         peers_with_file = peer.buscar_arquivo(filename)
                     else:
-                        tracker = Pyro5.api.Proxy(peer.current_tracker_uri)
-                        peers_with_file = tracker.buscar_arquivo(filename)
+                        with peer.proxies.proxy(peer.current_tracker_uri) as tracker:
+                            peers_with_file = tracker.buscar_arquivo(filename)
 
                     if peers_with_file:
                         print(f"Arquivo encontrado nos peers: {peers_with_file}")
@@ -516,8 +584,9 @@ def main():
     except KeyboardInterrupt:
         print("\nEncerrando peer...")
     finally:
-        peer.stop_threads = True
-        peer.daemon.shutdown()
+        host.encerrar()
+        peer.proxies.fechar()
+        ouvinte_log.stop()
         print("Peer encerrado.")
     
 if __name__ == "__main__":